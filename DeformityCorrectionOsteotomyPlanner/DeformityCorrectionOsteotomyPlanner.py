@@ -1,6 +1,13 @@
 import os
 import unittest
 import logging
+import time
+import threading
+import functools
+import bisect
+import contextlib
+import collections
+import concurrent.futures
 import vtk, qt, ctk, slicer
 import numpy as np
 from slicer.ScriptedLoadableModule import *
@@ -83,6 +90,22 @@ def registerSampleData():
     nodeNames='DeformityCorrectionOsteotomyPlanner2'
   )
 
+#
+# timedStage
+#
+
+def timedStage(function):
+  """Records each call of the logic method as a stage of the logic's stageTimingRecorder when stage timings are enabled."""
+  @functools.wraps(function)
+  def wrapper(self,*args,**kwargs):
+    #The flags of the recorder follow the parameter node, see observeStageTimingsParameters
+    stageTimingRecorder = self.stageTimingRecorder
+    if not stageTimingRecorder.enabled:
+      return function(self,*args,**kwargs)
+    with stageTimingRecorder.stage(function.__name__,self.getNumberOfCellsOfBoneModelForPlaneCuts()):
+      return function(self,*args,**kwargs)
+  return wrapper
+
 #
 # DeformityCorrectionOsteotomyPlannerWidget
 #
@@ -131,7 +154,7 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
 
     # These connections ensure that whenever user changes some settings on the GUI, that is saved in the MRML scene
     # (in the selected parameter node).
-    self.ui.boneCurveSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
+    self.ui.boneCurveSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.onBoneCurveChanged)
     self.ui.boneModelSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.onBoneModelChanged)
     self.ui.boneFiducialListSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
     self.ui.boneSurgicalGuideBaseSelector.connect("currentNodeChanged(vtkMRMLNode*)", self.updateParameterNodeFromGUI)
@@ -140,8 +163,21 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
     self.ui.originToCurveCheckBox.connect('stateChanged(int)', self.onOriginToCurveCheckBox)
     self.ui.originToCenterCheckBox.connect('stateChanged(int)', self.onOriginToCenterCheckBox)
     self.ui.checkSecurityMarginOnMiterBoxCreationCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.areaWeightedSectionCentroidsCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.accelerateAutomaticPositioningCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.warmStartAutomaticPositioningCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.parallelPlaneCutsCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.sharedPointsBoneSegmentsCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.boneModelProxyDuringInteractionCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.batchedBooleanOperationsCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.areaWeightedNormalsForScrewAxesCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.recordStageTimingsCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
+    self.ui.profileStagesCheckBox.connect('stateChanged(int)', self.updateParameterNodeFromGUI)
 
     self.ui.multiplierOfMaxRadiusSpinBox.valueChanged.connect(self.updateParameterNodeFromGUI)
+    self.ui.positioningToleranceSpinBox.valueChanged.connect(self.updateParameterNodeFromGUI)
+    self.ui.positioningMaximumNumberOfIterationsSpinBox.valueChanged.connect(self.updateParameterNodeFromGUI)
+    self.ui.cutResultsCacheMemoryBudgetSpinBox.valueChanged.connect(self.updateParameterNodeFromGUI)
     self.ui.miterBoxSlotWidthSpinBox.valueChanged.connect(self.updateParameterNodeFromGUI)
     self.ui.miterBoxSlotLengthSpinBox.valueChanged.connect(self.updateParameterNodeFromGUI)
     self.ui.miterBoxSlotHeightSpinBox.valueChanged.connect(self.updateParameterNodeFromGUI)
@@ -157,10 +193,14 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
     self.ui.addCutPlaneButton.connect('clicked(bool)',self.onAddCutPlaneButton)
     self.ui.centerBoneCutPlanesButton.connect('clicked(bool)',self.onCenterBoneCutPlanesButton)
     self.ui.automaticNormalAndOriginDefinitionOfBoneCutPlanesButton.connect('clicked(bool)',self.onAutomaticNormalAndOriginDefinitionOfBoneCutPlanesButton)
+    self.ui.updateBonePiecesAtFullResolutionButton.connect('clicked(bool)',self.onUpdateBonePiecesAtFullResolutionButton)
     self.ui.createMiterBoxesFromBoneCutPlanesButton.connect('clicked(bool)',self.onCreateMiterBoxesFromBoneCutPlanesButton)
     self.ui.createBoneCylindersFiducialListButton.connect('clicked(bool)',self.onCreateBoneCylindersFiducialListButton)
     self.ui.createCylindersFromFiducialListAndBoneSurgicalGuideBaseButton.connect('clicked(bool)',self.onCreateCylindersFromFiducialListAndBoneSurgicalGuideBaseButton)
     self.ui.makeBooleanOperationsToBoneSurgicalGuideBaseButton.connect('clicked(bool)',self.onMakeBooleanOperationsToBoneSurgicalGuideBaseButton)
+    self.ui.exportStageTimingsButton.connect('clicked(bool)',self.onExportStageTimingsButton)
+    self.ui.undoPlanningStateButton.connect('clicked(bool)',self.onUndoPlanningStateButton)
+    self.ui.redoPlanningStateButton.connect('clicked(bool)',self.onRedoPlanningStateButton)
 
     # Make sure parameter node is initialized (needed for module reload)
     self.initializeParameterNode()
@@ -170,6 +210,8 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
     Called when the application closes and the module widget is destroyed.
     """
     self.removeObservers()
+    if self.logic:
+      self.logic.cleanup()
 
   def enter(self):
     """
@@ -265,6 +307,12 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
     
     if self._parameterNode.GetParameter("multiplierOfMaxRadius") != '':
       self.ui.multiplierOfMaxRadiusSpinBox.setValue(float(self._parameterNode.GetParameter("multiplierOfMaxRadius")))
+    if self._parameterNode.GetParameter("positioningTolerance") != '':
+      self.ui.positioningToleranceSpinBox.setValue(float(self._parameterNode.GetParameter("positioningTolerance")))
+    if self._parameterNode.GetParameter("positioningMaximumNumberOfIterations") != '':
+      self.ui.positioningMaximumNumberOfIterationsSpinBox.setValue(int(float(self._parameterNode.GetParameter("positioningMaximumNumberOfIterations"))))
+    if self._parameterNode.GetParameter("cutResultsCacheMemoryBudget") != '':
+      self.ui.cutResultsCacheMemoryBudgetSpinBox.setValue(int(float(self._parameterNode.GetParameter("cutResultsCacheMemoryBudget"))))
     if self._parameterNode.GetParameter("securityMarginOfBonePieces") != '':
       self.ui.securityMarginOfBonePiecesSpinBox.setValue(float(self._parameterNode.GetParameter("securityMarginOfBonePieces")))
     if self._parameterNode.GetParameter("miterBoxSlotWidth") != '':
@@ -283,6 +331,16 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
     self.ui.normalAsTangentOfCurveCheckBox.checked = self._parameterNode.GetParameter("normalAsTangentOfCurve") == "True"
     self.ui.originToCurveCheckBox.checked = self._parameterNode.GetParameter("originToCurve") == "True"
     self.ui.checkSecurityMarginOnMiterBoxCreationCheckBox.checked = self._parameterNode.GetParameter("checkSecurityMarginOnMiterBoxCreation") != "False"
+    self.ui.areaWeightedSectionCentroidsCheckBox.checked = self._parameterNode.GetParameter("useAreaWeightedSectionCentroids") == "True"
+    self.ui.accelerateAutomaticPositioningCheckBox.checked = self._parameterNode.GetParameter("accelerateAutomaticPositioning") == "True"
+    self.ui.warmStartAutomaticPositioningCheckBox.checked = self._parameterNode.GetParameter("warmStartAutomaticPositioning") == "True"
+    self.ui.parallelPlaneCutsCheckBox.checked = self._parameterNode.GetParameter("useParallelPlaneCuts") == "True"
+    self.ui.sharedPointsBoneSegmentsCheckBox.checked = self._parameterNode.GetParameter("useSharedPointsBoneSegments") == "True"
+    self.ui.boneModelProxyDuringInteractionCheckBox.checked = self._parameterNode.GetParameter("useBoneModelProxyDuringInteraction") == "True"
+    self.ui.batchedBooleanOperationsCheckBox.checked = self._parameterNode.GetParameter("useBatchedBooleanOperations") == "True"
+    self.ui.areaWeightedNormalsForScrewAxesCheckBox.checked = self._parameterNode.GetParameter("useAreaWeightedNormalsForScrewAxes") == "True"
+    self.ui.recordStageTimingsCheckBox.checked = self._parameterNode.GetParameter("recordStageTimings") == "True"
+    self.ui.profileStagesCheckBox.checked = self._parameterNode.GetParameter("profileStages") == "True"
 
     # All the GUI updates are done
     self._updatingGUIFromParameterNode = False
@@ -303,6 +361,9 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
     self._parameterNode.SetNodeReferenceID("boneSurgicalGuideBaseModel", self.ui.boneSurgicalGuideBaseSelector.currentNodeID)
     
     self._parameterNode.SetParameter("multiplierOfMaxRadius", str(self.ui.multiplierOfMaxRadiusSpinBox.value))
+    self._parameterNode.SetParameter("positioningTolerance", str(self.ui.positioningToleranceSpinBox.value))
+    self._parameterNode.SetParameter("positioningMaximumNumberOfIterations", str(self.ui.positioningMaximumNumberOfIterationsSpinBox.value))
+    self._parameterNode.SetParameter("cutResultsCacheMemoryBudget", str(self.ui.cutResultsCacheMemoryBudgetSpinBox.value))
     self._parameterNode.SetParameter("securityMarginOfBonePieces", str(self.ui.securityMarginOfBonePiecesSpinBox.value))
     self._parameterNode.SetParameter("miterBoxSlotWidth", str(self.ui.miterBoxSlotWidthSpinBox.value))
     self._parameterNode.SetParameter("miterBoxSlotLength", str(self.ui.miterBoxSlotLengthSpinBox.value))
@@ -319,6 +380,46 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
       self._parameterNode.SetParameter("checkSecurityMarginOnMiterBoxCreation","True")
     else:
       self._parameterNode.SetParameter("checkSecurityMarginOnMiterBoxCreation","False")
+    if self.ui.areaWeightedSectionCentroidsCheckBox.checked:
+      self._parameterNode.SetParameter("useAreaWeightedSectionCentroids","True")
+    else:
+      self._parameterNode.SetParameter("useAreaWeightedSectionCentroids","False")
+    if self.ui.accelerateAutomaticPositioningCheckBox.checked:
+      self._parameterNode.SetParameter("accelerateAutomaticPositioning","True")
+    else:
+      self._parameterNode.SetParameter("accelerateAutomaticPositioning","False")
+    if self.ui.warmStartAutomaticPositioningCheckBox.checked:
+      self._parameterNode.SetParameter("warmStartAutomaticPositioning","True")
+    else:
+      self._parameterNode.SetParameter("warmStartAutomaticPositioning","False")
+    if self.ui.parallelPlaneCutsCheckBox.checked:
+      self._parameterNode.SetParameter("useParallelPlaneCuts","True")
+    else:
+      self._parameterNode.SetParameter("useParallelPlaneCuts","False")
+    if self.ui.sharedPointsBoneSegmentsCheckBox.checked:
+      self._parameterNode.SetParameter("useSharedPointsBoneSegments","True")
+    else:
+      self._parameterNode.SetParameter("useSharedPointsBoneSegments","False")
+    if self.ui.boneModelProxyDuringInteractionCheckBox.checked:
+      self._parameterNode.SetParameter("useBoneModelProxyDuringInteraction","True")
+    else:
+      self._parameterNode.SetParameter("useBoneModelProxyDuringInteraction","False")
+    if self.ui.batchedBooleanOperationsCheckBox.checked:
+      self._parameterNode.SetParameter("useBatchedBooleanOperations","True")
+    else:
+      self._parameterNode.SetParameter("useBatchedBooleanOperations","False")
+    if self.ui.areaWeightedNormalsForScrewAxesCheckBox.checked:
+      self._parameterNode.SetParameter("useAreaWeightedNormalsForScrewAxes","True")
+    else:
+      self._parameterNode.SetParameter("useAreaWeightedNormalsForScrewAxes","False")
+    if self.ui.recordStageTimingsCheckBox.checked:
+      self._parameterNode.SetParameter("recordStageTimings","True")
+    else:
+      self._parameterNode.SetParameter("recordStageTimings","False")
+    if self.ui.profileStagesCheckBox.checked:
+      self._parameterNode.SetParameter("profileStages","True")
+    else:
+      self._parameterNode.SetParameter("profileStages","False")
 
     self._parameterNode.EndModify(wasModified)
 
@@ -334,6 +435,16 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
     deformedBoneViewNode = slicer.mrmlScene.GetSingletonNode("1", "vtkMRMLViewNode")
     displayNode.AddViewNodeID(deformedBoneViewNode.GetID())
 
+    self.logic.updateBoneModelSectionIndex()
+    self.logic.updateBoneModelProxy()
+
+  def onBoneCurveChanged(self, caller=None, event=None):
+    if self._parameterNode is None or self._updatingGUIFromParameterNode:
+      return
+
+    self.updateParameterNodeFromGUI()
+    self.logic.updateBoneModelSectionIndex()
+
   def onOriginToCurveCheckBox(self):
     if self._parameterNode is None or self._updatingGUIFromParameterNode:
       return
@@ -377,22 +488,43 @@ class DeformityCorrectionOsteotomyPlannerWidget(ScriptedLoadableModuleWidget, VT
 
   def onCenterBoneCutPlanesButton(self):
     self.logic.centerBoneCutPlanes()
+    self.logic.recordPlanningState()
 
   def onAutomaticNormalAndOriginDefinitionOfBoneCutPlanesButton(self):
     self.logic.automaticNormalAndOriginDefinitionOfBoneCutPlanes()
+    self.logic.recordPlanningState()
+
+  def onUpdateBonePiecesAtFullResolutionButton(self):
+    self.logic.updateBonePiecesAtFullResolution()
+    self.logic.recordPlanningState()
+
+  def onUndoPlanningStateButton(self):
+    self.logic.undoPlanningState()
+
+  def onRedoPlanningStateButton(self):
+    self.logic.redoPlanningState()
 
   def onCreateMiterBoxesFromBoneCutPlanesButton(self):
+    #The parameters used to create the surgical guide parts are part of the plan
+    self.logic.recordPlanningState()
     self.logic.createMiterBoxesFromBoneCutPlanes()
 
   def onCreateBoneCylindersFiducialListButton(self):
     self.logic.createBoneCylindersFiducialList()
 
   def onCreateCylindersFromFiducialListAndBoneSurgicalGuideBaseButton(self):
+    self.logic.recordPlanningState()
     self.logic.createCylindersFromFiducialListAndBoneSurgicalGuideBase()
 
   def onMakeBooleanOperationsToBoneSurgicalGuideBaseButton(self):
+    self.logic.recordPlanningState()
     self.logic.makeBooleanOperationsToBoneSurgicalGuideBase()
 
+  def onExportStageTimingsButton(self):
+    filePath = qt.QFileDialog.getSaveFileName(None, "Export stage timings", "stageTimings.csv", "CSV files (*.csv);;JSON files (*.json)")
+    if filePath:
+      self.logic.exportStageTimings(filePath)
+
 #
 # DeformityCorrectionOsteotomyPlannerLogic
 #
@@ -407,9 +539,29 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
   https://github.com/Slicer/Slicer/blob/master/Base/Python/slicer/ScriptedLoadableModule.py
   """
 
-  def __init__(self):
+  #Performance and profiling settings change how fast the plan is computed but not the plan,
+  #they are not part of the planning states so undo/redo does not revert them
+  runtimeParametersNames = {
+    "accelerateAutomaticPositioning",
+    "warmStartAutomaticPositioning",
+    "useParallelPlaneCuts",
+    "numberOfPlaneCutWorkers",
+    "useSharedPointsBoneSegments",
+    "useBoneModelProxyDuringInteraction",
+    "boneModelProxyTargetReduction",
+    "boneModelProxyMinimumNumberOfCells",
+    "useBatchedBooleanOperations",
+    "minimumBonePiecesUpdateDelay",
+    "maximumBonePiecesUpdateDelay",
+    "cutResultsCacheMemoryBudget",
+    "recordStageTimings",
+    "profileStages"
+  }
+
+  def __init__(self, setupLayout=True):
     """
     Called when the logic class is instantiated. Can be used for initializing member variables.
+    The custom layout and its toolbar action are only added if setupLayout is True and there is a main window.
     """
     ScriptedLoadableModuleLogic.__init__(self)
     self.boneCutPlaneObserversAndNodeIDList = []
@@ -417,7 +569,93 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     self.planeModifiedTimer.setInterval(300)
     self.planeModifiedTimer.setSingleShot(True)
     self.planeModifiedTimer.connect('timeout()', self.onPlaneModifiedTimerTimeout)
+    #Bone cut planes modified since the last update of the bone pieces, in modification order
+    self.modifiedBoneCutPlanesIDs = {}
+    self.bonePiecesUpdateInProgress = False
+    #Exponential moving average of the duration of the updates, it sizes the delay of the timer
+    self.bonePiecesUpdateDurationAverage = None
+    self.slicingService = ModelSlicingService()
+    #Converged centroid lines of the plane pairs keyed by the IDs of their planes
+    self.planePairsPositioningCache = {}
+    self.lastPositioningStatistics = []
+    #Decimated copy of the bone model used while a bone cut plane is being dragged
+    self.boneCutPlaneInteractionObservers = {}
+    self.planeInteractionInProgress = False
+    self.bonePiecesWereCutFromProxy = False
+    #Created when it is first needed, cleanup shuts it down
+    self.backgroundExecutor = None
+    self.boneModelProxyFuture = None
+    self.boneModelProxyFutureSource = None
+    self.boneModelProxyTimer = qt.QTimer()
+    self.boneModelProxyTimer.setInterval(200)
+    self.boneModelProxyTimer.connect('timeout()', self.onBoneModelProxyTimerTimeout)
+    #Distance functions of the cut bone pieces used by the security margin check
+    self.bonePiecesDistanceFunctions = {}
+    #Screw hole cylinders keyed by radius
+    self.cylinderTemplates = {}
+    #Points of the bone surface where the miter boxes of each bone cut plane stand
+    self.miterBoxesPointsOfIntersection = {}
+    self.surfacePointsIndexes = {}
+    #Wall time, calls and bone model size of the methods decorated with timedStage
+    self.stageTimingRecorder = StageTimingRecorder()
+    self.stageTimingsParameterNode = None
+    self.stageTimingsParameterNodeObserver = None
+    #Subject hierarchy folders of the module and their nodes
+    self.folderRegistry = SubjectHierarchyFolderRegistry("DeformityCorrectionOsteotomyPlanner")
+    #Bone cut planes sorted along the bone curve, it defines the plane pairs and bone segments
+    self.boneCutPlanesArcLengthIndex = ArcLengthOrderedIndex()
+    self.boneCutPlanesArcLengthIndexSource = None
+    #Curve points, arc lengths and frames of the curves keyed by curve node ID
+    self.curveFrameTables = {}
+    #Plane cuts whose bone segments share the points of the cut bone model
+    self.sharedPointsPlaneCutter = None
+    #Bone segments and corrected position matrices of recent bone cut plane configurations
+    self.cutResultsCache = LeastRecentlyUsedCache()
+    self.cutResultsCacheSource = None
+    #Hashes of the points and cells of the models keyed by model node ID
+    self.meshHashes = {}
+    #Undo/redo history of the bone cut planes, bone curve and parameters
+    self.planningStateHistory = PlanningStateHistory()
+    self.planningStateRestoreInProgress = False
+    #The observed bone cut planes are gone after a scene close
+    self.sceneEndCloseObserver = slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent,self.onSceneEndClose)
+
+    # Built-in layout IDs are all below 100, so you can choose any large random number
+    # for your custom layout ID.
+    self.customLayoutId=102
+
+    if setupLayout and (slicer.util.mainWindow() is not None):
+      self.setupCustomLayout()
+
+    self.getParameterNode()
+
+  def onSceneEndClose(self,caller=None,event=None):
+    self.planeModifiedTimer.stop()
+    self.modifiedBoneCutPlanesIDs = {}
+    self.boneCutPlaneObserversAndNodeIDList = []
+    self.removeBoneCutPlanesInteractionObservers()
+    #The parameter node of the new scene is observed when it is first requested
+    self.removeStageTimingsParametersObserver()
 
+  def cleanup(self):
+    """
+    Stops the timers and the background work and removes the observers of the logic.
+    """
+    self.planeModifiedTimer.stop()
+    self.boneModelProxyTimer.stop()
+    if self.boneModelProxyFuture is not None:
+      self.boneModelProxyFuture.cancel()
+    self.boneModelProxyFuture = None
+    self.boneModelProxyFutureSource = None
+    if self.backgroundExecutor is not None:
+      self.backgroundExecutor.shutdown(wait=False)
+      self.backgroundExecutor = None
+    self.removeBoneCutPlanesObservers()
+    self.folderRegistry.cleanup()
+    self.removeStageTimingsParametersObserver()
+    slicer.mrmlScene.RemoveObserver(self.sceneEndCloseObserver)
+
+  def setupCustomLayout(self):
     customLayout = """
       <layout type="vertical">
       <item>
@@ -432,10 +670,6 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
       </item>
       </layout>
     """
-    # Built-in layout IDs are all below 100, so you can choose any large random number
-    # for your custom layout ID.
-    self.customLayoutId=102
-
     layoutManager = slicer.app.layoutManager()
     layoutManager.layoutLogic().GetLayoutNode().AddLayoutDescription(self.customLayoutId, customLayout)
 
@@ -452,19 +686,300 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     """
     Initialize parameter node with default settings.
     """
+    #Same defaults than the GUI so the logic can be used without the widget
+    defaultGUIParameters = {
+      "multiplierOfMaxRadius": "2.0",
+      "miterBoxSlotWidth": "1.0",
+      "miterBoxSlotLength": "20.0",
+      "miterBoxSlotHeight": "15.0",
+      "miterBoxSlotWall": "3.0",
+      "biggerMiterBoxDistanceToBone": "3.0",
+      "securityMarginOfBonePieces": "1.0",
+      "boneScrewHoleCylinderRadius": "1.5",
+      "checkSecurityMarginOnMiterBoxCreation": "True",
+    }
+    for parameterName in defaultGUIParameters:
+      if not parameterNode.GetParameter(parameterName):
+        parameterNode.SetParameter(parameterName, defaultGUIParameters[parameterName])
     if not parameterNode.GetParameter("Threshold"):
       parameterNode.SetParameter("Threshold", "100.0")
     if not parameterNode.GetParameter("Invert"):
       parameterNode.SetParameter("Invert", "false")
+    if not parameterNode.GetParameter("positioningMaximumNumberOfIterations"):
+      parameterNode.SetParameter("positioningMaximumNumberOfIterations", "5")
+    if not parameterNode.GetParameter("positioningTolerance"):
+      parameterNode.SetParameter("positioningTolerance", "0.01")
+    if not parameterNode.GetParameter("accelerateAutomaticPositioning"):
+      parameterNode.SetParameter("accelerateAutomaticPositioning", "True")
+    if not parameterNode.GetParameter("warmStartAutomaticPositioning"):
+      parameterNode.SetParameter("warmStartAutomaticPositioning", "True")
+    if not parameterNode.GetParameter("useParallelPlaneCuts"):
+      parameterNode.SetParameter("useParallelPlaneCuts", "False")
+    #Zero uses one worker per processor
+    if not parameterNode.GetParameter("numberOfPlaneCutWorkers"):
+      parameterNode.SetParameter("numberOfPlaneCutWorkers", "0")
+    if not parameterNode.GetParameter("useSharedPointsBoneSegments"):
+      parameterNode.SetParameter("useSharedPointsBoneSegments", "False")
+    if not parameterNode.GetParameter("useBoneModelProxyDuringInteraction"):
+      parameterNode.SetParameter("useBoneModelProxyDuringInteraction", "True")
+    if not parameterNode.GetParameter("boneModelProxyTargetReduction"):
+      parameterNode.SetParameter("boneModelProxyTargetReduction", "0.9")
+    #Smaller bone models are fast enough to be cut at full resolution while dragging
+    if not parameterNode.GetParameter("boneModelProxyMinimumNumberOfCells"):
+      parameterNode.SetParameter("boneModelProxyMinimumNumberOfCells", "50000")
+    if not parameterNode.GetParameter("useBatchedBooleanOperations"):
+      parameterNode.SetParameter("useBatchedBooleanOperations", "True")
+    #Bounds in milliseconds of the delay between a bone cut plane modification and the update of the bone pieces
+    if not parameterNode.GetParameter("minimumBonePiecesUpdateDelay"):
+      parameterNode.SetParameter("minimumBonePiecesUpdateDelay", "30")
+    if not parameterNode.GetParameter("maximumBonePiecesUpdateDelay"):
+      parameterNode.SetParameter("maximumBonePiecesUpdateDelay", "1000")
+    #Zero disables the cache of cut results
+    if not parameterNode.GetParameter("cutResultsCacheMemoryBudget"):
+      parameterNode.SetParameter("cutResultsCacheMemoryBudget", "512")
+    if not parameterNode.GetParameter("recordStageTimings"):
+      parameterNode.SetParameter("recordStageTimings", "False")
+    if not parameterNode.GetParameter("profileStages"):
+      parameterNode.SetParameter("profileStages", "False")
+
+  def createParameterNode(self):
+    parameterNode = ScriptedLoadableModuleLogic.createParameterNode(self)
+    self.setDefaultParameters(parameterNode)
+    return parameterNode
+
+  def getParameterNode(self):
+    parameterNode = ScriptedLoadableModuleLogic.getParameterNode(self)
+    self.observeStageTimingsParameters(parameterNode)
+    return parameterNode
+
+  def showDisplayNodeInView(self,displayNode,viewSingletonTag):
+    #Views only exist when the custom layout was set up
+    viewNode = slicer.mrmlScene.GetSingletonNode(viewSingletonTag, "vtkMRMLViewNode")
+    if viewNode is not None:
+      displayNode.AddViewNodeID(viewNode.GetID())
+
+  def observeStageTimingsParameters(self,parameterNode):
+    """
+    Observes the parameter node so the stage timing recorder is enabled by the recordStageTimings
+    parameter or by the DEFORMITY_CORRECTION_PLANNER_STAGE_TIMINGS environment variable as soon as
+    they change, then the methods decorated with timedStage only check the enabled flag.
+    """
+    if parameterNode is self.stageTimingsParameterNode:
+      return
+    self.removeStageTimingsParametersObserver()
+    self.stageTimingsParameterNode = parameterNode
+    self.stageTimingsParameterNodeObserver = parameterNode.AddObserver(vtk.vtkCommand.ModifiedEvent,self.updateStageTimingRecorder)
+    self.updateStageTimingRecorder()
+
+  def removeStageTimingsParametersObserver(self):
+    if self.stageTimingsParameterNode is not None:
+      self.stageTimingsParameterNode.RemoveObserver(self.stageTimingsParameterNodeObserver)
+    self.stageTimingsParameterNode = None
+    self.stageTimingsParameterNodeObserver = None
+    self.updateStageTimingRecorder()
+
+  def updateStageTimingRecorder(self,caller=None,event=None):
+    parameterNode = self.stageTimingsParameterNode
+    self.stageTimingRecorder.enabled = (
+      os.environ.get("DEFORMITY_CORRECTION_PLANNER_STAGE_TIMINGS","0") not in ["","0"] or
+      (parameterNode is not None and parameterNode.GetParameter("recordStageTimings") == "True")
+    )
+    self.stageTimingRecorder.profilingEnabled = (
+      parameterNode is not None and parameterNode.GetParameter("profileStages") == "True"
+    )
+
+  def getNumberOfCellsOfBoneModelForPlaneCuts(self):
+    boneModel = self.getBoneModelForPlaneCuts()
+    if (boneModel is None) or (boneModel.GetPolyData() is None):
+      return -1
+    return boneModel.GetPolyData().GetNumberOfCells()
+
+  def exportStageTimings(self,filePath):
+    """
+    Saves the recorded stage timings as JSON if the file extension is .json and as CSV otherwise.
+    The cProfile statistics, if any, are saved with the same name and .prof extension.
+    """
+    self.stageTimingRecorder.exportToFile(filePath)
+    summary = self.stageTimingRecorder.getSummary()
+    for stageName in summary:
+      logging.info("%s: %d calls, %.3fs total, %.3fs mean, %.3fs max" % (
+        stageName, summary[stageName]["numberOfCalls"], summary[stageName]["totalTime"],
+        summary[stageName]["meanTime"], summary[stageName]["maximumTime"]
+      ))
+    cutResultsCacheStatistics = self.getCutResultsCacheStatistics()
+    logging.info("Cut results cache: %d hits, %d misses, %d evictions (%.1f MiB), %d entries using %.1f MiB" % (
+      cutResultsCacheStatistics["numberOfHits"], cutResultsCacheStatistics["numberOfMisses"],
+      cutResultsCacheStatistics["numberOfEvictions"], cutResultsCacheStatistics["evictedMemorySize"]/1024,
+      cutResultsCacheStatistics["numberOfEntries"], cutResultsCacheStatistics["memorySize"]/1024
+    ))
+
+  def getCutResultsCache(self):
+    """
+    Returns the cache of cut results with the memory budget of the cutResultsCacheMemoryBudget
+    parameter, in MiB. It is cleared when the bone model is changed or modified.
+    """
+    parameterNode = self.getParameterNode()
+    self.cutResultsCache.setMemoryBudget(float(parameterNode.GetParameter("cutResultsCacheMemoryBudget") or "0")*1024)
+
+    boneModel = parameterNode.GetNodeReference("boneModel")
+    cutResultsCacheSource = None
+    if (boneModel is not None) and (boneModel.GetPolyData() is not None):
+      cutResultsCacheSource = (boneModel.GetID(), boneModel.GetPolyData().GetMTime())
+    if self.cutResultsCacheSource != cutResultsCacheSource:
+      self.cutResultsCache.clear()
+      self.meshHashes = {}
+      self.cutResultsCacheSource = cutResultsCacheSource
+    return self.cutResultsCache
+
+  def getMeshHashOfModel(self,modelNode):
+    """Hash of the points and cells of the model, it is only recomputed when its polydata is modified."""
+    import hashlib
+    from vtk.util.numpy_support import vtk_to_numpy
+    polyData = modelNode.GetPolyData()
+    cachedMeshHash = self.meshHashes.get(modelNode.GetID())
+    if (cachedMeshHash is not None) and (cachedMeshHash[0] is polyData) and (cachedMeshHash[1] == polyData.GetMTime()):
+      return cachedMeshHash[2]
+
+    meshHash = hashlib.blake2b(digest_size=16)
+    if polyData.GetPoints() is not None:
+      meshHash.update(np.ascontiguousarray(vtk_to_numpy(polyData.GetPoints().GetData())).data)
+    for cells in [polyData.GetPolys(), polyData.GetStrips()]:
+      meshHash.update(np.ascontiguousarray(vtk_to_numpy(cells.GetOffsetsArray())).data)
+      meshHash.update(np.ascontiguousarray(vtk_to_numpy(cells.GetConnectivityArray())).data)
+    self.meshHashes[modelNode.GetID()] = [polyData, polyData.GetMTime(), meshHash.hexdigest()]
+    return self.meshHashes[modelNode.GetID()][2]
+
+  def getQuantizedPlanesKey(self,planesOrigins,planesDirections):
+    #Positions are rounded to 0.01 mm and directions to 1e-4 so planes moved back to a position hit the cache
+    return (
+      np.round(np.asarray(planesOrigins,dtype=float)/0.01).astype(np.int64).tobytes(),
+      np.round(np.asarray(planesDirections,dtype=float)/1e-4).astype(np.int64).tobytes()
+    )
+
+  def getCutResultsCacheStatistics(self):
+    return self.cutResultsCache.getStatistics()
+
+  def getPlanningState(self):
+    """
+    Returns the compact state of the plan: the IDs and plane to world matrices of the bone cut
+    planes, the control points of the bone curve and the planning parameters of the parameter node.
+    Derived geometry and runtime parameters are not included.
+    """
+    parameterNode = self.getParameterNode()
+    boneCurve = parameterNode.GetNodeReference("boneCurve")
+    boneCutPlanesList = self.getBoneCutPlanesList()
+    return {
+      "boneCutPlanesIDs": [boneCutPlane.GetID() for boneCutPlane in boneCutPlanesList],
+      "boneCutPlanesMatrices": self.getPlanesToWorldMatricesArray(boneCutPlanesList),
+      "boneCurveID": boneCurve.GetID() if boneCurve is not None else None,
+      "boneCurveControlPoints": slicer.util.arrayFromMarkupsControlPoints(boneCurve) if boneCurve is not None else np.zeros((0,3)),
+      "parameters": {
+        parameterName: parameterNode.GetParameter(parameterName)
+        for parameterName in parameterNode.GetParameterNames()
+        if parameterName not in self.runtimeParametersNames
+      }
+    }
+
+  def recordPlanningState(self):
+    """Adds the current state to the history if it differs from the last recorded one. Returns True if it was added."""
+    #States are recorded when a plane is released, not at every update while it is dragged
+    if self.planningStateRestoreInProgress or self.planeInteractionInProgress:
+      return False
+    return self.planningStateHistory.record(self.getPlanningState())
+
+  def undoPlanningState(self):
+    #Changes made since the last recorded state can be redone
+    self.recordPlanningState()
+    if not self.planningStateHistory.canUndo():
+      return False
+    planningState = self.planningStateHistory.undo()
+    if not self.canRestorePlanningState(planningState):
+      self.planningStateHistory.redo()
+      return False
+    self.setPlanningState(planningState)
+    return True
+
+  def redoPlanningState(self):
+    if not self.planningStateHistory.canRedo():
+      return False
+    planningState = self.planningStateHistory.redo()
+    if not self.canRestorePlanningState(planningState):
+      self.planningStateHistory.undo()
+      return False
+    self.setPlanningState(planningState)
+    return True
+
+  def canRestorePlanningState(self,planningState,showError=True):
+    """
+    Returns True if the bone cut planes of the state are the current ones. Planes are not recreated
+    or removed, so states recorded before a plane was added or deleted cannot be restored.
+    """
+    boneCutPlanesIDs = [boneCutPlane.GetID() for boneCutPlane in self.getBoneCutPlanesList()]
+    if sorted(boneCutPlanesIDs) == sorted(planningState["boneCutPlanesIDs"]):
+      return True
+    if showError:
+      slicer.util.errorDisplay("ERROR: Bone cut planes were added or deleted since this planning state was recorded, it cannot be restored.")
+    return False
+
+  def setPlanningState(self,planningState):
+    """
+    Restores the parameters, bone curve control points and bone cut planes of the state. Only the
+    bone segments of the planes that moved are updated unless the parameters or the bone curve
+    changed, then all the bone pieces are updated. Cached cut results are reused. The bone cut
+    planes of the state should be the current ones, see canRestorePlanningState.
+    """
+    parameterNode = self.getParameterNode()
+    self.planningStateRestoreInProgress = True
+    try:
+      parametersChanged = False
+      wasModified = parameterNode.StartModify()
+      for parameterName, parameterValue in planningState["parameters"].items():
+        if parameterNode.GetParameter(parameterName) != parameterValue:
+          parameterNode.SetParameter(parameterName, parameterValue)
+          parametersChanged = True
+      parameterNode.EndModify(wasModified)
+
+      boneCurveChanged = False
+      boneCurve = slicer.mrmlScene.GetNodeByID(planningState["boneCurveID"]) if planningState["boneCurveID"] else None
+      if boneCurve is not None:
+        boneCurveControlPoints = slicer.util.arrayFromMarkupsControlPoints(boneCurve)
+        if not np.array_equal(boneCurveControlPoints, planningState["boneCurveControlPoints"]):
+          slicer.util.updateMarkupsControlPointsFromArray(boneCurve, planningState["boneCurveControlPoints"])
+          boneCurveChanged = True
+
+      boneCutPlanesObserved = len(self.boneCutPlaneObserversAndNodeIDList) > 0
+      if boneCutPlanesObserved:
+        self.removeBoneCutPlanesObservers()
+      movedBoneCutPlanesList = []
+      for boneCutPlaneID, planeToWorldMatrix in zip(planningState["boneCutPlanesIDs"],planningState["boneCutPlanesMatrices"]):
+        boneCutPlane = slicer.mrmlScene.GetNodeByID(boneCutPlaneID)
+        if boneCutPlane is None:
+          logging.warning("Bone cut plane %s was removed, it is not restored" % boneCutPlaneID)
+          continue
+        if np.allclose(self.getPlanesToWorldMatricesArray([boneCutPlane])[0],planeToWorldMatrix):
+          continue
+        boneCutPlane.SetAxes(planeToWorldMatrix[:3,0],planeToWorldMatrix[:3,1],planeToWorldMatrix[:3,2])
+        boneCutPlane.SetOrigin(planeToWorldMatrix[:3,3])
+        movedBoneCutPlanesList.append(boneCutPlane)
+      if boneCutPlanesObserved:
+        self.addBoneCutPlanesObservers()
+
+      self.planeModifiedTimer.stop()
+      self.modifiedBoneCutPlanesIDs = {}
+      if len(movedBoneCutPlanesList) > 0:
+        self.updateArcLengthsOfBoneCutPlanes(movedBoneCutPlanesList)
+      if len(self.folderRegistry.getNodesOfFolder("Cut Bone Pieces")) > 0:
+        if parametersChanged or boneCurveChanged:
+          #The bone curve and the parameters change the corrected position of every bone piece
+          self.createAndUpdateDynamicModelerNodes()
+          self.transformBonePiecesToCorrectedPosition()
+        elif len(movedBoneCutPlanesList) > 0:
+          self.updateBonePiecesAdjacentToCutPlanes(movedBoneCutPlanesList)
+    finally:
+      self.planningStateRestoreInProgress = False
 
   def getParentFolderItemID(self):
-    shNode = slicer.vtkMRMLSubjectHierarchyNode.GetSubjectHierarchyNode(slicer.mrmlScene)
-    sceneItemID = shNode.GetSceneItemID()
-    folderSubjectHierarchyID = shNode.GetItemByName("DeformityCorrectionOsteotomyPlanner")
-    if folderSubjectHierarchyID:
-      return folderSubjectHierarchyID
-    else:
-      return shNode.CreateFolderItem(sceneItemID,"DeformityCorrectionOsteotomyPlanner")
+    return self.folderRegistry.getRootFolderItemID()
   
   def addBoneCurve(self):
     boneCurveNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLMarkupsCurveNode")
@@ -489,9 +1004,7 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     slicer.mrmlScene.AddNode(planeNode)
     slicer.modules.markups.logic().AddNewDisplayNodeForMarkupsNode(planeNode)
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    if not boneCutPlanesFolder:
-      boneCutPlanesFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Bone Cut Planes")
+    boneCutPlanesFolder = self.folderRegistry.getFolderItemID("Bone Cut Planes",createIfMissing=True)
     planeNodeItemID = shNode.GetItemByDataNode(planeNode)
     shNode.SetItemParent(planeNodeItemID, boneCutPlanesFolder)
     planeNode.SetName(slicer.mrmlScene.GetUniqueNameByString("boneCutPlane"))
@@ -500,8 +1013,7 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     displayNode = planeNode.GetDisplayNode()
     displayNode.SetGlyphScale(2.5)
 
-    deformedBoneViewNode = slicer.mrmlScene.GetSingletonNode("1", "vtkMRMLViewNode")
-    displayNode.AddViewNodeID(deformedBoneViewNode.GetID())
+    self.showDisplayNodeInView(displayNode,"1")
 
     #conections
     self.planeNodeObserver = planeNode.AddObserver(slicer.vtkMRMLMarkupsNode.PointPositionDefinedEvent,self.onPlanePointAdded)
@@ -515,21 +1027,14 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     parameterNode = self.getParameterNode()
     boneCurve = parameterNode.GetNodeReference("boneCurve")
 
-    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
-
     temporalOrigin = [0,0,0]
     planeNode.GetNthControlPointPosition(0,temporalOrigin)
     
-    closestCurvePoint = [0,0,0]
-    closestCurvePointIndex = boneCurve.GetClosestPointPositionAlongCurveWorld(temporalOrigin,closestCurvePoint)
-    matrix = vtk.vtkMatrix4x4()
-    boneCurve.GetCurvePointToWorldTransformAtPointIndex(closestCurvePointIndex,matrix)
-    cutPlaneOrigin = np.array([matrix.GetElement(0,3),matrix.GetElement(1,3),matrix.GetElement(2,3)])
-    cutPlaneX = np.array([matrix.GetElement(0,0),matrix.GetElement(1,0),matrix.GetElement(2,0)])
-    cutPlaneY = np.array([matrix.GetElement(0,1),matrix.GetElement(1,1),matrix.GetElement(2,1)])
-    cutPlaneZ = np.array([matrix.GetElement(0,2),matrix.GetElement(1,2),matrix.GetElement(2,2)])
+    curvePointToWorldMatrix = self.getCurveFrameTable(boneCurve).getCurvePointsToWorldMatricesOfClosestCurvePoints([temporalOrigin])[0]
+    cutPlaneOrigin = curvePointToWorldMatrix[:3,3]
+    cutPlaneX = curvePointToWorldMatrix[:3,0]
+    cutPlaneY = curvePointToWorldMatrix[:3,1]
+    cutPlaneZ = curvePointToWorldMatrix[:3,2]
     dx = 40#Numbers choosen so the planes are visible enough
     dy = 40
     planeNode.RemoveObserver(self.planeNodeObserver)
@@ -544,295 +1049,759 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
       planeNode.SetNthControlPointVisibility(i,False)
     observer = planeNode.AddObserver(slicer.vtkMRMLMarkupsNode.PointModifiedEvent,self.onPlaneModifiedTimer)
     self.boneCutPlaneObserversAndNodeIDList.append([observer,planeNode.GetID()])
+    self.addBoneCutPlaneInteractionObservers(planeNode)
 
+    #Inserts the new plane in the arc length index and moves only it in the bone cut planes folder
+    self.updateArcLengthsOfBoneCutPlanes([planeNode])
 
-    boneCutPlaneAndCurvePointIndexList = []
-    for i in range(len(boneCutPlanesList)):
-      origin = [0,0,0]
-      boneCutPlanesList[i].GetNthControlPointPosition(0,origin)
-      closestCurvePoint = [0,0,0]
-      closestCurvePointIndex = boneCurve.GetClosestPointPositionAlongCurveWorld(origin,closestCurvePoint)
-      boneCutPlaneAndCurvePointIndexList.append([boneCutPlanesList[i],closestCurvePointIndex])
-    
-    boneCutPlaneAndCurvePointIndexList.sort(key = lambda item : item[1])
-
-    boneCutPlanesFolder2 = shNode.CreateFolderItem(self.getParentFolderItemID(),"Bone Cut Planes 2")
-    
-    for i in range(len(boneCutPlaneAndCurvePointIndexList)):
-      boneCutPlane = boneCutPlaneAndCurvePointIndexList[i][0]
-      boneCutPlaneItemID = shNode.GetItemByDataNode(boneCutPlane)
-      shNode.SetItemParent(boneCutPlaneItemID, boneCutPlanesFolder2)
-
-    shNode.RemoveItem(boneCutPlanesFolder)
-    shNode.SetItemName(boneCutPlanesFolder2,"Bone Cut Planes")
-
+  def getBoneCutPlanesList(self):
+    """
+    Returns the bone cut planes ordered by the arc length of their origins along the bone curve.
+    Planes added to or removed from the bone cut planes folder are inserted in or removed from the
+    index, and the folder is reordered to match it by moving only the planes that are out of place.
+    """
+    boneCutPlanesList = self.folderRegistry.getNodesOfFolder("Bone Cut Planes")
+    boneCurve = self.getParameterNode().GetNodeReference("boneCurve")
+    if boneCurve is None:
+      return boneCutPlanesList
+
+    arcLengthIndex = self.boneCutPlanesArcLengthIndex
+    curveFrameTable = self.getCurveFrameTable(boneCurve)
+    if self.boneCutPlanesArcLengthIndexSource is not curveFrameTable:
+      #Arc lengths along another curve or a modified one are not comparable
+      arcLengthIndex.clear()
+      self.boneCutPlanesArcLengthIndexSource = curveFrameTable
+
+    boneCutPlanesIDsList = [boneCutPlane.GetID() for boneCutPlane in boneCutPlanesList]
+    if boneCutPlanesIDsList == arcLengthIndex.getKeys():
+      return boneCutPlanesList
+
+    boneCutPlanesIDsSet = set(boneCutPlanesIDsList)
+    for planeNodeID in arcLengthIndex.getKeys():
+      if planeNodeID not in boneCutPlanesIDsSet:
+        arcLengthIndex.remove(planeNodeID)
+    newBoneCutPlanesList = [boneCutPlane for boneCutPlane in boneCutPlanesList if boneCutPlane.GetID() not in arcLengthIndex]
+    newBoneCutPlanesArcLengths = self.getArcLengthsOfPlanesAlongCurve(newBoneCutPlanesList,boneCurve)
+    for boneCutPlane, arcLength in zip(newBoneCutPlanesList,newBoneCutPlanesArcLengths):
+      arcLengthIndex.insert(boneCutPlane.GetID(),arcLength)
+
+    self.moveBoneCutPlanesToArcLengthOrder()
+    return [slicer.mrmlScene.GetNodeByID(planeNodeID) for planeNodeID in arcLengthIndex.getKeys()]
+
+  def getArcLengthsOfPlanesAlongCurve(self,planeNodesList,curveNode):
+    if len(planeNodesList) == 0:
+      return np.zeros(0)
+    origins = np.array([self.getOriginAndNormalOfPlane(planeNode)[0] for planeNode in planeNodesList])
+    return self.getCurveFrameTable(curveNode).getArcLengthsOfClosestCurvePoints(origins)
+
+  def getCurveFrameTable(self,curveNode):
+    """
+    Returns the frame table of the curve. It is rebuilt when the world curve points are modified
+    or the curve is moved by a parent transform, display, selection or lock changes keep it.
+    """
+    transformNode = curveNode.GetParentTransformNode()
+    curveFrameTableSource = (
+      curveNode.GetCurvePointsWorld().GetMTime(),
+      transformNode.GetMTime() if transformNode is not None else 0
+    )
+    if curveNode.GetID() in self.curveFrameTables:
+      cachedCurveFrameTableSource, curveFrameTable = self.curveFrameTables[curveNode.GetID()]
+      if cachedCurveFrameTableSource == curveFrameTableSource:
+        return curveFrameTable
+    curveFrameTable = CurveFrameTable(curveNode)
+    self.curveFrameTables[curveNode.GetID()] = [curveFrameTableSource, curveFrameTable]
+    return curveFrameTable
+
+  def moveBoneCutPlanesToArcLengthOrder(self):
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    boneCutPlanesFolder = self.folderRegistry.getFolderItemID("Bone Cut Planes")
+    for position, planeNodeID in enumerate(self.boneCutPlanesArcLengthIndex.getKeys()):
+      planeItemID = shNode.GetItemByDataNode(slicer.mrmlScene.GetNodeByID(planeNodeID))
+      itemIDAtPosition = shNode.GetItemByPositionUnderParent(boneCutPlanesFolder,position)
+      if itemIDAtPosition != planeItemID:
+        shNode.MoveItem(planeItemID,itemIDAtPosition)
+        self.folderRegistry.invalidateNodesOfFolder(boneCutPlanesFolder)
+
+  def updateArcLengthsOfBoneCutPlanes(self,planeNodesList):
+    """
+    Updates the arc lengths of the moved planes. If a plane passes another one along the curve the
+    folder is reordered, so the plane pairs and bone segments follow the new order.
+    """
+    boneCurve = self.getParameterNode().GetNodeReference("boneCurve")
+    if boneCurve is None:
+      return
+    self.getBoneCutPlanesList()
+    planeNodesList = [planeNode for planeNode in planeNodesList if planeNode.GetID() in self.boneCutPlanesArcLengthIndex]
+    orderChanged = False
+    for planeNode, arcLength in zip(planeNodesList,self.getArcLengthsOfPlanesAlongCurve(planeNodesList,boneCurve)):
+      oldPosition, newPosition = self.boneCutPlanesArcLengthIndex.update(planeNode.GetID(),arcLength)
+      orderChanged = orderChanged or (oldPosition != newPosition)
+    if orderChanged:
+      self.moveBoneCutPlanesToArcLengthOrder()
 
   def onPlaneModifiedTimer(self,sourceNode,event):
     parameterNode = self.getParameterNode()
     parameterNode.SetNodeReferenceID("lastMovedCutPlane", sourceNode.GetID())
-    self.planeModifiedTimer.start()
+    #Keep the planes in the order they were last modified
+    self.modifiedBoneCutPlanesIDs.pop(sourceNode.GetID(), None)
+    self.modifiedBoneCutPlanesIDs[sourceNode.GetID()] = None
+    #Modifications made while an update runs are picked up when it finishes
+    if not self.bonePiecesUpdateInProgress:
+      self.planeModifiedTimer.start(self.getBonePiecesUpdateDelay())
+
+  def getBonePiecesUpdateDelay(self):
+    """
+    Returns the delay in milliseconds before the bone pieces are updated after a bone cut plane is modified.
+    Fast updates follow the plane closely, slow ones wait longer so more modifications are coalesced into one update.
+    """
+    parameterNode = self.getParameterNode()
+    minimumDelay = float(parameterNode.GetParameter("minimumBonePiecesUpdateDelay"))
+    maximumDelay = float(parameterNode.GetParameter("maximumBonePiecesUpdateDelay"))
+    if self.bonePiecesUpdateDurationAverage is None:
+      return int(min(max(300,minimumDelay),maximumDelay))
+    return int(min(max(1.5*1000*self.bonePiecesUpdateDurationAverage,minimumDelay),maximumDelay))
+
+  def updateBonePiecesUpdateDurationAverage(self,duration):
+    if self.bonePiecesUpdateDurationAverage is None:
+      self.bonePiecesUpdateDurationAverage = duration
+    else:
+      self.bonePiecesUpdateDurationAverage = 0.7*self.bonePiecesUpdateDurationAverage + 0.3*duration
 
+  @timedStage
   def onPlaneModifiedTimerTimeout(self):
+    if self.bonePiecesUpdateInProgress:
+      return
+
+    if len(self.modifiedBoneCutPlanesIDs) == 0:
+      return
+
+    #Modified planes stay pending until a plane modification restarts the timer with an even number of planes
     if not self.boneCutPlanesNumberIsEven():
       slicer.util.errorDisplay("ERROR: Bone cut planes number is odd, it should be even.")
       return
 
+    modifiedBoneCutPlanesIDs = list(self.modifiedBoneCutPlanesIDs)
+    self.modifiedBoneCutPlanesIDs = {}
+
+    #Planes deleted since they were modified are dropped
+    planeNodesList = [slicer.mrmlScene.GetNodeByID(planeNodeID) for planeNodeID in modifiedBoneCutPlanesIDs]
+    planeNodesList = [planeNode for planeNode in planeNodesList if planeNode is not None]
+
+    self.bonePiecesUpdateInProgress = True
+    startTime = time.perf_counter()
+    try:
+      self.snapBoneCutPlanesToBoneCurveOrBoneModel(planeNodesList)
+      self.updateArcLengthsOfBoneCutPlanes(planeNodesList)
+      self.updateBonePiecesAdjacentToCutPlanes(planeNodesList)
+    finally:
+      self.bonePiecesUpdateInProgress = False
+    self.updateBonePiecesUpdateDurationAverage(time.perf_counter() - startTime)
+    self.recordPlanningState()
+
+    if len(self.modifiedBoneCutPlanesIDs) > 0:
+      self.planeModifiedTimer.start(self.getBonePiecesUpdateDelay())
+
+  def snapBoneCutPlanesToBoneCurveOrBoneModel(self,planeNodesList):
     parameterNode = self.getParameterNode()
     boneCurve = parameterNode.GetNodeReference("boneCurve")
-    boneModel = parameterNode.GetNodeReference("boneModel")
-    planeNode = parameterNode.GetNodeReference("lastMovedCutPlane")
+    boneModel = self.getBoneModelForPlaneCuts()
     normalAsTangentOfCurveChecked = parameterNode.GetParameter("normalAsTangentOfCurve") == "True"
     originToCurveChecked = parameterNode.GetParameter("originToCurve") == "True"
     originToCenterChecked = parameterNode.GetParameter("originToCenter") == "True"
 
-    if normalAsTangentOfCurveChecked or originToCurveChecked or originToCenterChecked:
-      for i in range(len(self.boneCutPlaneObserversAndNodeIDList)):
-        if self.boneCutPlaneObserversAndNodeIDList[i][1] == planeNode.GetID():
-          observerIndex = i
+    if not (normalAsTangentOfCurveChecked or originToCurveChecked or originToCenterChecked):
+      return
+
+    #Only planes observed by the logic are snapped
+    observersIndexes = {}
+    for i in range(len(self.boneCutPlaneObserversAndNodeIDList)):
+      observersIndexes[self.boneCutPlaneObserversAndNodeIDList[i][1]] = i
+    planeNodesList = [planeNode for planeNode in planeNodesList if planeNode.GetID() in observersIndexes]
+    if len(planeNodesList) == 0:
+      return
+
+    originsOfCutPlanes = np.zeros((len(planeNodesList),3))
+    for i in range(len(planeNodesList)):
+      planeNodesList[i].GetNthControlPointPosition(0,originsOfCutPlanes[i])
+    curvePointsToWorldMatrices = self.getCurveFrameTable(boneCurve).getCurvePointsToWorldMatricesOfClosestCurvePoints(originsOfCutPlanes)
+
+    for planeNode, curvePointToWorldMatrix in zip(planeNodesList,curvePointsToWorldMatrices):
+      observerIndex = observersIndexes[planeNode.GetID()]
       planeNode.RemoveObserver(self.boneCutPlaneObserversAndNodeIDList[observerIndex][0])
 
-      originOfCutPlane = [0,0,0]
-      planeNode.GetNthControlPointPosition(0,originOfCutPlane)
-      
-      closestCurvePoint = [0,0,0]
-      closestCurvePointIndex = boneCurve.GetClosestPointPositionAlongCurveWorld(originOfCutPlane,closestCurvePoint)
-      matrix = vtk.vtkMatrix4x4()
-      boneCurve.GetCurvePointToWorldTransformAtPointIndex(closestCurvePointIndex,matrix)
       if originToCurveChecked:
-        nearestCurvePointToCutPlaneOrigin = np.array([matrix.GetElement(0,3),matrix.GetElement(1,3),matrix.GetElement(2,3)])
+        nearestCurvePointToCutPlaneOrigin = curvePointToWorldMatrix[:3,3]
         planeNode.SetOrigin(nearestCurvePointToCutPlaneOrigin)
       elif originToCenterChecked:
         self.setOriginOfPlaneToCentroidOfIntersectionWithModel(boneModel,planeNode)
       if normalAsTangentOfCurveChecked:
-        curveZ = np.array([matrix.GetElement(0,2),matrix.GetElement(1,2),matrix.GetElement(2,2)])
+        curveZ = curvePointToWorldMatrix[:3,2]
         planeNode.SetNormal(curveZ)
 
       observer = planeNode.AddObserver(slicer.vtkMRMLMarkupsNode.PointModifiedEvent,self.onPlaneModifiedTimer)
       self.boneCutPlaneObserversAndNodeIDList[observerIndex][0] = observer
 
+  def addBoneCutPlaneInteractionObservers(self,planeNode):
+    if planeNode.GetID() in self.boneCutPlaneInteractionObservers:
+      return
+    #The node is kept with its tags so the observers are removed from it even if its ID was reused
+    self.boneCutPlaneInteractionObservers[planeNode.GetID()] = [
+      planeNode,
+      planeNode.AddObserver(slicer.vtkMRMLMarkupsNode.PointStartInteractionEvent,self.onBoneCutPlaneInteractionStarted),
+      planeNode.AddObserver(slicer.vtkMRMLMarkupsNode.PointEndInteractionEvent,self.onBoneCutPlaneInteractionEnded)
+    ]
+
+  def removeBoneCutPlanesInteractionObservers(self):
+    for planeNode, startInteractionObserver, endInteractionObserver in self.boneCutPlaneInteractionObservers.values():
+      planeNode.RemoveObserver(startInteractionObserver)
+      planeNode.RemoveObserver(endInteractionObserver)
+    self.boneCutPlaneInteractionObservers = {}
+    self.planeInteractionInProgress = False
+
+  def onBoneCutPlaneInteractionStarted(self,sourceNode,event):
+    self.planeInteractionInProgress = True
+
+  def onBoneCutPlaneInteractionEnded(self,sourceNode,event):
+    self.planeInteractionInProgress = False
+    if not self.bonePiecesWereCutFromProxy:
+      self.recordPlanningState()
+      return
+    #Replace the preview cut from the proxy by the full resolution bone segments
+    self.planeModifiedTimer.stop()
+    self.getParameterNode().SetNodeReferenceID("lastMovedCutPlane", sourceNode.GetID())
+    self.modifiedBoneCutPlanesIDs[sourceNode.GetID()] = None
+    self.onPlaneModifiedTimerTimeout()
+
+  @timedStage
+  def updateBonePiecesAtFullResolution(self):
+    self.planeInteractionInProgress = False
     self.createAndUpdateDynamicModelerNodes()
     self.transformBonePiecesToCorrectedPosition()
 
+  def getBoneModelForPlaneCuts(self):
+    """
+    Returns the decimated proxy of the bone model while a bone cut plane is being dragged
+    if it is enabled and up to date, otherwise the bone model.
+    """
+    parameterNode = self.getParameterNode()
+    boneModel = parameterNode.GetNodeReference("boneModel")
+    if not self.planeInteractionInProgress:
+      return boneModel
+    if parameterNode.GetParameter("useBoneModelProxyDuringInteraction") != "True":
+      return boneModel
+    boneModelProxy = parameterNode.GetNodeReference("boneModelProxy")
+    if not self.boneModelProxyIsUpToDate(boneModel,boneModelProxy):
+      return boneModel
+    return boneModelProxy
+
+  def boneModelProxyIsUpToDate(self,boneModel,boneModelProxy):
+    if (boneModel is None) or (boneModelProxy is None) or (boneModel.GetPolyData() is None):
+      return False
+    return (
+      boneModelProxy.GetAttribute("DeformityCorrectionOsteotomyPlanner.ProxySourceModelID") == boneModel.GetID() and
+      boneModelProxy.GetAttribute("DeformityCorrectionOsteotomyPlanner.ProxySourceMTime") == str(boneModel.GetPolyData().GetMTime())
+    )
+
+  def updateBoneModelProxy(self):
+    """
+    Starts the decimation of the bone model on a background thread. The result is attached to
+    the proxy model node by onBoneModelProxyTimerTimeout on the main thread.
+    """
+    parameterNode = self.getParameterNode()
+    boneModel = parameterNode.GetNodeReference("boneModel")
+    if (boneModel is None) or (boneModel.GetPolyData() is None):
+      return
+    if boneModel.GetPolyData().GetNumberOfCells() < int(float(parameterNode.GetParameter("boneModelProxyMinimumNumberOfCells"))):
+      return
+    if self.boneModelProxyIsUpToDate(boneModel,parameterNode.GetNodeReference("boneModelProxy")):
+      return
+
+    boneModelProxySource = (boneModel.GetID(), boneModel.GetPolyData().GetMTime())
+    if (self.boneModelProxyFuture is not None) and (self.boneModelProxyFutureSource == boneModelProxySource):
+      return
+
+    inputPolyData = vtk.vtkPolyData()
+    inputPolyData.DeepCopy(boneModel.GetPolyData())
+    targetReduction = float(parameterNode.GetParameter("boneModelProxyTargetReduction"))
+    if self.backgroundExecutor is None:
+      self.backgroundExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    self.boneModelProxyFuture = self.backgroundExecutor.submit(decimatePolyData,inputPolyData,targetReduction)
+    self.boneModelProxyFutureSource = boneModelProxySource
+    self.boneModelProxyTimer.start()
+
+  def onBoneModelProxyTimerTimeout(self):
+    if (self.boneModelProxyFuture is None) or not self.boneModelProxyFuture.done():
+      return
+    self.boneModelProxyTimer.stop()
+    future = self.boneModelProxyFuture
+    boneModelProxySource = self.boneModelProxyFutureSource
+    self.boneModelProxyFuture = None
+    self.boneModelProxyFutureSource = None
+
+    try:
+      proxyPolyData = future.result()
+    except Exception as e:
+      logging.warning("Decimation of the bone model proxy failed: %s" % str(e))
+      return
+
+    parameterNode = self.getParameterNode()
+    boneModel = parameterNode.GetNodeReference("boneModel")
+    if (boneModel is None) or (boneModel.GetPolyData() is None):
+      return
+    if (boneModel.GetID(), boneModel.GetPolyData().GetMTime()) != boneModelProxySource:
+      #The bone model changed while it was decimated
+      self.updateBoneModelProxy()
+      return
+
+    boneModelProxy = parameterNode.GetNodeReference("boneModelProxy")
+    if boneModelProxy is None:
+      boneModelProxy = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode","Bone Model Proxy")
+      shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+      shNode.SetItemParent(shNode.GetItemByDataNode(boneModelProxy), self.getParentFolderItemID())
+      parameterNode.SetNodeReferenceID("boneModelProxy", boneModelProxy.GetID())
+    boneModelProxy.SetAndObservePolyData(proxyPolyData)
+    boneModelProxy.SetAttribute("DeformityCorrectionOsteotomyPlanner.ProxySourceModelID", boneModelProxySource[0])
+    boneModelProxy.SetAttribute("DeformityCorrectionOsteotomyPlanner.ProxySourceMTime", str(boneModelProxySource[1]))
+
   def boneCutPlanesNumberIsEven(self):
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
+    boneCutPlanesList = self.getBoneCutPlanesList()
 
     return (len(boneCutPlanesList)%2) == 0
 
+  def getNumberOfBoneSegments(self,boneCutPlanesList):
+    return len(boneCutPlanesList)//2 + 1
+
+  def getBoneSegmentIndexBoundedByCutPlane(self,boneCutPlaneIndex):
+    #Each cut plane bounds only one bone segment, the other side of it is the removed wedge
+    return (boneCutPlaneIndex+1)//2
+
+  def getCutPlanesAndOutputReferenceRoleOfBoneSegment(self,segmentIndex,boneCutPlanesList):
+    lastSegmentIndex = len(boneCutPlanesList)//2
+    if segmentIndex == 0:
+      return [boneCutPlanesList[0]], "PlaneCut.OutputNegativeModel"
+    elif segmentIndex != lastSegmentIndex:
+      #Bone segment in between two plane pairs
+      return [boneCutPlanesList[2*segmentIndex],boneCutPlanesList[2*segmentIndex -1]], "PlaneCut.OutputNegativeModel"
+    else:
+      return [boneCutPlanesList[-1]], "PlaneCut.OutputPositiveModel"
+
+  @timedStage
   def createAndUpdateDynamicModelerNodes(self):
     parameterNode = self.getParameterNode()
     boneCurve = parameterNode.GetNodeReference("boneCurve")
     nonDecimatedBoneModelNode = parameterNode.GetNodeReference("boneModel")
      
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
+    boneCutPlanesList = self.getBoneCutPlanesList()
+
+    boneModelNode = self.getBoneModelForPlaneCuts()
+    self.bonePiecesWereCutFromProxy = boneModelNode is not nonDecimatedBoneModelNode
+
+    numberOfBoneSegments = self.getNumberOfBoneSegments(boneCutPlanesList)
+    cutBonePiecesList, planeCutsList = self.getBoneSegmentsNodesPool(numberOfBoneSegments)
+
+    for segmentIndex in range(numberOfBoneSegments):
+      modelNode = cutBonePiecesList[segmentIndex]
+      dynamicModelerNode = planeCutsList[segmentIndex]
+
+      segmentCutPlanesList, outputReferenceRole = self.getCutPlanesAndOutputReferenceRoleOfBoneSegment(segmentIndex,boneCutPlanesList)
+
+      wasModified = dynamicModelerNode.StartModify()
+      dynamicModelerNode.SetNodeReferenceID("PlaneCut.InputModel", boneModelNode.GetID())
+      dynamicModelerNode.RemoveNodeReferenceIDs("PlaneCut.InputPlane")
+      for segmentCutPlane in segmentCutPlanesList:
+        dynamicModelerNode.AddNodeReferenceID("PlaneCut.InputPlane", segmentCutPlane.GetID())
+      dynamicModelerNode.RemoveNodeReferenceIDs("PlaneCut.OutputNegativeModel")
+      dynamicModelerNode.RemoveNodeReferenceIDs("PlaneCut.OutputPositiveModel")
+      dynamicModelerNode.SetNodeReferenceID(outputReferenceRole, modelNode.GetID())
+      dynamicModelerNode.EndModify(wasModified)
+
+    self.runPlaneCutsOfBoneSegments(range(numberOfBoneSegments),boneModelNode,boneCutPlanesList,cutBonePiecesList,planeCutsList)
+
+  @timedStage
+  def runPlaneCutsOfBoneSegments(self,segmentIndexesList,boneModelNode,boneCutPlanesList,cutBonePiecesList,planeCutsList):
+    """
+    Updates the bone segment models of the given indexes. Segments whose bone model and quantized
+    clipping planes are in the cut results cache are taken from it, the rest are cut and cached.
+    """
+    segmentIndexesList = list(segmentIndexesList)
+    cutResultsCache = self.getCutResultsCache()
+    if (cutResultsCache.memoryBudget <= 0) or (len(segmentIndexesList) == 0):
+      self.runPlaneCutsOfBoneSegmentsWithoutCache(segmentIndexesList,boneModelNode,boneCutPlanesList,cutBonePiecesList,planeCutsList)
+      return
+
+    meshHash = self.getMeshHashOfModel(boneModelNode)
+    segmentsKeys = {}
+    uncachedSegmentIndexesList = []
+    for segmentIndex in segmentIndexesList:
+      planesOrigins, planesNormals = self.getClippingPlanesOfBoneSegment(segmentIndex,boneCutPlanesList)
+      segmentsKeys[segmentIndex] = ("boneSegment", meshHash) + self.getQuantizedPlanesKey(planesOrigins,planesNormals)
+      cachedPolyData = cutResultsCache.get(segmentsKeys[segmentIndex])
+      if cachedPolyData is not None:
+        #Segments get their own copy so later plane cuts or edits of the model do not change the cache
+        polyData = vtk.vtkPolyData()
+        polyData.DeepCopy(cachedPolyData)
+        cutBonePiecesList[segmentIndex].SetAndObservePolyData(polyData)
+      else:
+        uncachedSegmentIndexesList.append(segmentIndex)
+
+    self.runPlaneCutsOfBoneSegmentsWithoutCache(uncachedSegmentIndexesList,boneModelNode,boneCutPlanesList,cutBonePiecesList,planeCutsList)
+
+    for segmentIndex in uncachedSegmentIndexesList:
+      #The cache keeps its own copy because the plane cuts may write into the polydata of the segments later
+      polyData = cutBonePiecesList[segmentIndex].GetPolyData()
+      if polyData is None:
+        continue
+      cachedPolyData = getCompactCopyOfPolyData(polyData)
+      cutResultsCache.add(segmentsKeys[segmentIndex],cachedPolyData,cachedPolyData.GetActualMemorySize())
+
+  def runPlaneCutsOfBoneSegmentsWithoutCache(self,segmentIndexesList,boneModelNode,boneCutPlanesList,cutBonePiecesList,planeCutsList):
+    """
+    Updates the bone segment models of the given indexes. With shared points the segments are
+    clipped with NumPy and all of them reference one copy of the points of the bone model. In parallel mode
+    each segment is clipped on a worker thread from a shared copy of the bone polydata and the
+    results are attached to the models here, on the main thread. Otherwise, or if a worker fails,
+    the plane cut nodes are run one after another.
+    """
+    parameterNode = self.getParameterNode()
+    segmentIndexesList = list(segmentIndexesList)
+    serialSegmentIndexesList = segmentIndexesList
+
+    if (parameterNode.GetParameter("useSharedPointsBoneSegments") == "True") and (len(segmentIndexesList) > 0):
+      allSegmentsAreCut = len(segmentIndexesList) == len(cutBonePiecesList)
+      if allSegmentsAreCut:
+        memorySizeBefore = self.getMemorySizeOfBonePieces(cutBonePiecesList)
+      sharedPointsPlaneCutter = self.getSharedPointsPlaneCutter(boneModelNode)
+      with self.stageTimingRecorder.stage("sharedPointsPlaneCuts",boneModelNode.GetPolyData().GetNumberOfCells()):
+        for segmentIndex in segmentIndexesList:
+          planesOrigins, planesNormals = self.getClippingPlanesOfBoneSegment(segmentIndex,boneCutPlanesList)
+          cutBonePiecesList[segmentIndex].SetAndObservePolyData(
+            sharedPointsPlaneCutter.getCutPiece(segmentIndex,planesOrigins,planesNormals)
+          )
+      if allSegmentsAreCut:
+        logging.info(
+          "Memory of the bone segments: %.1f MiB before and %.1f MiB after the plane cuts with shared points (bone model: %.1f MiB)" % (
+          memorySizeBefore/1024, self.getMemorySizeOfBonePieces(cutBonePiecesList)/1024, boneModelNode.GetPolyData().GetActualMemorySize()/1024)
+        )
+      return
+
+    if (parameterNode.GetParameter("useParallelPlaneCuts") == "True") and (len(segmentIndexesList) > 0):
+      numberOfWorkers = int(float(parameterNode.GetParameter("numberOfPlaneCutWorkers") or "0"))
+      if numberOfWorkers <= 0:
+        numberOfWorkers = os.cpu_count() or 1
+      numberOfWorkers = min(numberOfWorkers,len(segmentIndexesList))
+
+      #Workers only read from this copy, cells are built beforehand so no lazy initialization happens on the threads
+      inputPolyData = vtk.vtkPolyData()
+      inputPolyData.DeepCopy(boneModelNode.GetPolyData())
+      inputPolyData.BuildCells()
+
+      with self.stageTimingRecorder.stage("parallelPlaneCuts",inputPolyData.GetNumberOfCells()):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=numberOfWorkers) as executor:
+          futuresList = []
+          for segmentIndex in segmentIndexesList:
+            planesOrigins, planesNormals = self.getClippingPlanesOfBoneSegment(segmentIndex,boneCutPlanesList)
+            futuresList.append(executor.submit(clipClosedSurfaceWithPlanes,inputPolyData,planesOrigins,planesNormals))
+
+      serialSegmentIndexesList = []
+      for segmentIndex, future in zip(segmentIndexesList,futuresList):
+        try:
+          cutBonePiecesList[segmentIndex].SetAndObservePolyData(future.result())
+        except Exception as e:
+          logging.warning("Parallel plane cut of bone segment %d failed, running it serially: %s" % (segmentIndex, str(e)))
+          serialSegmentIndexesList.append(segmentIndex)
+
+    for segmentIndex in serialSegmentIndexesList:
+      with self.stageTimingRecorder.stage("serialPlaneCut",boneModelNode.GetPolyData().GetNumberOfCells()):
+        slicer.modules.dynamicmodeler.logic().RunDynamicModelerTool(planeCutsList[segmentIndex])
+
+  def getSharedPointsPlaneCutter(self,boneModelNode):
+    polyData = boneModelNode.GetPolyData()
+    if (self.sharedPointsPlaneCutter is None) or not self.sharedPointsPlaneCutter.isUpToDate(polyData):
+      self.sharedPointsPlaneCutter = SharedPointsPlaneCutter(polyData)
+    return self.sharedPointsPlaneCutter
+
+  def getMemorySizeOfBonePieces(self,bonePiecesList):
+    """Memory in KiB of the polydatas of the bone pieces, points shared by several pieces are counted once"""
+    memorySize = 0
+    countedPointsList = []
+    for bonePiece in bonePiecesList:
+      polyData = bonePiece.GetPolyData()
+      if polyData is None:
+        continue
+      memorySize += polyData.GetActualMemorySize()
+      points = polyData.GetPoints()
+      if points is None:
+        continue
+      if any(points is countedPoints for countedPoints in countedPointsList):
+        memorySize -= points.GetActualMemorySize()
+      else:
+        countedPointsList.append(points)
+    return memorySize
 
-    boneModelNode = nonDecimatedBoneModelNode
+  def getClippingPlanesOfBoneSegment(self,segmentIndex,boneCutPlanesList):
+    """
+    Returns the origins and normals of the planes whose positive half-spaces intersect into
+    the bone segment, equivalent to the "Difference" operation of its plane cut node.
+    """
+    segmentCutPlanesList, outputReferenceRole = self.getCutPlanesAndOutputReferenceRoleOfBoneSegment(segmentIndex,boneCutPlanesList)
+    planesOrigins = []
+    planesNormals = []
+    for segmentCutPlane in segmentCutPlanesList:
+      origin, normal = self.getOriginAndNormalOfPlane(segmentCutPlane)
+      planesOrigins.append(origin)
+      planesNormals.append(normal)
+    if outputReferenceRole == "PlaneCut.OutputNegativeModel":
+      #Negative side of the first plane and positive side of the rest
+      planesNormals[0] = -planesNormals[0]
+    return np.array(planesOrigins), np.array(planesNormals)
+
+  def getBoneSegmentsNodesPool(self,numberOfBoneSegments):
+    """
+    Returns the bone segment models and their plane cut nodes ordered by segment index.
+    Nodes are reused between updates, they are only added or removed when the number of
+    bone segments changes.
+    """
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    planeCutsFolder = self.folderRegistry.getFolderItemID("Plane Cuts",createIfMissing=True)
+    cutBonePiecesFolder = self.folderRegistry.getFolderItemID("Cut Bone Pieces",createIfMissing=True)
 
-    planeCutsFolder = shNode.GetItemByName("Plane Cuts")
-    shNode.RemoveItem(planeCutsFolder)
-    cutBonePiecesFolder = shNode.GetItemByName("Cut Bone Pieces")
-    shNode.RemoveItem(cutBonePiecesFolder)
-    planeCutsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Plane Cuts")
-    cutBonePiecesFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Cut Bone Pieces")
+    cutBonePiecesList = self.folderRegistry.getNodesOfFolder("Cut Bone Pieces")
+    planeCutsList = self.folderRegistry.getNodesOfFolder("Plane Cuts")
 
     aux = slicer.mrmlScene.GetNodeByID('vtkMRMLColorTableNodeFileMediumChartColors.txt')
     colorTable = aux.GetLookupTable()
     nColors = colorTable.GetNumberOfColors()
 
-    for i in range(0,len(boneCutPlanesList)):
-      if i==0:
-        modelName = "Bone Segment %d" % 0
-        indColor = 0
-      elif i!=(len(boneCutPlanesList)-1):
-        #Only one execution per bone segment between two planes
-        if i%2 == 0:
-          continue
-        modelName = "Bone Segment %d" % (i//2 +1)
-        indColor = (i//2 +1)%(nColors-1)
-      else:
-        modelName = "Bone Segment %d" % (len(boneCutPlanesList)-2)
-        indColor = (i//2 +1)%(nColors-1)
-
+    for segmentIndex in range(len(cutBonePiecesList),numberOfBoneSegments):
       modelNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLModelNode")
-      modelNode.SetName(modelName)
+      modelNode.SetName("Bone Segment %d" % segmentIndex)
       slicer.mrmlScene.AddNode(modelNode)
       modelNode.CreateDefaultDisplayNodes()
       modelDisplayNode = modelNode.GetDisplayNode()
-      correctedBoneViewNode = slicer.mrmlScene.GetSingletonNode("2", "vtkMRMLViewNode")
-      modelDisplayNode.AddViewNodeID(correctedBoneViewNode.GetID())
+      self.showDisplayNodeInView(modelDisplayNode,"2")
 
       #Set color of the model
+      indColor = segmentIndex%(nColors-1)
       colorwithalpha = colorTable.GetTableValue(indColor)
       color = [colorwithalpha[0],colorwithalpha[1],colorwithalpha[2]]
       modelDisplayNode.SetColor(color)
 
+      modelNodeItemID = shNode.GetItemByDataNode(modelNode)
+      shNode.SetItemParent(modelNodeItemID, cutBonePiecesFolder)
+      cutBonePiecesList.append(modelNode)
+
+    for segmentIndex in range(len(planeCutsList),numberOfBoneSegments):
       dynamicModelerNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLDynamicModelerNode")
       dynamicModelerNode.SetToolName("Plane cut")
-      dynamicModelerNode.SetNodeReferenceID("PlaneCut.InputModel", boneModelNode.GetID())
-      if i==0:
-        dynamicModelerNode.AddNodeReferenceID("PlaneCut.InputPlane", boneCutPlanesList[0].GetID()) 
-        dynamicModelerNode.SetNodeReferenceID("PlaneCut.OutputNegativeModel", modelNode.GetID())
-      elif i!=(len(boneCutPlanesList)-1):
-        dynamicModelerNode.AddNodeReferenceID("PlaneCut.InputPlane", boneCutPlanesList[i+1].GetID())
-        dynamicModelerNode.AddNodeReferenceID("PlaneCut.InputPlane", boneCutPlanesList[i].GetID())  
-        dynamicModelerNode.SetNodeReferenceID("PlaneCut.OutputNegativeModel", modelNode.GetID())
-      else:
-        dynamicModelerNode.AddNodeReferenceID("PlaneCut.InputPlane", boneCutPlanesList[len(boneCutPlanesList)-1].GetID()) 
-        dynamicModelerNode.SetNodeReferenceID("PlaneCut.OutputPositiveModel", modelNode.GetID())
       dynamicModelerNode.SetAttribute("OperationType", "Difference")
-        
+
       dynamicModelerNodeItemID = shNode.GetItemByDataNode(dynamicModelerNode)
       shNode.SetItemParent(dynamicModelerNodeItemID, planeCutsFolder)
-      modelNodeItemID = shNode.GetItemByDataNode(modelNode)
-      shNode.SetItemParent(modelNodeItemID, cutBonePiecesFolder)
-  
-      slicer.modules.dynamicmodeler.logic().RunDynamicModelerTool(dynamicModelerNode)
+      planeCutsList.append(dynamicModelerNode)
+
+    #Segments that are left over when plane pairs are removed
+    for node in cutBonePiecesList[numberOfBoneSegments:] + planeCutsList[numberOfBoneSegments:]:
+      shNode.RemoveItem(shNode.GetItemByDataNode(node))
+
+    return cutBonePiecesList[:numberOfBoneSegments], planeCutsList[:numberOfBoneSegments]
+
+  def updateBonePiecesAdjacentToCutPlane(self,planeNode):
+    self.updateBonePiecesAdjacentToCutPlanes([planeNode])
 
+  @timedStage
+  def updateBonePiecesAdjacentToCutPlanes(self,planeNodesList):
+    """
+    Recompute only the bone segments bounded by the moved cut planes and the corrected
+    position transforms of the bone segments after the first moved plane pair. If the existing plane cuts
+    do not correspond to the current bone cut planes a full update is done instead.
+    """
+    boneModel = self.getBoneModelForPlaneCuts()
+
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    boneCutPlanesList = self.getBoneCutPlanesList()
+    planeCutsFolder = self.folderRegistry.getFolderItemID("Plane Cuts")
+    cutBonePiecesFolder = self.folderRegistry.getFolderItemID("Cut Bone Pieces")
+    boneCutPlanesIDsList = [boneCutPlane.GetID() for boneCutPlane in boneCutPlanesList]
+
+    incrementalUpdateIsPossible = (
+      len(planeNodesList) > 0 and
+      all((planeNode is not None) and (planeNode.GetID() in boneCutPlanesIDsList) for planeNode in planeNodesList) and
+      planeCutsFolder and cutBonePiecesFolder
+    )
+    if incrementalUpdateIsPossible:
+      planeCutsList = self.folderRegistry.getNodesOfFolder("Plane Cuts")
+      cutBonePiecesList = self.folderRegistry.getNodesOfFolder("Cut Bone Pieces")
+      incrementalUpdateIsPossible = self.bonePiecesCorrespondToBoneCutPlanes(boneModel,boneCutPlanesList,planeCutsList,cutBonePiecesList)
+
+    if not incrementalUpdateIsPossible:
+      self.createAndUpdateDynamicModelerNodes()
+      self.transformBonePiecesToCorrectedPosition()
+      return
+
+    boneCutPlanesIndexes = [boneCutPlanesIDsList.index(planeNode.GetID()) for planeNode in planeNodesList]
+    segmentIndexesList = sorted(set(self.getBoneSegmentIndexBoundedByCutPlane(boneCutPlaneIndex) for boneCutPlaneIndex in boneCutPlanesIndexes))
+    self.runPlaneCutsOfBoneSegments(segmentIndexesList,boneModel,boneCutPlanesList,cutBonePiecesList,planeCutsList)
+
+    #Only the segments after the first moved plane pair change their corrected position
+    self.updateCorrectedPositionTransformsOfBonePieces(boneCutPlanesList,cutBonePiecesList,min(boneCutPlanesIndexes)//2 +1)
+
+  def bonePiecesCorrespondToBoneCutPlanes(self,boneModel,boneCutPlanesList,planeCutsList,cutBonePiecesList):
+    numberOfBoneSegments = self.getNumberOfBoneSegments(boneCutPlanesList)
+    if (len(planeCutsList) != numberOfBoneSegments) or (len(cutBonePiecesList) != numberOfBoneSegments):
+      return False
+
+    for segmentIndex in range(numberOfBoneSegments):
+      dynamicModelerNode = planeCutsList[segmentIndex]
+      segmentCutPlanesList, outputReferenceRole = self.getCutPlanesAndOutputReferenceRoleOfBoneSegment(segmentIndex,boneCutPlanesList)
+      if dynamicModelerNode.GetNodeReferenceID("PlaneCut.InputModel") != boneModel.GetID():
+        return False
+      if dynamicModelerNode.GetNodeReferenceID(outputReferenceRole) != cutBonePiecesList[segmentIndex].GetID():
+        return False
+      inputPlanesIDsList = [
+        dynamicModelerNode.GetNthNodeReferenceID("PlaneCut.InputPlane",j)
+        for j in range(dynamicModelerNode.GetNumberOfNodeReferences("PlaneCut.InputPlane"))
+      ]
+      if inputPlanesIDsList != [segmentCutPlane.GetID() for segmentCutPlane in segmentCutPlanesList]:
+        return False
+      if (segmentIndex != 0) and (cutBonePiecesList[segmentIndex].GetParentTransformNode() is None):
+        return False
+
+    return True
+
+  @timedStage
   def transformBonePiecesToCorrectedPosition(self):
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    bonePiecesTransformFolder = shNode.GetItemByName("Bone Pieces Transforms")
-    shNode.RemoveItem(bonePiecesTransformFolder)
-    bonePiecesTransformFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Bone Pieces Transforms")
+    bonePiecesTransformFolder = self.folderRegistry.getFolderItemID("Bone Pieces Transforms",createIfMissing=True)
  
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    cutBonePiecesFolder = shNode.GetItemByName("Cut Bone Pieces")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
-    cutBonePiecesList = createListFromFolderID(cutBonePiecesFolder)
-
-    boneCutPlane1ToBoneCutPlane0TransformList = []
-
-    #for i in range(len(boneCutPlanesList)-1,-1,-2):
-    for i in range(0,len(boneCutPlanesList),2):
-      boneCutPlane0matrix = vtk.vtkMatrix4x4()
-      boneCutPlane1matrix = vtk.vtkMatrix4x4()
-      boneCutPlanesList[i].GetPlaneToWorldMatrix(boneCutPlane0matrix)
-      boneCutPlanesList[i+1].GetPlaneToWorldMatrix(boneCutPlane1matrix)
-      boneCutPlane0X = np.array([boneCutPlane0matrix.GetElement(0,0),boneCutPlane0matrix.GetElement(1,0),boneCutPlane0matrix.GetElement(2,0)])
-      boneCutPlane0Y = np.array([boneCutPlane0matrix.GetElement(0,1),boneCutPlane0matrix.GetElement(1,1),boneCutPlane0matrix.GetElement(2,1)])
-      boneCutPlane0Z = np.array([boneCutPlane0matrix.GetElement(0,2),boneCutPlane0matrix.GetElement(1,2),boneCutPlane0matrix.GetElement(2,2)])
-      boneCutPlane0Origin = np.array([boneCutPlane0matrix.GetElement(0,3),boneCutPlane0matrix.GetElement(1,3),boneCutPlane0matrix.GetElement(2,3)])
-      boneCutPlane1X = np.array([boneCutPlane1matrix.GetElement(0,0),boneCutPlane1matrix.GetElement(1,0),boneCutPlane1matrix.GetElement(2,0)])
-      boneCutPlane1Y = np.array([boneCutPlane1matrix.GetElement(0,1),boneCutPlane1matrix.GetElement(1,1),boneCutPlane1matrix.GetElement(2,1)])
-      boneCutPlane1Z = np.array([boneCutPlane1matrix.GetElement(0,2),boneCutPlane1matrix.GetElement(1,2),boneCutPlane1matrix.GetElement(2,2)])
-      boneCutPlane1Origin = np.array([boneCutPlane1matrix.GetElement(0,3),boneCutPlane1matrix.GetElement(1,3),boneCutPlane1matrix.GetElement(2,3)])
-
-      epsilon = 0.0001
-      if not (vtk.vtkMath.Dot(boneCutPlane1Z, boneCutPlane0Z) >= 1.0 - epsilon):
-        angleRadians = vtk.vtkMath.AngleBetweenVectors(boneCutPlane1Z, boneCutPlane0Z)
-        rotationAxis = [0,0,0]
-        vtk.vtkMath.Cross(boneCutPlane0Z, boneCutPlane1Z, rotationAxis)
-        if (vtk.vtkMath.Norm(rotationAxis) < epsilon):
-          #New + old normals are facing opposite directions.
-          #Find a perpendicular axis to flip around.
-          vtk.vtkMath.Perpendiculars(boneCutPlane0Z, rotationAxis, None, 0)
-        rotationAxis = rotationAxis/np.linalg.norm(rotationAxis)
-        finalTransform = vtk.vtkTransform()
-        finalTransform.PostMultiply()
-        finalTransform.RotateWXYZ(vtk.vtkMath.DegreesFromRadians(angleRadians), rotationAxis)
-
-        finalTransform.TransformVector(boneCutPlane0X, boneCutPlane1X)
-        finalTransform.TransformVector(boneCutPlane0Y, boneCutPlane1Y)
-
-      boneCutPlane0ToWorldRotationMatrix = self.getAxes1ToWorldRotationMatrix(boneCutPlane0X,boneCutPlane0Y,boneCutPlane0Z)
-      boneCutPlane1ToWorldRotationMatrix = self.getAxes1ToWorldRotationMatrix(boneCutPlane1X,boneCutPlane1Y,boneCutPlane1Z)
-
-      boneCutPlane1ToboneCutPlane0RotationMatrix = self.getAxes1ToAxes2RotationMatrix(boneCutPlane1ToWorldRotationMatrix,boneCutPlane0ToWorldRotationMatrix)
-
-      boneCutPlane1ToboneCutPlane0Transform = vtk.vtkTransform()
-      boneCutPlane1ToboneCutPlane0Transform.PostMultiply()
-      boneCutPlane1ToboneCutPlane0Transform.Translate(-boneCutPlane1Origin)
-      boneCutPlane1ToboneCutPlane0Transform.Concatenate(boneCutPlane1ToboneCutPlane0RotationMatrix)
-      boneCutPlane1ToboneCutPlane0Transform.Translate(boneCutPlane0Origin)
-
-      boneCutPlane1ToBoneCutPlane0TransformList.append(boneCutPlane1ToboneCutPlane0Transform)
-
-    for i in range(len(cutBonePiecesList)-1,0,-1):
-      connectSegmentToPreviousSegmentTransformNode = slicer.vtkMRMLLinearTransformNode()
-      connectSegmentToPreviousSegmentTransformNode.SetName(f"ConnectSegment{i}ToSegment{i-1} Transform")
-      slicer.mrmlScene.AddNode(connectSegmentToPreviousSegmentTransformNode)
+    boneCutPlanesList = self.getBoneCutPlanesList()
+    cutBonePiecesList = self.folderRegistry.getNodesOfFolder("Cut Bone Pieces")
+    bonePiecesTransformsList = self.folderRegistry.getNodesOfFolder("Bone Pieces Transforms")
 
-      connectSegmentToPreviousSegmentTransform = vtk.vtkTransform()
-      connectSegmentToPreviousSegmentTransform.PostMultiply()
-      for j in range(0,i):
-        connectSegmentToPreviousSegmentTransform.Concatenate(boneCutPlane1ToBoneCutPlane0TransformList[i-j-1].GetMatrix())
+    correctedPositionMatrices = self.getCorrectedPositionMatricesOfBoneSegments(boneCutPlanesList)
 
-      connectSegmentToPreviousSegmentTransformNode.SetMatrixTransformToParent(connectSegmentToPreviousSegmentTransform.GetMatrix())
-
-      cutBonePiecesList[i].SetAndObserveTransformNodeID(connectSegmentToPreviousSegmentTransformNode.GetID())
+    #Transform nodes are reused, the one of segment i is the (i-1)th child of the folder
+    for i in range(1,len(cutBonePiecesList)):
+      if i-1 < len(bonePiecesTransformsList):
+        connectSegmentToPreviousSegmentTransformNode = bonePiecesTransformsList[i-1]
+      else:
+        connectSegmentToPreviousSegmentTransformNode = slicer.vtkMRMLLinearTransformNode()
+        slicer.mrmlScene.AddNode(connectSegmentToPreviousSegmentTransformNode)
+        connectSegmentToPreviousSegmentTransformNodeItemID = shNode.GetItemByDataNode(connectSegmentToPreviousSegmentTransformNode)
+        shNode.SetItemParent(connectSegmentToPreviousSegmentTransformNodeItemID, bonePiecesTransformFolder)
+      connectSegmentToPreviousSegmentTransformNode.SetName(f"ConnectSegment{i}ToSegment{i-1} Transform")
 
-      connectSegmentToPreviousSegmentTransformNodeItemID = shNode.GetItemByDataNode(connectSegmentToPreviousSegmentTransformNode)
-      shNode.SetItemParent(connectSegmentToPreviousSegmentTransformNodeItemID, bonePiecesTransformFolder)
+      slicer.util.updateTransformMatrixFromArray(connectSegmentToPreviousSegmentTransformNode,correctedPositionMatrices[i])
 
+      if cutBonePiecesList[i].GetTransformNodeID() != connectSegmentToPreviousSegmentTransformNode.GetID():
+        cutBonePiecesList[i].SetAndObserveTransformNodeID(connectSegmentToPreviousSegmentTransformNode.GetID())
 
-  def getIntersectionBetweenModelAnd1Plane(self,modelNode,planeNode,intersectionModel):
-    plane = vtk.vtkPlane()
-    origin = [0,0,0]
-    normal = [0,0,0]
-    planeNode.GetOrigin(origin)
-    planeNode.GetNormal(normal)
-    plane.SetOrigin(origin)
-    plane.SetNormal(normal)
+    if len(cutBonePiecesList) > 0:
+      cutBonePiecesList[0].SetAndObserveTransformNodeID(None)
 
-    cutter = vtk.vtkCutter()
-    cutter.SetInputData(modelNode.GetPolyData())
-    cutter.SetCutFunction(plane)
-    cutter.Update()
+    for transformNode in bonePiecesTransformsList[max(len(cutBonePiecesList)-1,0):]:
+      shNode.RemoveItem(shNode.GetItemByDataNode(transformNode))
 
-    intersectionModel.SetAndObservePolyData(cutter.GetOutput())
-  
-  def getCentroid(self,model):
-    pd = model.GetPolyData().GetPoints().GetData()
-    from vtk.util.numpy_support import vtk_to_numpy
-    return np.average(vtk_to_numpy(pd), axis=0)
-
-  def getAxes1ToWorldRotationMatrix(self,axis1X,axis1Y,axis1Z):
-    axes1ToWorldRotationMatrix = vtk.vtkMatrix4x4()
-    axes1ToWorldRotationMatrix.DeepCopy((1, 0, 0, 0,
-                                         0, 1, 0, 0,
-                                         0, 0, 1, 0,
-                                         0, 0, 0, 1))
-    
-    axes1ToWorldRotationMatrix.SetElement(0,0,axis1X[0])
-    axes1ToWorldRotationMatrix.SetElement(0,1,axis1X[1])
-    axes1ToWorldRotationMatrix.SetElement(0,2,axis1X[2])
-    axes1ToWorldRotationMatrix.SetElement(1,0,axis1Y[0])
-    axes1ToWorldRotationMatrix.SetElement(1,1,axis1Y[1])
-    axes1ToWorldRotationMatrix.SetElement(1,2,axis1Y[2])
-    axes1ToWorldRotationMatrix.SetElement(2,0,axis1Z[0])
-    axes1ToWorldRotationMatrix.SetElement(2,1,axis1Z[1])
-    axes1ToWorldRotationMatrix.SetElement(2,2,axis1Z[2])
-
-    return axes1ToWorldRotationMatrix
-  
-  def getAxes1ToAxes2RotationMatrix(self,axes1ToWorldRotationMatrix,axes2ToWorldRotationMatrix):
-    worldToAxes2RotationMatrix = vtk.vtkMatrix4x4()
-    worldToAxes2RotationMatrix.DeepCopy(axes2ToWorldRotationMatrix)
-    worldToAxes2RotationMatrix.Invert()
-    
-    axes1ToAxes2RotationMatrix = vtk.vtkMatrix4x4()
-    vtk.vtkMatrix4x4.Multiply4x4(worldToAxes2RotationMatrix, axes1ToWorldRotationMatrix, axes1ToAxes2RotationMatrix)
+  @timedStage
+  def updateCorrectedPositionTransformsOfBonePieces(self,boneCutPlanesList,cutBonePiecesList,firstSegmentIndex):
+    correctedPositionMatrices = self.getCorrectedPositionMatricesOfBoneSegments(boneCutPlanesList)
 
-    return axes1ToAxes2RotationMatrix
+    for i in range(max(firstSegmentIndex,1),len(cutBonePiecesList)):
+      connectSegmentToPreviousSegmentTransformNode = cutBonePiecesList[i].GetParentTransformNode()
+      slicer.util.updateTransformMatrixFromArray(connectSegmentToPreviousSegmentTransformNode,correctedPositionMatrices[i])
 
+  def getCorrectedPositionMatricesOfBoneSegments(self,boneCutPlanesList):
+    """
+    Returns a (numberOfBoneSegments,4,4) array with the transform that takes each bone segment
+    to its corrected position. The transform of segment i is the one of segment i-1 followed by
+    the transform of the plane pair in between them, so the whole chain is a prefix product.
+    """
+    planesToWorldMatrices = self.getPlanesToWorldMatricesArray(boneCutPlanesList)
+    cutResultsCache = self.getCutResultsCache()
+    cutResultsCacheKey = ("correctedPositionMatrices",) + self.getQuantizedPlanesKey(planesToWorldMatrices[:,:3,3],planesToWorldMatrices[:,:3,:3])
+    cachedCorrectedPositionMatrices = cutResultsCache.get(cutResultsCacheKey)
+    if cachedCorrectedPositionMatrices is not None:
+      return cachedCorrectedPositionMatrices.copy()
+
+    boneCutPlane1ToBoneCutPlane0Matrices = self.getBoneCutPlane1ToBoneCutPlane0MatricesArray(planesToWorldMatrices)
+
+    correctedPositionMatrices = np.zeros((len(boneCutPlane1ToBoneCutPlane0Matrices)+1,4,4))
+    correctedPositionMatrices[0] = np.eye(4)
+    for i in range(len(boneCutPlane1ToBoneCutPlane0Matrices)):
+      correctedPositionMatrices[i+1] = correctedPositionMatrices[i] @ boneCutPlane1ToBoneCutPlane0Matrices[i]
+
+    cutResultsCache.add(cutResultsCacheKey,correctedPositionMatrices.copy(),correctedPositionMatrices.nbytes/1024)
+    return correctedPositionMatrices
+
+  def getPlanesToWorldMatricesArray(self,planesList):
+    planesToWorldMatrices = np.zeros((len(planesList),4,4))
+    planeToWorldMatrix = vtk.vtkMatrix4x4()
+    for i in range(len(planesList)):
+      planesList[i].GetPlaneToWorldMatrix(planeToWorldMatrix)
+      planesToWorldMatrices[i] = slicer.util.arrayFromVTKMatrix(planeToWorldMatrix)
+    return planesToWorldMatrices
+
+  def getBoneCutPlane1ToBoneCutPlane0MatricesArray(self,planesToWorldMatrices):
+    boneCutPlane0Axes = planesToWorldMatrices[0::2,:3,:3]
+    boneCutPlane1Axes = planesToWorldMatrices[1::2,:3,:3].copy()
+    boneCutPlane0Origins = planesToWorldMatrices[0::2,:3,3]
+    boneCutPlane1Origins = planesToWorldMatrices[1::2,:3,3]
+    boneCutPlane0Z = boneCutPlane0Axes[:,:,2]
+    boneCutPlane1Z = boneCutPlane1Axes[:,:,2]
+
+    epsilon = 0.0001
+    dotProducts = np.sum(boneCutPlane0Z*boneCutPlane1Z,axis=1)
+    rotationAxes = np.cross(boneCutPlane0Z,boneCutPlane1Z)
+    rotationAxesNorms = np.linalg.norm(rotationAxes,axis=1)
+    anglesRadians = np.arctan2(rotationAxesNorms,dotProducts)
+    oppositeNormals = rotationAxesNorms < epsilon
+    if np.any(oppositeNormals):
+      #New + old normals are facing opposite directions.
+      #Find a perpendicular axis to flip around.
+      rotationAxes[oppositeNormals] = getPerpendicularsOfVectors(boneCutPlane0Z[oppositeNormals])[0]
+    rotationAxes = rotationAxes/np.linalg.norm(rotationAxes,axis=1)[:,np.newaxis]
+
+    #Rodrigues formula of the rotations that take the normal of plane0 to the normal of plane1
+    crossProductMatrices = np.zeros((len(rotationAxes),3,3))
+    crossProductMatrices[:,0,1] = -rotationAxes[:,2]
+    crossProductMatrices[:,0,2] = rotationAxes[:,1]
+    crossProductMatrices[:,1,0] = rotationAxes[:,2]
+    crossProductMatrices[:,1,2] = -rotationAxes[:,0]
+    crossProductMatrices[:,2,0] = -rotationAxes[:,1]
+    crossProductMatrices[:,2,1] = rotationAxes[:,0]
+    sines = np.sin(anglesRadians)[:,np.newaxis,np.newaxis]
+    cosines = np.cos(anglesRadians)[:,np.newaxis,np.newaxis]
+    rotations = np.eye(3) + sines*crossProductMatrices + (1-cosines)*(crossProductMatrices @ crossProductMatrices)
+
+    #When normals differ, X and Y axes of plane1 are the rotated X and Y axes of plane0
+    differentNormals = ~(dotProducts >= 1.0 - epsilon)
+    rotatedBoneCutPlane0Axes = rotations @ boneCutPlane0Axes
+    boneCutPlane1Axes[differentNormals,:,0:2] = rotatedBoneCutPlane0Axes[differentNormals,:,0:2]
+
+    boneCutPlane1ToBoneCutPlane0Rotations = boneCutPlane0Axes @ np.transpose(boneCutPlane1Axes,(0,2,1))
+
+    boneCutPlane1ToBoneCutPlane0Matrices = np.zeros((len(boneCutPlane0Axes),4,4))
+    boneCutPlane1ToBoneCutPlane0Matrices[:,:3,:3] = boneCutPlane1ToBoneCutPlane0Rotations
+    boneCutPlane1ToBoneCutPlane0Matrices[:,:3,3] = boneCutPlane0Origins - np.einsum('nij,nj->ni',boneCutPlane1ToBoneCutPlane0Rotations,boneCutPlane1Origins)
+    boneCutPlane1ToBoneCutPlane0Matrices[:,3,3] = 1
+
+    return boneCutPlane1ToBoneCutPlane0Matrices
+
+  @timedStage
   def centerBoneCutPlanes(self):
     parameterNode = self.getParameterNode()
     nonDecimatedBoneModel = parameterNode.GetNodeReference("boneModel")
      
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
+    boneCutPlanesList = self.getBoneCutPlanesList()
 
     boneModel = nonDecimatedBoneModel
 
     self.removeBoneCutPlanesObservers()
 
     for i in range(len(boneCutPlanesList)):
-      planeNode = boneCutPlanesList[i]
-      intersectionCentroid = self.getCentroidOfIntersectionOfModelWithPlane(boneModel,planeNode)
-      planeNode.SetOrigin(intersectionCentroid)
+      self.setOriginOfPlaneToCentroidOfIntersectionWithModel(boneModel,boneCutPlanesList[i])
 
     self.addBoneCutPlanesObservers()
 
@@ -841,23 +1810,22 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
 
   def addBoneCutPlanesObservers(self):
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
+    boneCutPlanesList = self.getBoneCutPlanesList()
 
     for i in range(len(boneCutPlanesList)):
       observer = boneCutPlanesList[i].AddObserver(slicer.vtkMRMLMarkupsNode.PointModifiedEvent,self.onPlaneModifiedTimer)
       self.boneCutPlaneObserversAndNodeIDList.append([observer,boneCutPlanesList[i].GetID()])
+      self.addBoneCutPlaneInteractionObservers(boneCutPlanesList[i])
 
   def removeBoneCutPlanesObservers(self):
-    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
-
-    for i in range(len(boneCutPlanesList)):
-      boneCutPlane = slicer.mrmlScene.GetNodeByID(self.boneCutPlaneObserversAndNodeIDList[i][1])
-      boneCutPlane.RemoveObserver(self.boneCutPlaneObserversAndNodeIDList[i][0])
-    self.boneCutPlaneObserversAndNodeIDList = []  
+    for observer, boneCutPlaneID in self.boneCutPlaneObserversAndNodeIDList:
+      boneCutPlane = slicer.mrmlScene.GetNodeByID(boneCutPlaneID)
+      if boneCutPlane is not None:
+        boneCutPlane.RemoveObserver(observer)
+    self.boneCutPlaneObserversAndNodeIDList = []
+    self.removeBoneCutPlanesInteractionObservers()
 
+  @timedStage
   def automaticNormalAndOriginDefinitionOfBoneCutPlanes(self):
     if not self.boneCutPlanesNumberIsEven():
       slicer.util.errorDisplay("ERROR: Bone cut planes number is odd, it should be even.")
@@ -866,13 +1834,11 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     self.centerBoneCutPlanes()
 
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
+    boneCutPlanesList = self.getBoneCutPlanesList()
 
     self.createAligmentPlanes()
 
-    aligmentPlanesFolder = shNode.GetItemByName("Aligment Planes")
-    aligmentPlanesList = createListFromFolderID(aligmentPlanesFolder)
+    aligmentPlanesList = self.folderRegistry.getNodesOfFolder("Aligment Planes")
 
     listOfPlanesToUpdate = [aligmentPlanesList[0]] + boneCutPlanesList + [aligmentPlanesList[1]]
 
@@ -889,11 +1855,8 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     multiplierOfMaxRadius = float(parameterNode.GetParameter("multiplierOfMaxRadius"))
 
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    aligmentPlanesFolder = shNode.GetItemByName("Aligment Planes")
-    shNode.RemoveItem(aligmentPlanesFolder)
-    aligmentPlanesFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Aligment Planes")
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
+    aligmentPlanesFolder = self.folderRegistry.recreateFolder("Aligment Planes")
+    boneCutPlanesList = self.getBoneCutPlanesList()
 
     #Create start aligment plane
     startAligmentPlane = slicer.mrmlScene.CreateNodeByClass("vtkMRMLMarkupsPlaneNode")
@@ -906,8 +1869,7 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
 
     #display node of the plane
     displayNode = startAligmentPlane.GetDisplayNode()
-    deformedBoneViewNode = slicer.mrmlScene.GetSingletonNode("1", "vtkMRMLViewNode")
-    displayNode.AddViewNodeID(deformedBoneViewNode.GetID())
+    self.showDisplayNodeInView(displayNode,"1")
 
     #set color of planes
     aux = slicer.mrmlScene.GetNodeByID('vtkMRMLColorTableNodeFileMediumChartColors.txt')
@@ -941,8 +1903,7 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
 
     #display node of the plane
     displayNode = endAligmentPlane.GetDisplayNode()
-    deformedBoneViewNode = slicer.mrmlScene.GetSingletonNode("1", "vtkMRMLViewNode")
-    displayNode.AddViewNodeID(deformedBoneViewNode.GetID())
+    self.showDisplayNodeInView(displayNode,"1")
 
     displayNode.SetSelectedColor(color)
 
@@ -958,87 +1919,170 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     endAligmentPlane.SetOrigin(lastBoneCutPlaneOrigin+lastBoneCutPlaneZ*multiplierOfMaxRadius*maxRadiusOfIntersection)
     self.setOriginOfPlaneToCentroidOfIntersectionWithModel(boneModel,endAligmentPlane)
 
+  @timedStage
   def automaticNormalAndOriginDefinitionOfPlanes(self,planeList):
     parameterNode = self.getParameterNode()
     boneModel = parameterNode.GetNodeReference("boneModel")
-
-    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-
-    for i in range(0,len(planeList),2):
-      intersectionsForCentroidCalculationFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Intersections For Centroid Calculation")
-
-      lineStartPos = np.array([0,0,0])
-      lineEndPos = np.array([0,0,0])
-      planeList[i].GetOrigin(lineStartPos)
-      planeList[i+1].GetOrigin(lineEndPos)
-
-      numberOfRepetitionsOfPositioningAlgorithm = 5
-      for k in range(numberOfRepetitionsOfPositioningAlgorithm):
-        oldLineStartPos = lineStartPos
-        oldLineEndPos = lineEndPos
-
-        planeNormal = (lineEndPos-lineStartPos)/np.linalg.norm(lineEndPos-lineStartPos)
-
-        intersectionStart = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode','Intersection Start %d' % i)
-        intersectionEnd = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode','Intersection End %d' % i)
-        intersectionStart.CreateDefaultDisplayNodes()
-        intersectionEnd.CreateDefaultDisplayNodes()
-        
-        intersectionStartModelItemID = shNode.GetItemByDataNode(intersectionStart)
-        shNode.SetItemParent(intersectionStartModelItemID, intersectionsForCentroidCalculationFolder)
-        intersectionEndModelItemID = shNode.GetItemByDataNode(intersectionEnd)
-        shNode.SetItemParent(intersectionEndModelItemID, intersectionsForCentroidCalculationFolder)
-        
-        self.getIntersectionBetweenModelAnd1PlaneWithNormalAndOrigin_2(boneModel,planeNormal,lineStartPos,intersectionStart)
-        self.getIntersectionBetweenModelAnd1PlaneWithNormalAndOrigin_2(boneModel,planeNormal,lineEndPos,intersectionEnd)
-        lineStartPos = self.getCentroid(intersectionStart)
-        lineEndPos = self.getCentroid(intersectionEnd)
-
-        error = np.linalg.norm(lineStartPos-oldLineStartPos) + np.linalg.norm(lineEndPos-oldLineEndPos)
-        if error < 0.01:# Unavoidable errors because of bone shape are about 0.6-0.8mm
-          break
-      
-      planeList[i].SetOrigin(lineStartPos)
-      planeList[i+1].SetOrigin(lineEndPos)
+    slicingService = self.getSlicingService()
+    maximumNumberOfIterations = int(float(parameterNode.GetParameter("positioningMaximumNumberOfIterations")))
+    positioningTolerance = float(parameterNode.GetParameter("positioningTolerance"))
+    accelerationChecked = parameterNode.GetParameter("accelerateAutomaticPositioning") == "True"
+    warmStartChecked = parameterNode.GetParameter("warmStartAutomaticPositioning") == "True"
+
+    planesOrigins = np.array([self.getOriginAndNormalOfPlane(planeNode)[0] for planeNode in planeList])
+    numberOfPlanePairs = len(planeList)//2
+    #Each row holds the start and end position of the centroid line of a plane pair
+    linesPositions = np.concatenate((planesOrigins[0:2*numberOfPlanePairs:2],planesOrigins[1:2*numberOfPlanePairs:2]),axis=1)
+
+    #Solutions are reused only if the bone model and the centroid definition did not change
+    positioningCacheKey = (boneModel.GetID(), boneModel.GetPolyData().GetMTime(), slicingService.useAreaWeightedCentroids)
+    planePairsIDs = [(planeList[2*i].GetID(),planeList[2*i+1].GetID()) for i in range(numberOfPlanePairs)]
+    warmStartedPlanePairs = np.zeros(numberOfPlanePairs,dtype=bool)
+    if warmStartChecked:
+      for i in range(numberOfPlanePairs):
+        cachedSolution = self.planePairsPositioningCache.get(planePairsIDs[i])
+        if (cachedSolution is None) or (cachedSolution["cacheKey"] != positioningCacheKey):
+          continue
+        linesPositions[i,:3] = self.getProjectionOfPointOnLine(linesPositions[i,:3],cachedSolution["lineStartPos"],cachedSolution["lineEndPos"])
+        linesPositions[i,3:] = self.getProjectionOfPointOnLine(linesPositions[i,3:],cachedSolution["lineStartPos"],cachedSolution["lineEndPos"])
+        warmStartedPlanePairs[i] = True
+
+    accelerators = [AndersonAcceleration() if accelerationChecked else None for i in range(numberOfPlanePairs)]
+    #Last evaluated centroids, these are the positions assigned to the planes
+    lastCentroidsPositions = linesPositions.copy()
+    residuals = np.full(numberOfPlanePairs,np.nan)
+    numberOfIterations = np.zeros(numberOfPlanePairs,dtype=int)
+    #Whole positioning time of each plane pair: its sections, its acceleration steps, an equal share
+    #of the work done for all the active pairs at once and writing its planes
+    computationTimes = np.zeros(numberOfPlanePairs)
+
+    #All plane pairs advance together in each iteration, the converged ones are left as they are
+    activePlanePairs = np.ones(numberOfPlanePairs,dtype=bool)
+    for k in range(maximumNumberOfIterations):
+      activeIndexes = np.nonzero(activePlanePairs)[0]
+      numberOfActivePlanePairs = len(activeIndexes)
+      if numberOfActivePlanePairs == 0:
+        break
+      iterationStartTime = time.perf_counter()
+      pairsTimes = np.zeros(numberOfActivePlanePairs)
+
+      oldLinesPositions = linesPositions[activeIndexes]
+      planesNormals = oldLinesPositions[:,3:]-oldLinesPositions[:,:3]
+      planesNormals = planesNormals/np.linalg.norm(planesNormals,axis=1)[:,np.newaxis]
+
+      centroids = slicingService.getCentroidsOfIntersections(
+        boneModel,
+        np.concatenate((oldLinesPositions[:,:3],oldLinesPositions[:,3:])),
+        np.concatenate((planesNormals,planesNormals))
+      )
+      sectionsTimes = slicingService.lastComputationTimes
+      pairsTimes += sectionsTimes[:numberOfActivePlanePairs] + sectionsTimes[numberOfActivePlanePairs:]
+      newLinesPositions = np.concatenate((centroids[:numberOfActivePlanePairs],centroids[numberOfActivePlanePairs:]),axis=1)
+
+      #Planes that do not cut the bone keep their position
+      planesDoNotCutBone = np.isnan(newLinesPositions).any(axis=1)
+      newLinesPositions[planesDoNotCutBone] = oldLinesPositions[planesDoNotCutBone]
+      lastCentroidsPositions[activeIndexes] = newLinesPositions
+
+      errors = (
+        np.linalg.norm(newLinesPositions[:,:3]-oldLinesPositions[:,:3],axis=1) +
+        np.linalg.norm(newLinesPositions[:,3:]-oldLinesPositions[:,3:],axis=1)
+      )
+      residuals[activeIndexes] = errors
+      numberOfIterations[activeIndexes] += 1
+      # Unavoidable errors because of bone shape are about 0.6-0.8mm
+      convergedPlanePairs = (errors < positioningTolerance) | planesDoNotCutBone
+      activePlanePairs[activeIndexes[convergedPlanePairs]] = False
+
+      for j in range(numberOfActivePlanePairs):
+        i = activeIndexes[j]
+        if convergedPlanePairs[j] or (accelerators[i] is None):
+          linesPositions[i] = newLinesPositions[j]
+        else:
+          accelerationStartTime = time.perf_counter()
+          linesPositions[i] = accelerators[i].getNextIterate(oldLinesPositions[j],newLinesPositions[j])
+          pairsTimes[j] += time.perf_counter() - accelerationStartTime
+
+      sharedTime = time.perf_counter() - iterationStartTime - pairsTimes.sum()
+      computationTimes[activeIndexes] += pairsTimes + max(sharedTime,0)/numberOfActivePlanePairs
+
+    self.lastPositioningStatistics = []
+    for i in range(numberOfPlanePairs):
+      writeStartTime = time.perf_counter()
+      lineStartPos = lastCentroidsPositions[i,:3]
+      lineEndPos = lastCentroidsPositions[i,3:]
       planeNormal = (lineEndPos-lineStartPos)/np.linalg.norm(lineEndPos-lineStartPos)
-      planeList[i].SetNormal(planeNormal)
-      planeList[i+1].SetNormal(planeNormal)
+      planeList[2*i].SetOrigin(lineStartPos)
+      planeList[2*i+1].SetOrigin(lineEndPos)
+      planeList[2*i].SetNormal(planeNormal)
+      planeList[2*i+1].SetNormal(planeNormal)
+      computationTimes[i] += time.perf_counter() - writeStartTime
+
+      self.planePairsPositioningCache[planePairsIDs[i]] = {
+        "cacheKey": positioningCacheKey,
+        "lineStartPos": lineStartPos.copy(),
+        "lineEndPos": lineEndPos.copy()
+      }
+      self.lastPositioningStatistics.append({
+        "planePair": (planeList[2*i].GetName(),planeList[2*i+1].GetName()),
+        "iterations": int(numberOfIterations[i]),
+        "residual": float(residuals[i]),
+        "time": float(computationTimes[i]),
+        "warmStarted": bool(warmStartedPlanePairs[i])
+      })
+      logging.info(
+        "Plane pair %s-%s positioned in %d iterations, residual %.4f mm, %.1f ms%s" % (
+          planeList[2*i].GetName(), planeList[2*i+1].GetName(), numberOfIterations[i],
+          residuals[i], 1000*computationTimes[i], " (warm start)" if warmStartedPlanePairs[i] else ""
+        )
+      )
+
+  def getProjectionOfPointOnLine(self,point,lineStartPos,lineEndPos):
+    lineDirection = (lineEndPos-lineStartPos)/np.linalg.norm(lineEndPos-lineStartPos)
+    return lineStartPos + np.dot(point-lineStartPos,lineDirection)*lineDirection
+
+  def updateBoneModelSectionIndex(self):
+    """
+    Sorts the triangles of the bone model along the bone curve so plane sections only
+    visit the triangles near the plane.
+    """
+    parameterNode = self.getParameterNode()
+    boneModel = parameterNode.GetNodeReference("boneModel")
+    boneCurve = parameterNode.GetNodeReference("boneCurve")
+    if (boneModel is None) or (boneModel.GetPolyData() is None) or (boneModel.GetPolyData().GetNumberOfCells() == 0):
+      return
 
-      shNode.RemoveItem(intersectionsForCentroidCalculationFolder)
-          
-  def getIntersectionBetweenModelAnd1PlaneWithNormalAndOrigin_2(self,modelNode,normal,origin,intersectionModel):
-    plane = vtk.vtkPlane()
-    plane.SetOrigin(origin)
-    plane.SetNormal(normal)
+    curvePoints = None
+    if (boneCurve is not None) and (boneCurve.GetNumberOfControlPoints() > 1):
+      curvePoints = slicer.util.arrayFromMarkupsCurvePoints(boneCurve, world=True)
 
-    cutter = vtk.vtkCutter()
-    cutter.SetInputData(modelNode.GetPolyData())
-    cutter.SetCutFunction(plane)
-    cutter.Update()
+    self.slicingService.getSectionEngine(boneModel).buildArcLengthIndex(curvePoints)
+
+  def getSlicingService(self):
+    parameterNode = self.getParameterNode()
+    self.slicingService.useAreaWeightedCentroids = parameterNode.GetParameter("useAreaWeightedSectionCentroids") == "True"
+    return self.slicingService
 
-    intersectionModel.SetAndObservePolyData(cutter.GetOutput())    
+  def getOriginAndNormalOfPlane(self,planeNode):
+    origin = [0,0,0]
+    normal = [0,0,0]
+    planeNode.GetOrigin(origin)
+    planeNode.GetNormal(normal)
+    return np.array(origin), np.array(normal)
 
   def setOriginOfPlaneToCentroidOfIntersectionWithModel(self,model,planeNode):
-    intersectionModel = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode','Intersection')
-    intersectionModel.CreateDefaultDisplayNodes()
-    self.getIntersectionBetweenModelAnd1Plane(model,planeNode,intersectionModel)
-    intersectionModelCentroid = self.getCentroid(intersectionModel)
-    slicer.mrmlScene.RemoveNode(intersectionModel)
+    origin, normal = self.getOriginAndNormalOfPlane(planeNode)
+    intersectionModelCentroid = self.getSlicingService().getCentroidOfIntersection(model,origin,normal)
+    if (intersectionModelCentroid is None) or np.any(np.isnan(intersectionModelCentroid)):
+      logging.warning("%s does not cut %s, its origin is not changed" % (planeNode.GetName(), model.GetName()))
+      return
     planeNode.SetOrigin(intersectionModelCentroid)
 
   def getMaxRadiusOfIntersectionOfModelAndPlane(self,modelNode,planeNode):
-    intersectionModel = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode','Intersection')
-    intersectionModel.CreateDefaultDisplayNodes()
-    self.getIntersectionBetweenModelAnd1Plane(modelNode,planeNode,intersectionModel)
-    intersectionModelCentroid = self.getCentroid(intersectionModel)
-    pointsOfModel = slicer.util.arrayFromModelPoints(intersectionModel)
-    radiuses = np.linalg.norm(pointsOfModel-intersectionModelCentroid,axis=1)
-    maxRadiusOfIntersection = np.max(radiuses)
-
-    slicer.mrmlScene.RemoveNode(intersectionModel)
-
-    return maxRadiusOfIntersection
+    origin, normal = self.getOriginAndNormalOfPlane(planeNode)
+    return self.getSlicingService().getMaxRadiusOfIntersection(modelNode,origin,normal)
 
+  @timedStage
   def createMiterBoxesFromBoneCutPlanes(self):
     parameterNode = self.getParameterNode()
     miterBoxDirectionLine = parameterNode.GetNodeReference("miterBoxDirectionLine")
@@ -1052,204 +2096,121 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     boneModel = parameterNode.GetNodeReference("boneModel")
 
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    miterBoxesModelsFolder = shNode.GetItemByName("miterBoxes Models")
-    shNode.RemoveItem(miterBoxesModelsFolder)
-    biggerMiterBoxesModelsFolder = shNode.GetItemByName("biggerMiterBoxes Models")
-    shNode.RemoveItem(biggerMiterBoxesModelsFolder)
-
-    boneCutPlanesFolder = shNode.GetItemByName("Bone Cut Planes")
-    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
+    boneCutPlanesList = self.getBoneCutPlanesList()
 
     if checkSecurityMarginOnMiterBoxCreationChecked:
-      aligmentPlanesFolder = shNode.GetItemByName("Aligment Planes")
-      if not aligmentPlanesFolder:
-        self.createAligmentPlanes()
-        aligmentPlanesFolder = shNode.GetItemByName("Aligment Planes")
-      aligmentPlanesList = createListFromFolderID(aligmentPlanesFolder)
-      cutBonesPiecesList = createListFromFolderID(shNode.GetItemByName("Cut Bone Pieces"))
-      duplicateBonePiecesModelsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Duplicate Bone Pieces")
-      duplicateBonePiecesTransformsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Duplicate Bone Pieces Transforms")
-      
-      for i in range(0,len(cutBonesPiecesList)):
-        duplicateBonePiece = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode','Duplicate ' + cutBonesPiecesList[i].GetName())
-        duplicateBonePiece.CreateDefaultDisplayNodes()
-        duplicateBonePiece.CopyContent(cutBonesPiecesList[i])
-
-        duplicateBonePieceItemID = shNode.GetItemByDataNode(duplicateBonePiece)
-        shNode.SetItemParent(duplicateBonePieceItemID, duplicateBonePiecesModelsFolder)
-
-      duplicateBonePiecesList = createListFromFolderID(duplicateBonePiecesModelsFolder)
-
-      planesList = [aligmentPlanesList[0]] + boneCutPlanesList + [aligmentPlanesList[1]]
-
-      for i in range(1,len(duplicateBonePiecesList)):
-        lineStartPos = self.getCentroidOfIntersectionOfModelWithPlane(boneModel,planesList[2*(i-1) +2])
-        lineEndPos = self.getCentroidOfIntersectionOfModelWithPlane(boneModel,planesList[2*(i-1) +3])
-        
-        bonePieceAnatomicalAxis = (lineEndPos - lineStartPos)/np.linalg.norm(lineEndPos - lineStartPos)
-
-        duplicateBonePieceTransformNode = slicer.vtkMRMLLinearTransformNode()
-        duplicateBonePieceTransformNode.SetName("Duplicate Bone Piece Transform {0}".format(i))
-        slicer.mrmlScene.AddNode(duplicateBonePieceTransformNode)
-
-        duplicateBonePieceTransform = vtk.vtkTransform()
-        duplicateBonePieceTransform.PostMultiply()
-        duplicateBonePieceTransform.Translate(-i*(securityMarginOfBonePieces + 1e-2)*bonePieceAnatomicalAxis)
-
-        duplicateBonePieceTransformNode.SetMatrixTransformToParent(duplicateBonePieceTransform.GetMatrix())
-
-        duplicateBonePiecesList[i].SetAndObserveTransformNodeID(duplicateBonePieceTransformNode.GetID())
-        duplicateBonePiecesList[i].HardenTransform()
-
-        duplicateBonePieceTransformNodeItemID = shNode.GetItemByDataNode(duplicateBonePieceTransformNode)
-        shNode.SetItemParent(duplicateBonePieceTransformNodeItemID, duplicateBonePiecesTransformsFolder)
-
-      collisionDetected = False
-      
-      import vtkSlicerRtCommonPython
-      for i in range(0,len(duplicateBonePiecesList) -1):
-        collisionDetection = vtkSlicerRtCommonPython.vtkCollisionDetectionFilter()
-        #collisionDetection = vtk.vtkCollisionDetectionFilter()
-        collisionDetection.SetInputData(0, duplicateBonePiecesList[i].GetPolyData())
-        collisionDetection.SetInputData(1, duplicateBonePiecesList[i+1].GetPolyData())
-        matrix1 = vtk.vtkMatrix4x4()
-        collisionDetection.SetMatrix(0, matrix1)
-        collisionDetection.SetMatrix(1, matrix1)
-        collisionDetection.SetBoxTolerance(0.0)
-        collisionDetection.SetCellTolerance(0.0)
-        collisionDetection.SetNumberOfCellsPerNode(2)
-        collisionDetection.Update()
-        
-        if collisionDetection.GetNumberOfContacts() > 0:
-          collisionDetected = True
-          break
-      
-      shNode.RemoveItem(duplicateBonePiecesTransformsFolder)
-      shNode.RemoveItem(duplicateBonePiecesModelsFolder)
-      if collisionDetected:
-        slicer.util.errorDisplay(f"The distance in between bone cut planes do not satisfy the security margin of {securityMarginOfBonePieces}mm. " +
-            "You can fix this by increasing the distance between each pair of bone cut planes that perform the corresponding osteotomy")
-        return
+      cutBonesPiecesList = self.folderRegistry.getNodesOfFolder("Cut Bone Pieces")
+      clearancesList = self.getClearancesBetweenAdjacentBonePieces(cutBonesPiecesList,securityMarginOfBonePieces)
+
+      for i in range(len(clearancesList)):
+        if clearancesList[i] < securityMarginOfBonePieces:
+          self.folderRegistry.removeFolder("miterBoxes Models")
+          self.folderRegistry.removeFolder("biggerMiterBoxes Models")
+          slicer.util.errorDisplay(f"The distance in between bone cut planes do not satisfy the security margin of {securityMarginOfBonePieces}mm. " +
+              f"{cutBonesPiecesList[i].GetName()} and {cutBonesPiecesList[i+1].GetName()} are {max(clearancesList[i],0):.2f}mm apart. " +
+              "You can fix this by increasing the distance between each pair of bone cut planes that perform the corresponding osteotomy")
+          return
+
+    #miterBoxModel: the numbers are selected arbitrarily to make a box with the correct size then they'll be GUI set
+    miterBoxWidth = miterBoxSlotWidth
+    miterBoxLength = miterBoxSlotLength
+    miterBoxHeight = 70
+    biggerMiterBoxWidth = miterBoxSlotWidth+2*miterBoxSlotWall
+    biggerMiterBoxLength = miterBoxSlotLength+2*miterBoxSlotWall
+    biggerMiterBoxHeight = miterBoxSlotHeight
+
+    numberOfBoneCutPlanes = len(boneCutPlanesList)
+    miterBoxesRotationMatrices = np.zeros((numberOfBoneCutPlanes,3,3))
+    miterBoxesTranslations = np.zeros((numberOfBoneCutPlanes,3))
+    with self.stageTimingRecorder.stage("miterBoxesAxesAndPointsOfIntersection",boneModel.GetPolyData().GetNumberOfCells()):
+      for i in range(numberOfBoneCutPlanes):
+        miterBoxAxes, pointOfIntersection = self.getMiterBoxAxesAndPointOfIntersectionOfBoneCutPlane(boneModel,boneCutPlanesList[i])
+        miterBoxesRotationMatrices[i] = miterBoxAxes
+        miterBoxesTranslations[i] = pointOfIntersection
+
+    #Boxes stand on the bone surface and the slot of each plane is on the side of its bone segment
+    miterBoxesAxesY = miterBoxesRotationMatrices[:,:,1]
+    miterBoxesAxesZ = miterBoxesRotationMatrices[:,:,2]
+    miterBoxesZSigns = np.where(np.arange(numberOfBoneCutPlanes)%2 == 0, 1, -1)[:,np.newaxis]
+    miterBoxesTranslations += miterBoxesAxesY*(biggerMiterBoxHeight/2+biggerMiterBoxDistanceToBone) + miterBoxesAxesZ*miterBoxesZSigns*miterBoxSlotWidth/2
+
+    miterBoxesPolyDatas = getTransformedCopiesOfPolyData(
+      self.getBoxPolyData(miterBoxLength,miterBoxHeight,miterBoxWidth),miterBoxesRotationMatrices,miterBoxesTranslations
+    )
+    biggerMiterBoxesPolyDatas = getTransformedCopiesOfPolyData(
+      self.getBoxPolyData(biggerMiterBoxLength,biggerMiterBoxHeight,biggerMiterBoxWidth),miterBoxesRotationMatrices,miterBoxesTranslations
+    )
+
+    miterBoxesModelsList = self.getModelsPoolOfFolder("miterBoxes Models","miterBox",numberOfBoneCutPlanes)
+    biggerMiterBoxesModelsList = self.getModelsPoolOfFolder("biggerMiterBoxes Models","biggerMiterBox",numberOfBoneCutPlanes)
+    for i in range(numberOfBoneCutPlanes):
+      miterBoxesModelsList[i].SetAndObservePolyData(miterBoxesPolyDatas[i])
+      biggerMiterBoxesModelsList[i].SetAndObservePolyData(biggerMiterBoxesPolyDatas[i])
+
+  def getMiterBoxAxesAndPointOfIntersectionOfBoneCutPlane(self,boneModel,boneCutPlane):
+    """
+    Returns the miter box to world rotation matrix and the point of the bone surface in the direction of
+    the plane X axis from the centroid of the intersection. The point is cached until the plane, the bone
+    model or the centroid definition change so only the box sizes are recomputed on parameter changes.
+    """
+    slicingService = self.getSlicingService()
+    boneCutPlaneMatrix = vtk.vtkMatrix4x4()
+    boneCutPlane.GetPlaneToWorldMatrix(boneCutPlaneMatrix)
+    boneCutPlaneMatrix = slicer.util.arrayFromVTKMatrix(boneCutPlaneMatrix)
+    boneCutPlaneX = boneCutPlaneMatrix[:3,0]
+    boneCutPlaneZ = boneCutPlaneMatrix[:3,2]
+    boneCutPlaneOrigin = boneCutPlaneMatrix[:3,3]
+
+    miterBoxDirection = boneCutPlaneX
+    miterBoxAxisZ = boneCutPlaneZ
+    miterBoxAxisX = np.cross(miterBoxDirection, miterBoxAxisZ)
+    miterBoxAxisX = miterBoxAxisX/np.linalg.norm(miterBoxAxisX)
+    miterBoxAxisY = np.cross(miterBoxAxisZ, miterBoxAxisX)
+    miterBoxAxisY = miterBoxAxisY/np.linalg.norm(miterBoxAxisY)
+    miterBoxAxes = np.stack((miterBoxAxisX,miterBoxAxisY,miterBoxAxisZ),axis=1)
+
+    cacheKey = (
+      boneModel.GetID(), boneModel.GetPolyData().GetMTime(), slicingService.useAreaWeightedCentroids,
+      boneCutPlaneMatrix.tobytes()
+    )
+    cachedPointOfIntersection = self.miterBoxesPointsOfIntersection.get(boneCutPlane.GetID())
+    if (cachedPointOfIntersection is not None) and (cachedPointOfIntersection["cacheKey"] == cacheKey):
+      return miterBoxAxes, cachedPointOfIntersection["pointOfIntersection"]
+
+    #The line in the plane along its X axis through the centroid is the intersection with this normal
+    normalToMiterBoxDirectionAndPlaneZ = miterBoxAxisX
+    intersectionPolyData = slicingService.getIntersectionPolyData(boneModel,boneCutPlaneOrigin,boneCutPlaneZ)
+    intersectionModelCentroid = slicingService.getCentroidOfIntersection(boneModel,boneCutPlaneOrigin,boneCutPlaneZ)
+    pointsOfIntersection = slicingService.getIntersectionPointsOfPolyDataAndPlane(intersectionPolyData,intersectionModelCentroid,normalToMiterBoxDirectionAndPlaneZ)
+    pointOfIntersection = self.getPointOfTwoPointsThatMakesLineDirectionSimilarToVector(pointsOfIntersection,boneCutPlaneX)
+
+    self.miterBoxesPointsOfIntersection[boneCutPlane.GetID()] = {"cacheKey": cacheKey, "pointOfIntersection": pointOfIntersection}
+    return miterBoxAxes, pointOfIntersection
+
+  def getModelsPoolOfFolder(self,folderName,modelsBaseName,numberOfModels):
+    """
+    Returns numberOfModels models of the folder shown in the deformed bone view. Existing models are
+    reused, missing ones are created and the ones left over are removed.
+    """
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    folderItemID = self.folderRegistry.getFolderItemID(folderName,createIfMissing=True)
+    modelsList = self.folderRegistry.getNodesOfFolder(folderName)
 
-    miterBoxesModelsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"miterBoxes Models")
-    biggerMiterBoxesModelsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"biggerMiterBoxes Models")
-    miterBoxesTransformsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"miterBoxes Transforms")
-    intersectionsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Intersections")
-    pointsIntersectionsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Points Intersections")
-    
-    deformedBoneViewNode = slicer.mrmlScene.GetSingletonNode("1", "vtkMRMLViewNode")
+    for i in range(len(modelsList),numberOfModels):
+      modelNode = slicer.mrmlScene.CreateNodeByClass('vtkMRMLModelNode')
+      modelNode.SetName(slicer.mrmlScene.GetUniqueNameByString(modelsBaseName + "%d" % i))
+      slicer.mrmlScene.AddNode(modelNode)
+      modelNode.CreateDefaultDisplayNodes()
+      self.showDisplayNodeInView(modelNode.GetDisplayNode(),"1")
+      shNode.SetItemParent(shNode.GetItemByDataNode(modelNode), folderItemID)
+      modelsList.append(modelNode)
 
-    for i in range(len(boneCutPlanesList)):
-      boneCutPlaneMatrix = vtk.vtkMatrix4x4()
-      boneCutPlanesList[i].GetPlaneToWorldMatrix(boneCutPlaneMatrix)
-      boneCutPlaneX = np.array([boneCutPlaneMatrix.GetElement(0,0),boneCutPlaneMatrix.GetElement(1,0),boneCutPlaneMatrix.GetElement(2,0)])
-      boneCutPlaneY = np.array([boneCutPlaneMatrix.GetElement(0,1),boneCutPlaneMatrix.GetElement(1,1),boneCutPlaneMatrix.GetElement(2,1)])
-      boneCutPlaneZ = np.array([boneCutPlaneMatrix.GetElement(0,2),boneCutPlaneMatrix.GetElement(1,2),boneCutPlaneMatrix.GetElement(2,2)])
-      boneCutPlaneOrigin = np.array([boneCutPlaneMatrix.GetElement(0,3),boneCutPlaneMatrix.GetElement(1,3),boneCutPlaneMatrix.GetElement(2,3)])
-    
-      #miterBoxModel: the numbers are selected arbitrarily to make a box with the correct size then they'll be GUI set
-      miterBoxName = "miterBox%d" % (i)
-      biggerMiterBoxName = "biggerMiterBox%d" % (i)
-      miterBoxWidth = miterBoxSlotWidth
-      miterBoxLength = miterBoxSlotLength
-      miterBoxHeight = 70
-      miterBoxModel = self.createBox(miterBoxLength,miterBoxHeight,miterBoxWidth,miterBoxName)
-
-      miterBoxDisplayNode = miterBoxModel.GetDisplayNode()
-      miterBoxDisplayNode.AddViewNodeID(deformedBoneViewNode.GetID())
-
-      miterBoxModelItemID = shNode.GetItemByDataNode(miterBoxModel)
-      shNode.SetItemParent(miterBoxModelItemID, miterBoxesModelsFolder)
-
-      biggerMiterBoxWidth = miterBoxSlotWidth+2*miterBoxSlotWall
-      biggerMiterBoxLength = miterBoxSlotLength+2*miterBoxSlotWall
-      biggerMiterBoxHeight = miterBoxSlotHeight
-      biggerMiterBoxModel = self.createBox(biggerMiterBoxLength,biggerMiterBoxHeight,biggerMiterBoxWidth,biggerMiterBoxName)
-      
-      biggerMiterBoxDisplayNode = biggerMiterBoxModel.GetDisplayNode()
-      biggerMiterBoxDisplayNode.AddViewNodeID(deformedBoneViewNode.GetID())
-
-      biggerMiterBoxModelItemID = shNode.GetItemByDataNode(biggerMiterBoxModel)
-      shNode.SetItemParent(biggerMiterBoxModelItemID, biggerMiterBoxesModelsFolder)
-
-      miterBoxDirection = boneCutPlaneX
-
-      normalToMiterBoxDirectionAndPlaneZ = [0,0,0]
-      vtk.vtkMath.Cross(miterBoxDirection, boneCutPlaneZ, normalToMiterBoxDirectionAndPlaneZ)
-      normalToMiterBoxDirectionAndPlaneZ = normalToMiterBoxDirectionAndPlaneZ/np.linalg.norm(normalToMiterBoxDirectionAndPlaneZ)
-      
-      intersectionModel = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode','Intersection%d' % (i))
-      intersectionModel.CreateDefaultDisplayNodes()
-      self.getIntersectionBetweenModelAnd1Plane(boneModel,boneCutPlanesList[i],intersectionModel)
-      intersectionModelCentroid = self.getCentroid(intersectionModel)
-      pointsIntersectionModel = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode','Points Intersection%d' % (i))
-      pointsIntersectionModel.CreateDefaultDisplayNodes()
-      self.getIntersectionBetweenModelAnd1PlaneWithNormalAndOrigin_2(intersectionModel,normalToMiterBoxDirectionAndPlaneZ,intersectionModelCentroid,pointsIntersectionModel)
-      pointOfIntersection = self.getPointOfATwoPointsModelThatMakesLineDirectionSimilarToVector(pointsIntersectionModel,boneCutPlaneX)
-      intersectionModelItemID = shNode.GetItemByDataNode(intersectionModel)
-      shNode.SetItemParent(intersectionModelItemID, intersectionsFolder)
-      pointsIntersectionModelItemID = shNode.GetItemByDataNode(pointsIntersectionModel)
-      shNode.SetItemParent(pointsIntersectionModelItemID, pointsIntersectionsFolder)
-
-      miterBoxAxisX = [0,0,0]
-      miterBoxAxisY =  [0,0,0]
-      miterBoxAxisZ = boneCutPlaneZ
-      vtk.vtkMath.Cross(miterBoxDirection, miterBoxAxisZ, miterBoxAxisX)
-      miterBoxAxisX = miterBoxAxisX/np.linalg.norm(miterBoxAxisX)
-      vtk.vtkMath.Cross(miterBoxAxisZ, miterBoxAxisX, miterBoxAxisY)
-      miterBoxAxisY = miterBoxAxisY/np.linalg.norm(miterBoxAxisY)
-
-      miterBoxAxisToWorldRotationMatrix = self.getAxes1ToWorldRotationMatrix(miterBoxAxisX, miterBoxAxisY, miterBoxAxisZ)
-      WorldToWorldRotationMatrix = self.getAxes1ToWorldRotationMatrix([1,0,0], [0,1,0], [0,0,1])
-
-      WorldToMiterBoxAxisRotationMatrix = self.getAxes1ToAxes2RotationMatrix(WorldToWorldRotationMatrix, miterBoxAxisToWorldRotationMatrix)
-
-      transformNode = slicer.vtkMRMLLinearTransformNode()
-      transformNode.SetName("temp%d" % i)
-      slicer.mrmlScene.AddNode(transformNode)
-
-      finalTransform = vtk.vtkTransform()
-      finalTransform.PostMultiply()
-      finalTransform.Concatenate(WorldToMiterBoxAxisRotationMatrix)
-      if i%2 == 0:
-        miterBoxAxisXTranslation = 0
-        miterBoxAxisYTranslation = biggerMiterBoxHeight/2+biggerMiterBoxDistanceToBone
-        miterBoxAxisZTranslation = miterBoxSlotWidth/2
-      else:
-        miterBoxAxisXTranslation = 0
-        miterBoxAxisYTranslation = biggerMiterBoxHeight/2+biggerMiterBoxDistanceToBone
-        miterBoxAxisZTranslation = -miterBoxSlotWidth/2
-      finalTransform.Translate(pointOfIntersection + miterBoxAxisX*miterBoxAxisXTranslation + miterBoxAxisY*miterBoxAxisYTranslation + miterBoxAxisZ*miterBoxAxisZTranslation)
-      transformNode.SetMatrixTransformToParent(finalTransform.GetMatrix())
-
-      transformNode.UpdateScene(slicer.mrmlScene)
-
-      miterBoxModel.SetAndObserveTransformNodeID(transformNode.GetID())
-      miterBoxModel.HardenTransform()
-      biggerMiterBoxModel.SetAndObserveTransformNodeID(transformNode.GetID())
-      biggerMiterBoxModel.HardenTransform()
-      
-      transformNodeItemID = shNode.GetItemByDataNode(transformNode)
-      shNode.SetItemParent(transformNodeItemID, miterBoxesTransformsFolder)
-    
-    shNode.RemoveItem(miterBoxesTransformsFolder)
-    shNode.RemoveItem(intersectionsFolder)
-    shNode.RemoveItem(pointsIntersectionsFolder)
-
-  def  getCentroidOfIntersectionOfModelWithPlane(self,model,plane):
-    intersectionModel = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLModelNode','Intersection')
-    intersectionModel.CreateDefaultDisplayNodes()
-    self.getIntersectionBetweenModelAnd1Plane(model,plane,intersectionModel)
-    intersectionModelCentroid = self.getCentroid(intersectionModel)
-    slicer.mrmlScene.RemoveNode(intersectionModel)
-    return intersectionModelCentroid
-
-  def getPointOfATwoPointsModelThatMakesLineDirectionSimilarToVector(self,twoPointsModel,vector):
-    pointsData = twoPointsModel.GetPolyData().GetPoints().GetData()
-    from vtk.util.numpy_support import vtk_to_numpy
+    for modelNode in modelsList[numberOfModels:]:
+      shNode.RemoveItem(shNode.GetItemByDataNode(modelNode))
 
-    points = vtk_to_numpy(pointsData)
+    return modelsList[:numberOfModels]
 
+  def getPointOfTwoPointsThatMakesLineDirectionSimilarToVector(self,points,vector):
     pointsVector = (points[1]-points[0])/np.linalg.norm(points[1]-points[0])
 
     if vtk.vtkMath.Dot(pointsVector, vector) > 0:
@@ -1257,11 +2218,62 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     else:
       return points[0]
   
-  def createBox(self, X, Y, Z, name):
-    miterBox = slicer.mrmlScene.CreateNodeByClass('vtkMRMLModelNode')
-    miterBox.SetName(slicer.mrmlScene.GetUniqueNameByString(name))
-    slicer.mrmlScene.AddNode(miterBox)
-    miterBox.CreateDefaultDisplayNodes()
+  @timedStage
+  def getClearancesBetweenAdjacentBonePieces(self,bonePiecesList,securityMargin):
+    """
+    Returns the minimum distance in mm between each pair of adjacent bone pieces, inf if they are
+    farther apart than securityMargin. The pairs are checked on worker threads, once a pair closer
+    than securityMargin is found the pairs not started yet are skipped and left as nan.
+    """
+    numberOfPairs = len(bonePiecesList) -1
+    if numberOfPairs < 1:
+      return []
+
+    #Each pair owns the distance functions it uses so no locator is queried by two threads
+    distanceFunctionsList = []
+    for i in range(numberOfPairs):
+      distanceFunctionsList.append([
+        self.getCachedDistanceFunctionOfBonePiece(bonePiecesList[i],"next"),
+        self.getCachedDistanceFunctionOfBonePiece(bonePiecesList[i+1],"previous")
+      ])
+
+    marginViolatedEvent = threading.Event()
+    def getClearanceOfPair(i):
+      if marginViolatedEvent.is_set():
+        return np.nan
+      clearance = getClearanceBetweenPolyDatas(
+        bonePiecesList[i].GetPolyData(),distanceFunctionsList[i][0],
+        bonePiecesList[i+1].GetPolyData(),distanceFunctionsList[i][1],
+        securityMargin
+      )
+      if clearance < securityMargin:
+        marginViolatedEvent.set()
+      return clearance
+
+    numberOfWorkers = min(os.cpu_count() or 1,numberOfPairs)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=numberOfWorkers) as executor:
+      clearancesList = list(executor.map(getClearanceOfPair,range(numberOfPairs)))
+
+    for i in range(numberOfPairs):
+      if not np.isnan(clearancesList[i]):
+        logging.info("Clearance between %s and %s: %.2f mm" % (bonePiecesList[i].GetName(),bonePiecesList[i+1].GetName(),clearancesList[i]))
+    return clearancesList
+
+  def getCachedDistanceFunctionOfBonePiece(self,bonePiece,side):
+    polyData = bonePiece.GetPolyData()
+    key = (bonePiece.GetID(),side)
+    cachedDistanceFunction = self.bonePiecesDistanceFunctions.get(key)
+    if (
+      (cachedDistanceFunction is None) or (cachedDistanceFunction["polyData"] is not polyData) or
+      (cachedDistanceFunction["mTime"] != polyData.GetMTime())
+    ):
+      distanceFunction = vtk.vtkImplicitPolyDataDistance()
+      distanceFunction.SetInput(polyData)
+      cachedDistanceFunction = {"polyData": polyData, "mTime": polyData.GetMTime(), "distanceFunction": distanceFunction}
+      self.bonePiecesDistanceFunctions[key] = cachedDistanceFunction
+    return cachedDistanceFunction["distanceFunction"]
+
+  def getBoxPolyData(self, X, Y, Z):
     miterBoxSource = vtk.vtkCubeSource()
     miterBoxSource.SetXLength(X)
     miterBoxSource.SetYLength(Y)
@@ -1269,14 +2281,11 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     triangleFilter = vtk.vtkTriangleFilter()
     triangleFilter.SetInputConnection(miterBoxSource.GetOutputPort())
     triangleFilter.Update()
-    miterBox.SetAndObservePolyData(triangleFilter.GetOutput())
-    return miterBox
+    return triangleFilter.GetOutput()
   
   def createBoneCylindersFiducialList(self):
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCylindersFiducialsListsFolder = shNode.GetItemByName("Bone Cylinders Fiducials Lists")
-    if not boneCylindersFiducialsListsFolder:
-      boneCylindersFiducialsListsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Bone Cylinders Fiducials Lists")
+    boneCylindersFiducialsListsFolder = self.folderRegistry.getFolderItemID("Bone Cylinders Fiducials Lists",createIfMissing=True)
     
     boneFiducialListNode = slicer.mrmlScene.CreateNodeByClass("vtkMRMLMarkupsFiducialNode")
     boneFiducialListNode.SetName("temp")
@@ -1292,99 +2301,80 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     interactionNode = slicer.mrmlScene.GetNodeByID("vtkMRMLInteractionNodeSingleton")
     interactionNode.SwitchToPersistentPlaceMode()
 
+  @timedStage
   def createCylindersFromFiducialListAndBoneSurgicalGuideBase(self):
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCylindersModelsFolder = shNode.GetItemByName("Bone Cylinders Models")
-    shNode.RemoveItem(boneCylindersModelsFolder)
-    boneCylindersModelsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Bone Cylinders Models")
-    cylindersTransformsFolder = shNode.CreateFolderItem(self.getParentFolderItemID(),"Cylinders Transforms")
+    boneCylindersModelsFolder = self.folderRegistry.recreateFolder("Bone Cylinders Models")
     
     parameterNode = self.getParameterNode()
     boneFiducialList = parameterNode.GetNodeReference("boneFiducialList")
     boneSurgicalGuideBaseModel = parameterNode.GetNodeReference("boneSurgicalGuideBaseModel")
     boneScrewHoleCylinderRadius = float(parameterNode.GetParameter("boneScrewHoleCylinderRadius"))
 
-    normalsOfSurgicalGuideBaseModel = slicer.util.arrayFromModelPointData(boneSurgicalGuideBaseModel, 'Normals')
-    
-    surgicalGuideBaseMesh = boneSurgicalGuideBaseModel.GetMesh()
-
-    for i in range(boneFiducialList.GetNumberOfFiducials()):
-      pos = [0,0,0]
-      boneFiducialList.GetNthFiducialPosition(i,pos)
-
-      pointID = surgicalGuideBaseMesh.FindPoint(pos)
-
-      normalAtPointID = normalsOfSurgicalGuideBaseModel[pointID]
-
-      transformedCylinderAxisX = [0,0,0]
-      transformedCylinderAxisY = [0,0,0]
-      transformedCylinderAxisZ = normalAtPointID
-      vtk.vtkMath.Perpendiculars(transformedCylinderAxisZ,transformedCylinderAxisX,transformedCylinderAxisY,0)
+    useAreaWeightedNormalsForScrewAxes = parameterNode.GetParameter("useAreaWeightedNormalsForScrewAxes") == "True"
 
-      cylinderModel = self.createCylinder(boneScrewHoleCylinderRadius, "cylinder%d" % i)
+    fiducialsPositions = slicer.util.arrayFromMarkupsControlPoints(boneFiducialList)
+    if (fiducialsPositions is None) or (len(fiducialsPositions) == 0):
+      return
+    fiducialsPositions = np.array(fiducialsPositions,dtype=float).reshape(-1,3)
+
+    #Cylinder axes are the perpendiculars and the normal of the guide base at each fiducial
+    surgicalGuideBaseIndex = self.getSurfacePointsIndex(boneSurgicalGuideBaseModel)
+    transformedCylinderAxesZ = surgicalGuideBaseIndex.getNormalsAtNearestPoints(fiducialsPositions,useAreaWeightedNormalsForScrewAxes)
+    transformedCylinderAxesX, transformedCylinderAxesY = getPerpendicularsOfVectors(transformedCylinderAxesZ)
+    cylindersRotationMatrices = np.stack((transformedCylinderAxesX,transformedCylinderAxesY,transformedCylinderAxesZ),axis=2)
+
+    cylinderTemplate = self.getCylinderTemplatePolyData(boneScrewHoleCylinderRadius)
+    cylindersPolyDatas = getTransformedCopiesOfPolyData(cylinderTemplate,cylindersRotationMatrices,fiducialsPositions)
+
+    for i in range(len(cylindersPolyDatas)):
+      cylinderModel = slicer.mrmlScene.CreateNodeByClass('vtkMRMLModelNode')
+      cylinderModel.SetName(slicer.mrmlScene.GetUniqueNameByString("cylinder%d" % i))
+      slicer.mrmlScene.AddNode(cylinderModel)
+      cylinderModel.CreateDefaultDisplayNodes()
+      cylinderModel.SetAndObservePolyData(cylindersPolyDatas[i])
       cylinderModelItemID = shNode.GetItemByDataNode(cylinderModel)
       shNode.SetItemParent(cylinderModelItemID, boneCylindersModelsFolder)
-      
-      cylinderAxisX = [1,0,0]
-      cylinderAxisY = [0,1,0]
-      cylinderAxisZ = [0,0,1]
-
-      cylinderAxisToWorldRotationMatrix = self.getAxes1ToWorldRotationMatrix(cylinderAxisX, cylinderAxisY, cylinderAxisZ)
-      transformedCylinderAxisToWorldRotationMatrix = self.getAxes1ToWorldRotationMatrix(transformedCylinderAxisX, transformedCylinderAxisY, transformedCylinderAxisZ)
-
-      cylinderAxisToTransformedCylinderAxisRotationMatrix = self.getAxes1ToAxes2RotationMatrix(cylinderAxisToWorldRotationMatrix, transformedCylinderAxisToWorldRotationMatrix)
-
-      transformNode = slicer.vtkMRMLLinearTransformNode()
-      transformNode.SetName("temp%d" % i)
-      slicer.mrmlScene.AddNode(transformNode)
-
-      finalTransform = vtk.vtkTransform()
-      finalTransform.PostMultiply()
-      finalTransform.Concatenate(cylinderAxisToTransformedCylinderAxisRotationMatrix)
-      finalTransform.Translate(pos)
-
-      transformNode.SetMatrixTransformToParent(finalTransform.GetMatrix())
 
-      transformNode.UpdateScene(slicer.mrmlScene)
+  def getSurfacePointsIndex(self,modelNode):
+    """
+    Returns the nearest point and normals index of the model, it is rebuilt only when its polydata changes.
+    """
+    surfacePointsIndex = self.surfacePointsIndexes.get(modelNode.GetID())
+    if (surfacePointsIndex is None) or not surfacePointsIndex.isUpToDate(modelNode.GetPolyData()):
+      surfacePointsIndex = SurfacePointsIndex(modelNode.GetPolyData())
+      self.surfacePointsIndexes[modelNode.GetID()] = surfacePointsIndex
+    return surfacePointsIndex
 
-      cylinderModel.SetAndObserveTransformNodeID(transformNode.GetID())
-      cylinderModel.HardenTransform()
-      
-      transformNodeItemID = shNode.GetItemByDataNode(transformNode)
-      shNode.SetItemParent(transformNodeItemID, cylindersTransformsFolder)
-    
-    shNode.RemoveItem(cylindersTransformsFolder)
-
-  def createCylinder(self,R,name):
-    cylinder = slicer.mrmlScene.CreateNodeByClass('vtkMRMLModelNode')
-    cylinder.SetName(slicer.mrmlScene.GetUniqueNameByString(name))
-    slicer.mrmlScene.AddNode(cylinder)
-    cylinder.CreateDefaultDisplayNodes()
-    lineSource = vtk.vtkLineSource()
-    lineSource.SetPoint1(0, 0, 25)
-    lineSource.SetPoint2(0, 0, -25)
-    tubeFilter = vtk.vtkTubeFilter()
-    tubeFilter.SetInputConnection(lineSource.GetOutputPort())
-    tubeFilter.SetRadius(R)
-    tubeFilter.SetNumberOfSides(50)
-    tubeFilter.CappingOn()
-    tubeFilter.Update()
-    cylinder.SetAndObservePolyData(tubeFilter.GetOutput())
-    return cylinder
+  def getCylinderTemplatePolyData(self,R):
+    """
+    Returns a cached cylinder of radius R along the z axis centered at the origin.
+    """
+    cylinderTemplate = self.cylinderTemplates.get(R)
+    if cylinderTemplate is None:
+      lineSource = vtk.vtkLineSource()
+      lineSource.SetPoint1(0, 0, 25)
+      lineSource.SetPoint2(0, 0, -25)
+      tubeFilter = vtk.vtkTubeFilter()
+      tubeFilter.SetInputConnection(lineSource.GetOutputPort())
+      tubeFilter.SetRadius(R)
+      tubeFilter.SetNumberOfSides(50)
+      tubeFilter.CappingOn()
+      tubeFilter.Update()
+      cylinderTemplate = vtk.vtkPolyData()
+      cylinderTemplate.DeepCopy(tubeFilter.GetOutput())
+      self.cylinderTemplates[R] = cylinderTemplate
+    return cylinderTemplate
   
+  @timedStage
   def makeBooleanOperationsToBoneSurgicalGuideBase(self):
     parameterNode = self.getParameterNode()
     boneSurgicalGuideBaseModel = parameterNode.GetNodeReference("boneSurgicalGuideBaseModel")
 
     shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    boneCylindersModelsFolder = shNode.GetItemByName("Bone Cylinders Models")
-    cylindersModelsList = createListFromFolderID(boneCylindersModelsFolder)
-    miterBoxesModelsFolder = shNode.GetItemByName("miterBoxes Models")
-    miterBoxesModelsList = createListFromFolderID(miterBoxesModelsFolder)
-    biggerMiterBoxesModelsFolder = shNode.GetItemByName("biggerMiterBoxes Models")
-    biggerMiterBoxesModelsList = createListFromFolderID(biggerMiterBoxesModelsFolder)
-
-    combineModelsLogic = slicer.modules.combinemodels.widgetRepresentation().self().logic
+    cylindersModelsList = self.folderRegistry.getNodesOfFolder("Bone Cylinders Models")
+    miterBoxesModelsList = self.folderRegistry.getNodesOfFolder("miterBoxes Models")
+    biggerMiterBoxesModelsList = self.folderRegistry.getNodesOfFolder("biggerMiterBoxes Models")
 
     surgicalGuideModel = slicer.modules.models.logic().AddModel(boneSurgicalGuideBaseModel.GetPolyData())
     surgicalGuideModel.SetName(slicer.mrmlScene.GetUniqueNameByString('BoneSurgicalGuidePrototype'))
@@ -1392,22 +2382,1382 @@ class DeformityCorrectionOsteotomyPlannerLogic(ScriptedLoadableModuleLogic):
     shNode.SetItemParent(surgicalGuideModelItemID, self.getParentFolderItemID())
 
     displayNode = surgicalGuideModel.GetDisplayNode()
-    deformedBoneViewNode = slicer.mrmlScene.GetSingletonNode("1", "vtkMRMLViewNode")
-    displayNode.AddViewNodeID(deformedBoneViewNode.GetID())
-
-    for i in range(len(biggerMiterBoxesModelsList)):
-      combineModelsLogic.process(surgicalGuideModel, biggerMiterBoxesModelsList[i], surgicalGuideModel, 'union')
+    self.showDisplayNodeInView(displayNode,"1")
 
-    for i in range(len(cylindersModelsList)):
-      combineModelsLogic.process(surgicalGuideModel, cylindersModelsList[i], surgicalGuideModel, 'difference')
+    useBatchedBooleanOperations = parameterNode.GetParameter("useBatchedBooleanOperations") == "True"
+    subtractiveModelsList = cylindersModelsList + miterBoxesModelsList
+    self.applyBooleanOperationsToSurgicalGuide(surgicalGuideModel,biggerMiterBoxesModelsList,subtractiveModelsList,useBatchedBooleanOperations)
 
-    for i in range(len(miterBoxesModelsList)):
-      combineModelsLogic.process(surgicalGuideModel, miterBoxesModelsList[i], surgicalGuideModel, 'difference')
+    if useBatchedBooleanOperations and surgicalGuideModel.GetPolyData().GetNumberOfPoints() == 0:
+      logging.warning("Batched boolean operations failed, applying the tools one by one")
+      surgicalGuideModel.SetAndObservePolyData(vtk.vtkPolyData())
+      surgicalGuideModel.GetPolyData().DeepCopy(boneSurgicalGuideBaseModel.GetPolyData())
+      self.applyBooleanOperationsToSurgicalGuide(surgicalGuideModel,biggerMiterBoxesModelsList,subtractiveModelsList,False)
 
     if surgicalGuideModel.GetPolyData().GetNumberOfPoints() == 0:
       slicer.mrmlScene.RemoveNode(surgicalGuideModel)
       slicer.util.errorDisplay("ERROR: Boolean operations to make bone surgical guide failed")
+      return None
+
+    return surgicalGuideModel
   
+  @timedStage
+  def applyBooleanOperationsToSurgicalGuide(self,surgicalGuideModel,additiveModelsList,subtractiveModelsList,batched):
+    """
+    Adds the additive models to the surgical guide and removes the subtractive ones from it. The
+    batched mode merges each group of tools into one mesh so the guide is re-tessellated only twice.
+    Intermediate results are kept as polydata, only the surgical guide model is modified.
+    """
+    surgicalGuidePolyData = surgicalGuideModel.GetPolyData()
+
+    if not batched:
+      toolsAndOperationsList = [[model,'union'] for model in additiveModelsList] + [[model,'difference'] for model in subtractiveModelsList]
+      for toolModel, operation in toolsAndOperationsList:
+        with self.stageTimingRecorder.stage(operation,surgicalGuidePolyData.GetNumberOfCells()):
+          surgicalGuidePolyData = self.combinePolyDatas(surgicalGuidePolyData,self.getWorldPolyDataOfModel(toolModel),operation)
+        if surgicalGuidePolyData.GetNumberOfPoints() == 0:
+          break
+      surgicalGuideModel.SetAndObservePolyData(surgicalGuidePolyData)
+      return
+
+    for modelsList, operation in [[additiveModelsList,'union'],[subtractiveModelsList,'difference']]:
+      if len(modelsList) == 0:
+        continue
+      toolsPolyData = self.getMergedPolyDataOfTools([self.getWorldPolyDataOfModel(model) for model in modelsList])
+      with self.stageTimingRecorder.stage(operation,surgicalGuidePolyData.GetNumberOfCells()):
+        surgicalGuidePolyData = self.combinePolyDatas(surgicalGuidePolyData,toolsPolyData,operation)
+      if surgicalGuidePolyData.GetNumberOfPoints() == 0:
+        break
+    surgicalGuideModel.SetAndObservePolyData(surgicalGuidePolyData)
+
+  def getWorldPolyDataOfModel(self,modelNode):
+    transformNode = modelNode.GetParentTransformNode()
+    if transformNode is None:
+      return modelNode.GetPolyData()
+    modelToWorldTransform = vtk.vtkGeneralTransform()
+    transformNode.GetTransformToWorld(modelToWorldTransform)
+    transformFilter = vtk.vtkTransformPolyDataFilter()
+    transformFilter.SetInputData(modelNode.GetPolyData())
+    transformFilter.SetTransform(modelToWorldTransform)
+    transformFilter.Update()
+    return transformFilter.GetOutput()
+
+  @timedStage
+  def getMergedPolyDataOfTools(self,polyDatasList):
+    """
+    Returns the union of the tools. Tools with overlapping bounds are grouped together and each group is
+    reduced by pairwise unions, the groups do not touch each other so they are just appended.
+    """
+    clustersList = self.getClustersOfOverlappingBounds([polyData.GetBounds() for polyData in polyDatasList])
+
+    appendFilter = vtk.vtkAppendPolyData()
+    for cluster in clustersList:
+      clusterPolyDatasList = [polyDatasList[i] for i in cluster]
+      while len(clusterPolyDatasList) > 1:
+        reducedPolyDatasList = []
+        for i in range(0,len(clusterPolyDatasList) -1,2):
+          reducedPolyDatasList.append(self.combinePolyDatas(clusterPolyDatasList[i],clusterPolyDatasList[i+1],'union'))
+        if len(clusterPolyDatasList)%2 == 1:
+          reducedPolyDatasList.append(clusterPolyDatasList[-1])
+        clusterPolyDatasList = reducedPolyDatasList
+      appendFilter.AddInputData(clusterPolyDatasList[0])
+    appendFilter.Update()
+
+    mergedPolyData = vtk.vtkPolyData()
+    mergedPolyData.DeepCopy(appendFilter.GetOutput())
+    return mergedPolyData
+
+  def getClustersOfOverlappingBounds(self,boundsList):
+    boundsArray = np.array(boundsList,dtype=float).reshape(-1,6)
+    boundsOverlap = (
+      (boundsArray[:,np.newaxis,0::2] <= boundsArray[np.newaxis,:,1::2]) &
+      (boundsArray[np.newaxis,:,0::2] <= boundsArray[:,np.newaxis,1::2])
+    ).all(axis=2)
+
+    clusterIndexes = -np.ones(len(boundsArray),dtype=int)
+    clustersList = []
+    for i in range(len(boundsArray)):
+      if clusterIndexes[i] != -1:
+        continue
+      clusterIndexes[i] = len(clustersList)
+      cluster = [i]
+      j = 0
+      while j < len(cluster):
+        for k in np.nonzero(boundsOverlap[cluster[j]] & (clusterIndexes == -1))[0]:
+          clusterIndexes[k] = len(clustersList)
+          cluster.append(int(k))
+        j += 1
+      clustersList.append(sorted(cluster))
+    return clustersList
+
+  def combinePolyDatas(self,polyDataA,polyDataB,operation,numberOfRetries=2):
+    """
+    Returns the union or difference of the surfaces, computed with the boolean filter of the Combine
+    Models module. As in that module, a failed operation is retried with polyDataB slightly translated.
+    """
+    import vtkSlicerCombineModelsModuleLogicPython as vtkbool
+    booleanFilter = vtkbool.vtkPolyDataBooleanFilter()
+    if operation == 'union':
+      booleanFilter.SetOperModeToUnion()
+    elif operation == 'difference':
+      booleanFilter.SetOperModeToDifference()
+    else:
+      raise ValueError("Unknown boolean operation: " + operation)
+
+    booleanFilter.SetInputData(0,polyDataA)
+    booleanFilter.SetInputData(1,polyDataB)
+    booleanFilter.Update()
+    for retryIndex in range(numberOfRetries):
+      if booleanFilter.GetOutput().GetNumberOfPoints() > 0:
+        break
+      translation = vtk.vtkTransform()
+      translation.Translate(np.random.uniform(-1e-4,1e-4,3))
+      translationFilter = vtk.vtkTransformPolyDataFilter()
+      translationFilter.SetInputData(polyDataB)
+      translationFilter.SetTransform(translation)
+      booleanFilter.SetInputConnection(1,translationFilter.GetOutputPort())
+      booleanFilter.Update()
+
+    resultPolyData = vtk.vtkPolyData()
+    resultPolyData.DeepCopy(booleanFilter.GetOutput())
+    return resultPolyData
+
+  @timedStage
+  def runPlanningCase(self,boneModelPath,boneCurvePath,boneCutPlanesPaths,parameters,outputDirectory,
+    boneSurgicalGuideBasePath=None,boneFiducialListPath=None,automaticPositioning=False):
+    """
+    Plans a case without the widget: cuts the bone, computes the corrected position of the bone segments,
+    creates the miter boxes and, if a surgical guide base and screw fiducials are given, the surgical guide.
+    Bone segments, corrected bone segments, miter boxes and the guide are saved as STL in outputDirectory
+    together with planningSummary.json. Returns the summary.
+    """
+    stagesTimes = {}
+    startTime = time.perf_counter()
+
+    parameterNode = self.getParameterNode()
+    self.setDefaultParameters(parameterNode)
+    for parameterName in parameters:
+      parameterNode.SetParameter(parameterName, str(parameters[parameterName]))
+
+    boneModel = slicer.util.loadModel(boneModelPath)
+    boneCurve = slicer.util.loadMarkups(boneCurvePath)
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+    if boneSurgicalGuideBasePath:
+      parameterNode.SetNodeReferenceID("boneSurgicalGuideBaseModel", slicer.util.loadModel(boneSurgicalGuideBasePath).GetID())
+    if boneFiducialListPath:
+      parameterNode.SetNodeReferenceID("boneFiducialList", slicer.util.loadMarkups(boneFiducialListPath).GetID())
+
+    #Bone cut planes are ordered along the bone curve as when they are added interactively
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    shNode.SetItemParent(shNode.GetItemByDataNode(boneCurve), self.getParentFolderItemID())
+    boneCutPlanesFolder = self.folderRegistry.getFolderItemID("Bone Cut Planes",createIfMissing=True)
+    for boneCutPlanePath in boneCutPlanesPaths:
+      boneCutPlane = slicer.util.loadMarkups(boneCutPlanePath)
+      shNode.SetItemParent(shNode.GetItemByDataNode(boneCutPlane), boneCutPlanesFolder)
+    #Sorts the planes in the folder by their arc length along the bone curve
+    self.getBoneCutPlanesList()
+    self.addBoneCutPlanesObservers()
+    stagesTimes["loading"] = time.perf_counter() - startTime
+
+    if not self.boneCutPlanesNumberIsEven():
+      raise ValueError("Bone cut planes number is odd, it should be even.")
+
+    stageStartTime = time.perf_counter()
+    if automaticPositioning:
+      self.automaticNormalAndOriginDefinitionOfBoneCutPlanes()
+    else:
+      self.createAndUpdateDynamicModelerNodes()
+      self.transformBonePiecesToCorrectedPosition()
+    stagesTimes["cutting"] = time.perf_counter() - stageStartTime
+
+    stageStartTime = time.perf_counter()
+    self.createMiterBoxesFromBoneCutPlanes()
+    stagesTimes["miterBoxes"] = time.perf_counter() - stageStartTime
+
+    surgicalGuideModel = None
+    if boneSurgicalGuideBasePath and boneFiducialListPath:
+      stageStartTime = time.perf_counter()
+      self.createCylindersFromFiducialListAndBoneSurgicalGuideBase()
+      surgicalGuideModel = self.makeBooleanOperationsToBoneSurgicalGuideBase()
+      stagesTimes["surgicalGuide"] = time.perf_counter() - stageStartTime
+
+    os.makedirs(outputDirectory, exist_ok=True)
+    cutBonePiecesList = self.folderRegistry.getNodesOfFolder("Cut Bone Pieces")
+    correctedPositionMatrices = []
+    for i in range(len(cutBonePiecesList)):
+      slicer.util.saveNode(cutBonePiecesList[i], os.path.join(outputDirectory, "boneSegment%d.stl" % i))
+      transformNode = cutBonePiecesList[i].GetParentTransformNode()
+      correctedPositionMatrices.append(slicer.util.arrayFromTransformMatrix(transformNode).tolist() if transformNode else np.eye(4).tolist())
+
+      correctedBonePiece = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+      correctedBonePiece.SetAndObservePolyData(getCompactCopyOfPolyData(cutBonePiecesList[i].GetPolyData()))
+      if transformNode:
+        correctedBonePiece.SetAndObserveTransformNodeID(transformNode.GetID())
+        correctedBonePiece.HardenTransform()
+      slicer.util.saveNode(correctedBonePiece, os.path.join(outputDirectory, "correctedBoneSegment%d.stl" % i))
+      slicer.mrmlScene.RemoveNode(correctedBonePiece)
+
+    miterBoxesModelsList = self.folderRegistry.getNodesOfFolder("miterBoxes Models")
+    biggerMiterBoxesModelsList = self.folderRegistry.getNodesOfFolder("biggerMiterBoxes Models")
+    for i in range(len(miterBoxesModelsList)):
+      slicer.util.saveNode(miterBoxesModelsList[i], os.path.join(outputDirectory, "miterBox%d.stl" % i))
+      slicer.util.saveNode(biggerMiterBoxesModelsList[i], os.path.join(outputDirectory, "biggerMiterBox%d.stl" % i))
+    if surgicalGuideModel is not None:
+      slicer.util.saveNode(surgicalGuideModel, os.path.join(outputDirectory, "surgicalGuide.stl"))
+
+    stagesTimes["total"] = time.perf_counter() - startTime
+    summary = {
+      "boneModel": boneModelPath,
+      "parameters": {
+        parameterName: parameterNode.GetParameter(parameterName)
+        for parameterName in parameterNode.GetParameterNames()
+        if parameterName not in self.runtimeParametersNames
+      },
+      "numberOfBoneSegments": len(cutBonePiecesList),
+      "correctedPositionMatrices": correctedPositionMatrices,
+      "numberOfMiterBoxes": len(miterBoxesModelsList),
+      "surgicalGuideCreated": surgicalGuideModel is not None,
+      "positioningStatistics": self.lastPositioningStatistics,
+      "stagesTimes": stagesTimes
+    }
+    import json
+    with open(os.path.join(outputDirectory, "planningSummary.json"), "w") as summaryFile:
+      json.dump(summary, summaryFile, indent=2)
+    return summary
+
+#
+# ModelSlicingService
+#
+
+class ModelSlicingService:
+  """Computes intersections of models with planes without adding nodes to the scene.
+  One vtkCutter/vtkPlane pipeline is kept per model node and reused by every query,
+  results are returned as NumPy arrays.
+  """
+
+  def __init__(self):
+    self.cutterPipelines = {}
+    self.sectionEngines = {}
+    #Centroids and radiuses are computed from the area of the section instead of from the contour points
+    self.useAreaWeightedCentroids = False
+    #Seconds spent on each plane of the last getCentroidsOfIntersections call
+    self.lastComputationTimes = np.zeros(0)
+
+  def clear(self):
+    self.cutterPipelines = {}
+    self.sectionEngines = {}
+
+  def getSectionEngine(self,modelNode):
+    polyData = modelNode.GetPolyData()
+    sectionEngine = self.sectionEngines.get(modelNode.GetID())
+    if (sectionEngine is None) or not sectionEngine.isUpToDate(polyData):
+      sectionEngine = MeshSectionEngine(polyData)
+      self.sectionEngines[modelNode.GetID()] = sectionEngine
+    return sectionEngine
+
+  def getCutterPipeline(self,modelNode):
+    polyData = modelNode.GetPolyData()
+    pipeline = self.cutterPipelines.get(modelNode.GetID())
+    if (pipeline is None) or (pipeline["polyData"] is not polyData):
+      plane = vtk.vtkPlane()
+      cutter = vtk.vtkCutter()
+      cutter.SetInputData(polyData)
+      cutter.SetCutFunction(plane)
+      pipeline = {"polyData": polyData, "plane": plane, "cutter": cutter}
+      self.cutterPipelines[modelNode.GetID()] = pipeline
+    return pipeline
+
+  def getIntersectionPolyData(self,modelNode,origin,normal):
+    """Returns a copy of the intersection contour of the model with the plane"""
+    pipeline = self.getCutterPipeline(modelNode)
+    pipeline["plane"].SetOrigin(origin)
+    pipeline["plane"].SetNormal(normal)
+    pipeline["cutter"].Update()
+    intersectionPolyData = vtk.vtkPolyData()
+    intersectionPolyData.DeepCopy(pipeline["cutter"].GetOutput())
+    return intersectionPolyData
+
+  def getIntersectionPoints(self,modelNode,origin,normal):
+    pipeline = self.getCutterPipeline(modelNode)
+    pipeline["plane"].SetOrigin(origin)
+    pipeline["plane"].SetNormal(normal)
+    pipeline["cutter"].Update()
+    return self.getPointsOfPolyData(pipeline["cutter"].GetOutput())
+
+  def getCentroidOfIntersection(self,modelNode,origin,normal):
+    if self.useAreaWeightedCentroids:
+      return self.getSectionEngine(modelNode).getSectionCentroid(origin,normal)
+    return self.getCentroidOfPoints(self.getIntersectionPoints(modelNode,origin,normal))
+
+  def getMaxRadiusOfIntersection(self,modelNode,origin,normal):
+    if self.useAreaWeightedCentroids:
+      return self.getSectionEngine(modelNode).getSection(origin,normal)["polarExtent"]
+    intersectionPoints = self.getIntersectionPoints(modelNode,origin,normal)
+    intersectionCentroid = self.getCentroidOfPoints(intersectionPoints)
+    radiuses = np.linalg.norm(intersectionPoints-intersectionCentroid,axis=1)
+    return np.max(radiuses)
+
+  def getCentroidsOfIntersections(self,modelNode,origins,normals):
+    """
+    Returns an (n,3) array with the centroids of the intersections of the model with n planes
+    computed on the cached mesh of the section engine. Rows of planes that do not cut the model are nan.
+    """
+    sectionEngine = self.getSectionEngine(modelNode)
+    centroids = np.full((len(origins),3),np.nan)
+    self.lastComputationTimes = np.zeros(len(origins))
+    for i in range(len(origins)):
+      startTime = time.perf_counter()
+      section = sectionEngine.getSection(origins[i],normals[i])
+      self.lastComputationTimes[i] = time.perf_counter() - startTime
+      if section["centroid"] is None:
+        continue
+      if self.useAreaWeightedCentroids:
+        centroids[i] = section["centroid"]
+      else:
+        centroids[i] = section["contourPointsAverage"]
+    return centroids
+
+  def getIntersectionPointsOfPolyDataAndPlane(self,polyData,origin,normal):
+    plane = vtk.vtkPlane()
+    plane.SetOrigin(origin)
+    plane.SetNormal(normal)
+    cutter = vtk.vtkCutter()
+    cutter.SetInputData(polyData)
+    cutter.SetCutFunction(plane)
+    cutter.Update()
+    return self.getPointsOfPolyData(cutter.GetOutput())
+
+  def getPointsOfPolyData(self,polyData):
+    if (polyData.GetPoints() is None) or (polyData.GetNumberOfPoints() == 0):
+      return np.zeros((0,3))
+    from vtk.util.numpy_support import vtk_to_numpy
+    return np.array(vtk_to_numpy(polyData.GetPoints().GetData()),dtype=float)
+
+  def getCentroidOfPoints(self,points):
+    return np.average(points, axis=0)
+
+#
+# AndersonAcceleration
+#
+
+class AndersonAcceleration:
+  """Anderson acceleration of a fixed-point iteration x = g(x) that keeps a short history of
+  iterates. The history is restarted when the residual grows so the iteration falls back to
+  plain fixed-point steps.
+  """
+
+  def __init__(self,historySize=2):
+    self.historySize = historySize
+    self.evaluations = []
+    self.residuals = []
+
+  def getNextIterate(self,x,gx):
+    residual = gx - x
+    if (len(self.residuals) > 0) and (np.linalg.norm(residual) > np.linalg.norm(self.residuals[-1])):
+      self.evaluations = []
+      self.residuals = []
+    self.evaluations = (self.evaluations + [gx])[-(self.historySize+1):]
+    self.residuals = (self.residuals + [residual])[-(self.historySize+1):]
+    if len(self.residuals) < 2:
+      return gx
+
+    deltaEvaluations = np.diff(np.array(self.evaluations),axis=0).T
+    deltaResiduals = np.diff(np.array(self.residuals),axis=0).T
+    gamma = np.linalg.lstsq(deltaResiduals,residual,rcond=None)[0]
+    return gx - deltaEvaluations @ gamma
+
+#
+# NearestPointIndex
+#
+
+class NearestPointIndex:
+  """Nearest point queries of many positions at once over a fixed set of points. Uses a
+  scipy KD-tree when scipy is available and a chunked NumPy search otherwise.
+  """
+
+  def __init__(self,points):
+    self.points = np.array(points,dtype=float).reshape(-1,3)
+    self.kdTree = None
+    try:
+      from scipy.spatial import cKDTree
+      self.kdTree = cKDTree(self.points)
+    except ImportError:
+      pass
+
+  def getNearestPointIDs(self,positions):
+    positions = np.array(positions,dtype=float).reshape(-1,3)
+    if self.kdTree is not None:
+      return self.kdTree.query(positions)[1]
+
+    nearestPointIDs = np.zeros(len(positions),dtype=int)
+    chunkSize = max(1,int(2e7)//max(1,len(self.points)))
+    for start in range(0,len(positions),chunkSize):
+      chunk = positions[start:start+chunkSize]
+      squaredDistances = (
+        np.sum(chunk**2,axis=1)[:,np.newaxis] - 2*chunk @ self.points.T + np.sum(self.points**2,axis=1)[np.newaxis,:]
+      )
+      nearestPointIDs[start:start+chunkSize] = np.argmin(squaredDistances,axis=1)
+    return nearestPointIDs
+
+#
+# SurfacePointsIndex
+#
+
+class SurfacePointsIndex:
+  """Nearest point index and point normals of a surface. Normals are computed the first time
+  they are requested and kept until the polydata changes.
+  """
+
+  def __init__(self,polyData):
+    self.polyData = polyData
+    self.polyDataMTime = polyData.GetMTime()
+    from vtk.util.numpy_support import vtk_to_numpy
+    self.nearestPointIndex = NearestPointIndex(vtk_to_numpy(polyData.GetPoints().GetData()))
+    self.pointsNormals = {}
+
+  def isUpToDate(self,polyData):
+    return (polyData is self.polyData) and (polyData.GetMTime() == self.polyDataMTime)
+
+  def getPointsNormals(self,areaWeighted=False):
+    if areaWeighted not in self.pointsNormals:
+      if areaWeighted:
+        self.pointsNormals[areaWeighted] = getAreaWeightedPointsNormalsOfPolyData(self.polyData)
+      else:
+        self.pointsNormals[areaWeighted] = getPointsNormalsOfPolyData(self.polyData)
+    return self.pointsNormals[areaWeighted]
+
+  def getNormalsAtNearestPoints(self,positions,areaWeighted=False):
+    return self.getPointsNormals(areaWeighted)[self.nearestPointIndex.getNearestPointIDs(positions)]
+
+#
+# CurveFrameTable
+#
+
+class CurveFrameTable:
+  """Curve points of a markups curve with their cumulative arc length and curve point to world
+  matrices (X normal, Y binormal, Z tangent and curve point as translation) as NumPy arrays.
+  Closest curve point queries of any number of positions are done in one vectorized call.
+  """
+
+  def __init__(self,curveNode):
+    from vtk.util.numpy_support import vtk_to_numpy
+    curveWorld = curveNode.GetCurveWorld()
+    numberOfCurvePoints = curveWorld.GetNumberOfPoints() if curveWorld is not None else 0
+    self.curvePointsToWorldMatrices = np.zeros((numberOfCurvePoints,4,4))
+    self.curvePointsToWorldMatrices[:,3,3] = 1
+    #The curve keeps the frames of its points as point data, the same ones GetCurvePointToWorldTransformAtPointIndex reads
+    framesArrays = [curveWorld.GetPointData().GetArray(arrayName) for arrayName in ["Normals","Binormals","Tangents"]] if numberOfCurvePoints > 0 else []
+    if all((frameArray is not None) and (frameArray.GetNumberOfTuples() == numberOfCurvePoints) for frameArray in framesArrays):
+      for axisIndex, frameArray in enumerate(framesArrays):
+        self.curvePointsToWorldMatrices[:,:3,axisIndex] = vtk_to_numpy(frameArray)
+      self.curvePointsToWorldMatrices[:,:3,3] = vtk_to_numpy(curveWorld.GetPoints().GetData())
+    else:
+      matrix = vtk.vtkMatrix4x4()
+      for i in range(numberOfCurvePoints):
+        curveNode.GetCurvePointToWorldTransformAtPointIndex(i,matrix)
+        self.curvePointsToWorldMatrices[i] = slicer.util.arrayFromVTKMatrix(matrix)
+    self.curvePointsPositions = self.curvePointsToWorldMatrices[:,:3,3]
+    segmentsLengths = np.linalg.norm(np.diff(self.curvePointsPositions,axis=0),axis=1)
+    self.arcLengths = np.concatenate([[0.],np.cumsum(segmentsLengths)])
+    self.nearestPointIndex = NearestPointIndex(self.curvePointsPositions)
+
+  def getClosestCurvePointsIndexes(self,positions):
+    return self.nearestPointIndex.getNearestPointIDs(positions)
+
+  def getArcLengthsOfClosestCurvePoints(self,positions):
+    return self.arcLengths[self.getClosestCurvePointsIndexes(positions)]
+
+  def getCurvePointsToWorldMatricesOfClosestCurvePoints(self,positions):
+    return self.curvePointsToWorldMatrices[self.getClosestCurvePointsIndexes(positions)]
+
+#
+# ArcLengthOrderedIndex
+#
+
+class ArcLengthOrderedIndex:
+  """Keys sorted by their arc length along a curve. Insertions, removals, updates and position
+  lookups use binary search on the sort keys (arc length, tie breaker) of the keys, the tie
+  breaker keeps the insertion order of keys with equal arc length.
+  """
+
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self.sortKeys = []
+    self.keys = []
+    self.sortKeysOfKeys = {}
+
+  def __len__(self):
+    return len(self.keys)
+
+  def __contains__(self,key):
+    return key in self.sortKeysOfKeys
+
+  def getKeys(self):
+    return list(self.keys)
+
+  def getPosition(self,key):
+    return bisect.bisect_left(self.sortKeys,self.sortKeysOfKeys[key])
+
+  def insert(self,key,arcLength):
+    #Keys with equal arc length keep their insertion order
+    position = bisect.bisect_right(self.sortKeys,(arcLength,np.inf))
+    tieBreaker = 0.
+    if (position > 0) and (self.sortKeys[position-1][0] == arcLength):
+      tieBreaker = self.sortKeys[position-1][1] + 1
+    self.setSortKeyAtPosition(key,(arcLength,tieBreaker),position)
+    return position
+
+  def setSortKeyAtPosition(self,key,sortKey,position):
+    self.sortKeys.insert(position,sortKey)
+    self.keys.insert(position,key)
+    self.sortKeysOfKeys[key] = sortKey
+
+  def remove(self,key):
+    position = self.getPosition(key)
+    del self.sortKeys[position]
+    del self.keys[position]
+    del self.sortKeysOfKeys[key]
+    return position
+
+  def update(self,key,arcLength):
+    """Returns the old and new positions of the key."""
+    oldPosition = self.remove(key)
+    #Keep the key in place if it did not pass any neighbor
+    previousSortKey = self.sortKeys[oldPosition-1] if oldPosition > 0 else (-np.inf,0.)
+    nextSortKey = self.sortKeys[oldPosition] if oldPosition < len(self.keys) else (np.inf,0.)
+    if not (previousSortKey[0] <= arcLength <= nextSortKey[0]):
+      return oldPosition, self.insert(key,arcLength)
+    if previousSortKey[0] == arcLength == nextSortKey[0]:
+      tieBreaker = (previousSortKey[1] + nextSortKey[1])/2
+    elif previousSortKey[0] == arcLength:
+      tieBreaker = previousSortKey[1] + 1
+    elif nextSortKey[0] == arcLength:
+      tieBreaker = nextSortKey[1] - 1
+    else:
+      tieBreaker = 0.
+    self.setSortKeyAtPosition(key,(arcLength,tieBreaker),oldPosition)
+    return oldPosition, oldPosition
+
+#
+# SubjectHierarchyFolderRegistry
+#
+
+class SubjectHierarchyFolderRegistry:
+  """Item IDs of the folders of the module and the ordered data nodes of each folder. Folders are
+  looked up by name among the children of the root folder of the module, so folders with the same
+  name elsewhere in the scene are ignored. Results are kept until a subject hierarchy event
+  adds, removes, reparents or renames the folder, or adds, removes, reparents or reorders one of
+  its children. Modifications of the data nodes of the children keep the lists.
+  """
+
+  def __init__(self,rootFolderName):
+    self.rootFolderName = rootFolderName
+    self.shNode = None
+    self.shNodeObservers = []
+    self.foldersItemIDs = {}
+    self.foldersNodesLists = {}
+    #Positions of the children of the folders with a nodes list and the folder of each child
+    self.foldersItemsPositions = {}
+    self.foldersOfItems = {}
+    self.sceneEndCloseObserver = slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent,self.onSceneEndClose)
+
+  def onSceneEndClose(self,caller,event):
+    self.clear()
+
+  def clear(self):
+    self.foldersItemIDs = {}
+    self.foldersNodesLists = {}
+    self.foldersItemsPositions = {}
+    self.foldersOfItems = {}
+
+  def getSubjectHierarchyNode(self):
+    #The subject hierarchy node is replaced when the scene is cleared
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    if shNode is not self.shNode:
+      self.removeObservers()
+      self.clear()
+      self.shNode = shNode
+      for event in [
+        shNode.SubjectHierarchyItemAddedEvent,
+        shNode.SubjectHierarchyItemAboutToBeRemovedEvent,
+        shNode.SubjectHierarchyItemReparentedEvent,
+        shNode.SubjectHierarchyItemModifiedEvent
+      ]:
+        self.shNodeObservers.append(shNode.AddObserver(event,self.onSubjectHierarchyItemEvent))
+    return shNode
+
+  def removeObservers(self):
+    if self.shNode is not None:
+      for observer in self.shNodeObservers:
+        self.shNode.RemoveObserver(observer)
+    self.shNodeObservers = []
+
+  def cleanup(self):
+    """Removes the observers of the scene and of the subject hierarchy node, the registry is not usable afterwards."""
+    self.removeObservers()
+    self.shNode = None
+    slicer.mrmlScene.RemoveObserver(self.sceneEndCloseObserver)
+    self.clear()
+
+  @vtk.calldata_type(vtk.VTK_LONG)
+  def onSubjectHierarchyItemEvent(self,caller,event,itemID):
+    folderNames = [folderName for folderName, folderItemID in self.foldersItemIDs.items() if folderItemID == itemID]
+    if len(folderNames) > 0:
+      if (event == caller.SubjectHierarchyItemModifiedEvent) and (caller.GetItemName(itemID) == folderNames[0]):
+        return
+      #A folder was renamed, moved or removed
+      self.clear()
+    elif event == caller.SubjectHierarchyItemModifiedEvent:
+      #Data nodes of the children are modified at every plane drag or bone segment update,
+      #only a child moved under its folder changes the list
+      folderItemID = self.foldersOfItems.get(itemID)
+      if (folderItemID is not None) and (caller.GetItemPositionUnderParent(itemID) != self.foldersItemsPositions[folderItemID][itemID]):
+        self.invalidateNodesOfFolder(folderItemID)
+    else:
+      #The previous folder of a reparented item is the one whose list has it
+      folderItemID = self.foldersOfItems.get(itemID)
+      if folderItemID is not None:
+        self.invalidateNodesOfFolder(folderItemID)
+      self.invalidateNodesOfFolder(caller.GetItemParent(itemID))
+
+  def getRootFolderItemID(self):
+    shNode = self.getSubjectHierarchyNode()
+    if self.rootFolderName not in self.foldersItemIDs:
+      folderItemID = shNode.GetItemChildWithName(shNode.GetSceneItemID(),self.rootFolderName)
+      if not folderItemID:
+        #The root folder may have been moved into a patient or study folder
+        folderItemID = shNode.GetItemByName(self.rootFolderName)
+      if not folderItemID:
+        folderItemID = shNode.CreateFolderItem(shNode.GetSceneItemID(),self.rootFolderName)
+      self.foldersItemIDs[self.rootFolderName] = folderItemID
+    return self.foldersItemIDs[self.rootFolderName]
+
+  def getFolderItemID(self,folderName,createIfMissing=False):
+    """Returns the item ID of the folder with that name in the root folder, 0 if there is none and createIfMissing is False."""
+    if folderName == self.rootFolderName:
+      return self.getRootFolderItemID()
+    rootFolderItemID = self.getRootFolderItemID()
+    shNode = self.getSubjectHierarchyNode()
+    if folderName not in self.foldersItemIDs:
+      folderItemID = shNode.GetItemChildWithName(rootFolderItemID,folderName)
+      if not folderItemID:
+        if not createIfMissing:
+          return 0
+        folderItemID = shNode.CreateFolderItem(rootFolderItemID,folderName)
+      self.foldersItemIDs[folderName] = folderItemID
+    return self.foldersItemIDs[folderName]
+
+  def removeFolder(self,folderName):
+    """Removes the folder with that name from the root folder together with its children."""
+    folderItemID = self.getFolderItemID(folderName)
+    if folderItemID:
+      self.getSubjectHierarchyNode().RemoveItem(folderItemID)
+
+  def recreateFolder(self,folderName):
+    """Replaces the folder with that name by an empty one and returns its item ID."""
+    self.removeFolder(folderName)
+    return self.getFolderItemID(folderName,createIfMissing=True)
+
+  def invalidateNodesOfFolder(self,folderItemID):
+    self.foldersNodesLists.pop(folderItemID,None)
+    for itemID in self.foldersItemsPositions.pop(folderItemID,{}):
+      self.foldersOfItems.pop(itemID,None)
+
+  def getNodesOfFolder(self,folderName):
+    """Returns a new list with the data nodes of the folder in subject hierarchy order."""
+    folderItemID = self.getFolderItemID(folderName)
+    if not folderItemID:
+      return []
+    if folderItemID not in self.foldersNodesLists:
+      shNode = self.getSubjectHierarchyNode()
+      childrenItemIDs = vtk.vtkIdList()
+      shNode.GetItemChildren(folderItemID,childrenItemIDs)
+      nodesList = []
+      itemsPositions = {}
+      for position in range(childrenItemIDs.GetNumberOfIds()):
+        childItemID = childrenItemIDs.GetId(position)
+        nodesList.append(shNode.GetItemDataNode(childItemID))
+        itemsPositions[childItemID] = position
+        self.foldersOfItems[childItemID] = folderItemID
+      self.foldersNodesLists[folderItemID] = nodesList
+      self.foldersItemsPositions[folderItemID] = itemsPositions
+    return list(self.foldersNodesLists[folderItemID])
+
+#
+# StageTimingRecorder
+#
+
+class StageTimingRecorder:
+  """Wall time, number of cells of the processed mesh and parent stage of each call of nested
+  stages. Nothing is recorded while it is disabled. When profiling is enabled the outermost
+  stages also run under cProfile and the statistics are accumulated until clear is called.
+  """
+
+  def __init__(self,maximumNumberOfRecords=100000):
+    self.enabled = False
+    self.profilingEnabled = False
+    self.records = collections.deque(maxlen=maximumNumberOfRecords)
+    self.stagesStack = []
+    self.profiler = None
+
+  def clear(self):
+    self.records.clear()
+    self.profiler = None
+
+  @contextlib.contextmanager
+  def stage(self,stageName,numberOfCells=-1):
+    if not self.enabled:
+      yield
+      return
+
+    profilerWasEnabled = False
+    if self.profilingEnabled and (len(self.stagesStack) == 0):
+      import cProfile
+      if self.profiler is None:
+        self.profiler = cProfile.Profile()
+      try:
+        self.profiler.enable()
+        profilerWasEnabled = True
+      except ValueError:
+        #Another profiler is active, e.g. the stage is run from cProfile.run
+        pass
+
+    parentStageName = self.stagesStack[-1] if len(self.stagesStack) > 0 else ""
+    self.stagesStack.append(stageName)
+    startTime = time.perf_counter()
+    try:
+      yield
+    finally:
+      duration = time.perf_counter() - startTime
+      self.stagesStack.pop()
+      if profilerWasEnabled:
+        self.profiler.disable()
+      self.records.append({
+        "stage": stageName,
+        "parentStage": parentStageName,
+        "depth": len(self.stagesStack),
+        "startTime": startTime,
+        "duration": duration,
+        "numberOfCells": int(numberOfCells)
+      })
+
+  def getSummary(self):
+    """Returns the number of calls, total, mean and maximum time and maximum number of cells of each stage."""
+    summary = {}
+    for record in self.records:
+      if record["stage"] not in summary:
+        summary[record["stage"]] = {"numberOfCalls": 0, "totalTime": 0., "maximumTime": 0., "maximumNumberOfCells": -1}
+      stageSummary = summary[record["stage"]]
+      stageSummary["numberOfCalls"] += 1
+      stageSummary["totalTime"] += record["duration"]
+      stageSummary["maximumTime"] = max(stageSummary["maximumTime"],record["duration"])
+      stageSummary["maximumNumberOfCells"] = max(stageSummary["maximumNumberOfCells"],record["numberOfCells"])
+    for stageName in summary:
+      summary[stageName]["meanTime"] = summary[stageName]["totalTime"]/summary[stageName]["numberOfCalls"]
+    return summary
+
+  def exportToFile(self,filePath):
+    import json, csv
+    recordsList = list(self.records)
+    if os.path.splitext(filePath)[1].lower() == ".json":
+      with open(filePath, "w") as outputFile:
+        json.dump({"records": recordsList, "summary": self.getSummary()}, outputFile, indent=2)
+    else:
+      with open(filePath, "w", newline="") as outputFile:
+        writer = csv.DictWriter(outputFile, fieldnames=["stage","parentStage","depth","startTime","duration","numberOfCells"])
+        writer.writeheader()
+        writer.writerows(recordsList)
+    if self.profiler is not None:
+      self.profiler.dump_stats(os.path.splitext(filePath)[0] + ".prof")
+
+#
+# PlanningStateHistory
+#
+
+class PlanningStateHistory:
+  """Undo/redo list of planning states. Recording a state after an undo drops the states that
+  could be redone, the oldest states are dropped once there are more than maximumNumberOfStates.
+  """
+
+  def __init__(self,maximumNumberOfStates=200):
+    self.maximumNumberOfStates = maximumNumberOfStates
+    self.states = []
+    self.currentIndex = -1
+
+  def clear(self):
+    self.states = []
+    self.currentIndex = -1
+
+  def __len__(self):
+    return len(self.states)
+
+  def canUndo(self):
+    return self.currentIndex > 0
+
+  def canRedo(self):
+    return self.currentIndex < len(self.states) -1
+
+  def record(self,state):
+    if (self.currentIndex >= 0) and self.statesAreEqual(self.states[self.currentIndex],state):
+      return False
+    del self.states[self.currentIndex+1:]
+    self.states.append(state)
+    del self.states[:max(len(self.states) - self.maximumNumberOfStates,0)]
+    self.currentIndex = len(self.states) -1
+    return True
+
+  def undo(self):
+    self.currentIndex -= 1
+    return self.states[self.currentIndex]
+
+  def redo(self):
+    self.currentIndex += 1
+    return self.states[self.currentIndex]
+
+  def statesAreEqual(self,stateA,stateB):
+    if stateA.keys() != stateB.keys():
+      return False
+    for key in stateA:
+      if isinstance(stateA[key],np.ndarray) or isinstance(stateB[key],np.ndarray):
+        if not np.array_equal(stateA[key],stateB[key]):
+          return False
+      elif stateA[key] != stateB[key]:
+        return False
+    return True
+
+  def getMemorySizeOfState(self,state):
+    """Approximate memory in bytes of the arrays and strings of the state"""
+    memorySize = 0
+    for value in state.values():
+      if isinstance(value,np.ndarray):
+        memorySize += value.nbytes
+      elif isinstance(value,dict):
+        memorySize += sum(len(key) + len(item) for key, item in value.items())
+      elif isinstance(value,list):
+        memorySize += sum(len(item) for item in value)
+      elif isinstance(value,str):
+        memorySize += len(value)
+    return memorySize
+
+  def getMemorySize(self):
+    return sum(self.getMemorySizeOfState(state) for state in self.states)
+
+#
+# LeastRecentlyUsedCache
+#
+
+class LeastRecentlyUsedCache:
+  """Cache that evicts the least recently used entries once the memory of its entries exceeds
+  the budget. Entries bigger than the budget are not cached. Counts hits, misses and evictions.
+  """
+
+  def __init__(self,memoryBudget=0):
+    #Memory budget in KiB, nothing is cached if it is zero
+    self.memoryBudget = memoryBudget
+    self.entries = collections.OrderedDict()
+    self.memorySize = 0
+    self.resetStatistics()
+
+  def resetStatistics(self):
+    self.numberOfHits = 0
+    self.numberOfMisses = 0
+    self.numberOfEvictions = 0
+    self.evictedMemorySize = 0
+    self.numberOfClears = 0
+
+  def clear(self):
+    if len(self.entries) > 0:
+      self.numberOfClears += 1
+    self.entries.clear()
+    self.memorySize = 0
+
+  def __len__(self):
+    return len(self.entries)
+
+  def __contains__(self,key):
+    return key in self.entries
+
+  def get(self,key):
+    entry = self.entries.get(key)
+    if entry is None:
+      self.numberOfMisses += 1
+      return None
+    self.entries.move_to_end(key)
+    self.numberOfHits += 1
+    return entry[0]
+
+  def add(self,key,value,memorySize):
+    if key in self.entries:
+      self.memorySize -= self.entries.pop(key)[1]
+    if memorySize > self.memoryBudget:
+      return False
+    self.entries[key] = (value,memorySize)
+    self.memorySize += memorySize
+    self.evictEntriesOverBudget()
+    return True
+
+  def setMemoryBudget(self,memoryBudget):
+    self.memoryBudget = memoryBudget
+    self.evictEntriesOverBudget()
+
+  def evictEntriesOverBudget(self):
+    while (self.memorySize > self.memoryBudget) and (len(self.entries) > 0):
+      key, (value, memorySize) = self.entries.popitem(last=False)
+      self.memorySize -= memorySize
+      self.numberOfEvictions += 1
+      self.evictedMemorySize += memorySize
+
+  def getStatistics(self):
+    numberOfQueries = self.numberOfHits + self.numberOfMisses
+    return {
+      "numberOfEntries": len(self.entries),
+      "memorySize": self.memorySize,
+      "memoryBudget": self.memoryBudget,
+      "numberOfHits": self.numberOfHits,
+      "numberOfMisses": self.numberOfMisses,
+      "hitRate": self.numberOfHits/numberOfQueries if numberOfQueries > 0 else 0.,
+      "numberOfEvictions": self.numberOfEvictions,
+      "evictedMemorySize": self.evictedMemorySize,
+      "numberOfClears": self.numberOfClears
+    }
+
+#
+# SharedPointsPlaneCutter
+#
+
+class SharedPointsPlaneCutter:
+  """Vectorized NumPy plane cuts of a closed triangle surface whose pieces share one vtkPoints.
+  The shared points start with the points of the cut polydata and the points created on the
+  cut contours of every piece are appended to them, so each piece only stores its own triangles
+  and caps. Points of the contours of recut pieces are reclaimed when they are too many.
+  """
+
+  def __init__(self,polyData):
+    self.setPolyData(polyData)
+
+  def setPolyData(self,polyData):
+    from vtk.util.numpy_support import vtk_to_numpy
+    polys = polyData.GetPolys()
+    if (polyData.GetNumberOfStrips() == 0) and (polys.GetNumberOfCells() > 0) and (polys.IsHomogeneous() == 3):
+      #Triangle meshes are not copied by a triangle filter
+      trianglesPolyData = polyData
+    else:
+      triangleFilter = vtk.vtkTriangleFilter()
+      triangleFilter.SetInputData(polyData)
+      triangleFilter.PassVertsOff()
+      triangleFilter.PassLinesOff()
+      triangleFilter.Update()
+      trianglesPolyData = triangleFilter.GetOutput()
+
+    self.polyData = polyData
+    self.polyDataMTime = polyData.GetMTime()
+    self.trianglesPolyData = trianglesPolyData
+    #Triangles grouped in buckets along the bone, buckets away from the planes are kept or dropped whole
+    self.sectionEngine = MeshSectionEngine(trianglesPolyData)
+    self.sectionEngine.buildArcLengthIndex()
+    self.triangles = self.sectionEngine.triangles
+    self.points = vtk_to_numpy(trianglesPolyData.GetPoints().GetData())
+    self.numberOfParentPoints = len(self.points)
+
+    self.sharedPointsBuffer = None
+    self.numberOfSharedPoints = 0
+    self.sharedPoints = vtk.vtkPoints()
+    self.reserveSharedPoints(self.numberOfParentPoints)
+    self.sharedPointsBuffer[:self.numberOfParentPoints] = self.points
+    self.setNumberOfSharedPoints(self.numberOfParentPoints)
+
+    #Polydata and first point ID and number of the contour points of each piece
+    self.pieces = {}
+    self.numberOfUnusedPoints = 0
+
+  def isUpToDate(self,polyData):
+    return (polyData is self.polyData) and (polyData.GetMTime() == self.polyDataMTime)
+
+  def reserveSharedPoints(self,numberOfPoints):
+    if (self.sharedPointsBuffer is not None) and (len(self.sharedPointsBuffer) >= numberOfPoints):
+      return
+    #Room for the contours of several cuts so the buffer is seldom reallocated
+    sharedPointsBuffer = np.zeros((numberOfPoints + max(1024,self.numberOfParentPoints//20),3),dtype=self.points.dtype)
+    if self.sharedPointsBuffer is not None:
+      sharedPointsBuffer[:self.numberOfSharedPoints] = self.sharedPointsBuffer[:self.numberOfSharedPoints]
+    self.sharedPointsBuffer = sharedPointsBuffer
+
+  def setNumberOfSharedPoints(self,numberOfPoints):
+    from vtk.util.numpy_support import numpy_to_vtk
+    #The points array is a view of the buffer, growing it inside the buffer does not copy the points
+    self.numberOfSharedPoints = numberOfPoints
+    self.sharedPoints.SetData(numpy_to_vtk(self.sharedPointsBuffer[:numberOfPoints],deep=0))
+    self.sharedPoints.Modified()
+
+  def getMemorySize(self):
+    """Memory in KiB of the shared points buffer and of the triangles of the pieces"""
+    memorySize = self.sharedPointsBuffer.nbytes/1024
+    for piece in self.pieces.values():
+      memorySize += piece["polyData"].GetPolys().GetActualMemorySize()
+    return memorySize
+
+  def getCutPiece(self,pieceKey,planesOrigins,planesNormals):
+    """
+    Returns the closed surface of the part of the polydata in the positive side of all the planes.
+    The polydata of the piece with the same key is reused, its previous contour points become unused.
+    """
+    from vtk.util.numpy_support import numpy_to_vtk
+    piece = self.pieces.get(pieceKey)
+    if piece is not None:
+      self.numberOfUnusedPoints += piece["numberOfContourPoints"]
+      piece["numberOfContourPoints"] = 0
+    if self.numberOfUnusedPoints > max(1024,self.numberOfParentPoints//10):
+      self.removeUnusedPoints()
+
+    triangles, contourPointsPositions = self.getClippedTriangles(planesOrigins,planesNormals)
+
+    firstContourPointID = self.numberOfSharedPoints
+    self.reserveSharedPoints(firstContourPointID + len(contourPointsPositions))
+    self.sharedPointsBuffer[firstContourPointID:firstContourPointID + len(contourPointsPositions)] = contourPointsPositions
+    #Contour points are numbered after the parent points while clipping
+    triangles = np.where(triangles < self.numberOfParentPoints,triangles,triangles - self.numberOfParentPoints + firstContourPointID)
+    self.setNumberOfSharedPoints(firstContourPointID + len(contourPointsPositions))
+
+    if piece is None:
+      piece = {"polyData": vtk.vtkPolyData()}
+      self.pieces[pieceKey] = piece
+    piece["firstContourPointID"] = firstContourPointID
+    piece["numberOfContourPoints"] = len(contourPointsPositions)
+    piece["triangles"] = np.ascontiguousarray(triangles,dtype=np.int64)
+
+    polys = vtk.vtkCellArray()
+    polys.SetData(3,numpy_to_vtk(piece["triangles"].ravel(),deep=0,array_type=vtk.VTK_ID_TYPE))
+    piece["polyData"].SetPoints(self.sharedPoints)
+    piece["polyData"].SetPolys(polys)
+    return piece["polyData"]
+
+  def removeUnusedPoints(self):
+    from vtk.util.numpy_support import numpy_to_vtk
+    sharedPointsBuffer = np.zeros_like(self.sharedPointsBuffer)
+    sharedPointsBuffer[:self.numberOfParentPoints] = self.points
+    numberOfSharedPoints = self.numberOfParentPoints
+    for piece in self.pieces.values():
+      firstContourPointID = piece["firstContourPointID"]
+      numberOfContourPoints = piece["numberOfContourPoints"]
+      sharedPointsBuffer[numberOfSharedPoints:numberOfSharedPoints + numberOfContourPoints] = (
+        self.sharedPointsBuffer[firstContourPointID:firstContourPointID + numberOfContourPoints]
+      )
+      isContourPoint = piece["triangles"] >= self.numberOfParentPoints
+      piece["triangles"][isContourPoint] += numberOfSharedPoints - firstContourPointID
+      piece["firstContourPointID"] = numberOfSharedPoints
+      numberOfSharedPoints += numberOfContourPoints
+      polys = vtk.vtkCellArray()
+      polys.SetData(3,numpy_to_vtk(piece["triangles"].ravel(),deep=0,array_type=vtk.VTK_ID_TYPE))
+      piece["polyData"].SetPolys(polys)
+    self.sharedPointsBuffer = sharedPointsBuffer
+    self.setNumberOfSharedPoints(numberOfSharedPoints)
+    self.numberOfUnusedPoints = 0
+
+  def getClippedTriangles(self,planesOrigins,planesNormals):
+    """
+    Returns the triangles of the clipped closed surface, with the contour points numbered after
+    the parent points, and the positions of the contour points.
+    """
+    numberOfParentPoints = self.numberOfParentPoints
+    contourPointsPositions = np.zeros((0,3))
+
+    #Only the triangles of buckets crossed by a plane are clipped, the ones of buckets in the positive
+    #side of all the planes are kept and the ones of buckets in the negative side of a plane are dropped
+    sectionEngine = self.sectionEngine
+    bucketsSides = np.array([
+      sectionEngine.getBucketsSidesOfPlane(np.asarray(origin,dtype=float),np.asarray(normal,dtype=float)/np.linalg.norm(normal))
+      for origin, normal in zip(planesOrigins,planesNormals)
+    ]).reshape(-1,len(sectionEngine.bucketsStarts)-1)
+    bucketsAreKept = np.all(bucketsSides == 1,axis=0)
+    bucketsAreClipped = ~bucketsAreKept & np.all(bucketsSides >= 0,axis=0)
+    def getTrianglesOfBuckets(bucketsIndexes):
+      if len(bucketsIndexes) == 0:
+        return np.zeros((0,3),dtype=self.triangles.dtype)
+      return np.concatenate([
+        self.triangles[sectionEngine.bucketsStarts[bucketIndex]:sectionEngine.bucketsStarts[bucketIndex+1]] for bucketIndex in bucketsIndexes
+      ])
+    unclippedTriangles = getTrianglesOfBuckets(np.nonzero(bucketsAreKept)[0])
+    triangles = getTrianglesOfBuckets(np.nonzero(bucketsAreClipped)[0])
+
+    def getPositions(pointIDs):
+      positions = np.empty((len(pointIDs),3))
+      isParentPoint = pointIDs < numberOfParentPoints
+      positions[isParentPoint] = self.points[pointIDs[isParentPoint]]
+      positions[~isParentPoint] = contourPointsPositions[pointIDs[~isParentPoint] - numberOfParentPoints]
+      return positions
+
+    for origin, normal in zip(planesOrigins,planesNormals):
+      origin = np.asarray(origin,dtype=float)
+      normal = np.asarray(normal,dtype=float)
+      normal = normal/np.linalg.norm(normal)
+      trianglesDistances = (getPositions(triangles.ravel()) - origin).reshape(-1,3,3) @ normal
+
+      trianglesInside = trianglesDistances >= 0
+      numberOfInsideVertices = np.sum(trianglesInside,axis=1)
+      keptTriangles = triangles[numberOfInsideVertices == 3]
+      isClipped = (numberOfInsideVertices == 1) | (numberOfInsideVertices == 2)
+      if not np.any(isClipped):
+        triangles = keptTriangles
+        continue
+
+      #Triangles are rotated so the vertex alone in its side of the plane is the first one
+      clippedTriangles = triangles[isClipped]
+      clippedInside = trianglesInside[isClipped]
+      oneVertexInside = numberOfInsideVertices[isClipped] == 1
+      firstVertex = np.where(oneVertexInside,np.argmax(clippedInside,axis=1),np.argmin(clippedInside,axis=1))
+      clippedTriangles = np.take_along_axis(clippedTriangles,(firstVertex[:,np.newaxis] + np.arange(3)) % 3,axis=1)
+
+      #One contour point per cut edge, shared by the two triangles of the edge
+      cutEdges = np.concatenate((clippedTriangles[:,[0,1]],clippedTriangles[:,[2,0]]))
+      cutEdges = np.sort(cutEdges,axis=1)
+      uniqueCutEdges, cutEdgesContourPoints = np.unique(cutEdges,axis=0,return_inverse=True)
+      cutEdgesContourPoints = cutEdgesContourPoints.reshape(-1)
+      startPositions = getPositions(uniqueCutEdges[:,0])
+      endPositions = getPositions(uniqueCutEdges[:,1])
+      startDistances = (startPositions - origin) @ normal
+      endDistances = (endPositions - origin) @ normal
+      t = (startDistances/(startDistances - endDistances))[:,np.newaxis]
+      newContourPointsPositions = startPositions + t*(endPositions - startPositions)
+
+      firstNewContourPointID = numberOfParentPoints + len(contourPointsPositions)
+      contourPointsPositions = np.concatenate((contourPointsPositions,newContourPointsPositions))
+      edge01ContourPoints = firstNewContourPointID + cutEdgesContourPoints[:len(clippedTriangles)]
+      edge20ContourPoints = firstNewContourPointID + cutEdgesContourPoints[len(clippedTriangles):]
+
+      v0, v1, v2 = clippedTriangles[:,0], clippedTriangles[:,1], clippedTriangles[:,2]
+      oneVertexInsideTriangles = np.stack((v0,edge01ContourPoints,edge20ContourPoints),axis=1)[oneVertexInside]
+      twoVerticesInside = ~oneVertexInside
+      twoVerticesInsideTriangles = np.concatenate((
+        np.stack((v1,v2,edge20ContourPoints),axis=1)[twoVerticesInside],
+        np.stack((v1,edge20ContourPoints,edge01ContourPoints),axis=1)[twoVerticesInside]
+      ))
+
+      #Contour lines follow the boundary of the clipped triangles, so all the loops have the same orientation
+      contourLines = np.where(
+        oneVertexInside[:,np.newaxis],
+        np.stack((edge01ContourPoints,edge20ContourPoints),axis=1),
+        np.stack((edge20ContourPoints,edge01ContourPoints),axis=1)
+      ) - firstNewContourPointID
+      capTriangles = self.getCapTriangles(newContourPointsPositions,contourLines,normal) + firstNewContourPointID
+
+      triangles = np.concatenate((keptTriangles,oneVertexInsideTriangles,twoVerticesInsideTriangles,capTriangles))
+
+    return np.concatenate((unclippedTriangles,triangles)), contourPointsPositions
+
+  def getCapTriangles(self,contourPointsPositions,contourLines,normal):
+    """Triangulates the contours on the plane, the caps face the negative side of the plane."""
+    from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+    contourPoints = vtk.vtkPoints()
+    contourPoints.SetData(numpy_to_vtk(np.ascontiguousarray(contourPointsPositions,dtype=float),deep=1))
+    lines = vtk.vtkCellArray()
+    lines.SetData(2,numpy_to_vtk(np.ascontiguousarray(contourLines,dtype=np.int64).ravel(),deep=1,array_type=vtk.VTK_ID_TYPE))
+    contoursPolyData = vtk.vtkPolyData()
+    contoursPolyData.SetPoints(contourPoints)
+    contoursPolyData.SetLines(lines)
+
+    capPolys = vtk.vtkCellArray()
+    vtk.vtkContourTriangulator.TriangulateContours(contoursPolyData,0,lines.GetNumberOfCells(),capPolys,normal)
+    if capPolys.GetNumberOfCells() == 0:
+      return np.zeros((0,3),dtype=np.int64)
+    capTriangles = vtk_to_numpy(capPolys.GetConnectivityArray()).astype(np.int64).reshape(-1,3)
+
+    capTrianglesPoints = contourPointsPositions[capTriangles]
+    capTrianglesNormals = np.cross(capTrianglesPoints[:,1]-capTrianglesPoints[:,0],capTrianglesPoints[:,2]-capTrianglesPoints[:,0])
+    isFlipped = capTrianglesNormals @ normal > 0
+    capTriangles[isFlipped] = capTriangles[isFlipped][:,[0,2,1]]
+    return capTriangles
+
+#
+# MeshSectionEngine
+#
+
+class MeshSectionEngine:
+  """Vectorized NumPy intersection of a triangle mesh with planes.
+  Point and triangle arrays of the mesh are cached once, every section query only computes
+  signed distances and the intersection segments of the triangles that straddle the plane.
+  The centroid of a section is the centroid of the enclosed area, so it does not depend on
+  how the mesh is tessellated.
+
+  Triangles are sorted along the bone curve (or along the principal axis of the mesh if no
+  curve is given) and grouped in buckets with a bounding sphere each, so a query only visits
+  the triangles of the buckets whose sphere is crossed by the plane.
+  """
+
+  def __init__(self,polyData):
+    self.setPolyData(polyData)
+
+  def setPolyData(self,polyData):
+    from vtk.util.numpy_support import vtk_to_numpy
+    triangleFilter = vtk.vtkTriangleFilter()
+    triangleFilter.SetInputData(polyData)
+    triangleFilter.PassVertsOff()
+    triangleFilter.PassLinesOff()
+    triangleFilter.Update()
+    trianglesPolyData = triangleFilter.GetOutput()
+
+    self.polyData = polyData
+    self.polyDataMTime = polyData.GetMTime()
+    self.points = np.array(vtk_to_numpy(trianglesPolyData.GetPoints().GetData()),dtype=float)
+    self.triangles = vtk_to_numpy(trianglesPolyData.GetPolys().GetConnectivityArray()).reshape(-1,3).astype(np.int64)
+    trianglesPoints = self.points[self.triangles]
+    #Not normalized, they point outwards for consistently oriented closed surfaces
+    self.trianglesNormals = np.cross(trianglesPoints[:,1]-trianglesPoints[:,0],trianglesPoints[:,2]-trianglesPoints[:,0])
+
+    self.bucketsStarts = None
+    self.bucketsCenters = None
+    self.bucketsRadiuses = None
+    self.indexCurvePoints = None
+
+  def isUpToDate(self,polyData):
+    return (polyData is self.polyData) and (polyData.GetMTime() == self.polyDataMTime)
+
+  def getArcLengthOfPoints(self,points,curvePoints):
+    """Arc length along the curve of the closest curve point to each point"""
+    curveSegmentsLengths = np.linalg.norm(np.diff(curvePoints,axis=0),axis=1)
+    curveArcLengths = np.concatenate(([0],np.cumsum(curveSegmentsLengths)))
+    arcLengths = np.empty(len(points))
+    chunkSize = 8192
+    for chunkStart in range(0,len(points),chunkSize):
+      chunkPoints = points[chunkStart:chunkStart+chunkSize]
+      squaredDistances = (
+        np.sum(chunkPoints**2,axis=1)[:,np.newaxis] - 2*chunkPoints @ curvePoints.T + np.sum(curvePoints**2,axis=1)
+      )
+      arcLengths[chunkStart:chunkStart+chunkSize] = curveArcLengths[np.argmin(squaredDistances,axis=1)]
+    return arcLengths
+
+  def buildArcLengthIndex(self,curvePoints=None,numberOfBuckets=None):
+    """Sorts the triangles by the arc length of their centroid along the curve and splits them in
+    buckets with the same number of triangles. If no curve is given the principal axis of the mesh
+    points is used instead.
+    """
+    if curvePoints is None or len(curvePoints) < 2:
+      pointsMean = self.points.mean(axis=0)
+      principalAxis = np.linalg.svd(self.points - pointsMean,full_matrices=False)[2][0]
+      projections = (self.points - pointsMean) @ principalAxis
+      curvePoints = pointsMean + np.linspace(projections.min(),projections.max(),64)[:,np.newaxis]*principalAxis
+      self.indexCurvePoints = None
+    else:
+      curvePoints = np.asarray(curvePoints,dtype=float)
+      self.indexCurvePoints = curvePoints.copy()
+      #A coarse curve is enough to sort the triangles
+      maximumNumberOfCurvePoints = 256
+      if len(curvePoints) > maximumNumberOfCurvePoints:
+        curvePoints = curvePoints[np.linspace(0,len(curvePoints)-1,maximumNumberOfCurvePoints).astype(int)]
+
+    pointsArcLengths = self.getArcLengthOfPoints(self.points,curvePoints)
+    trianglesArcLengths = pointsArcLengths[self.triangles].mean(axis=1)
+    trianglesOrder = np.argsort(trianglesArcLengths,kind='stable')
+    self.triangles = self.triangles[trianglesOrder]
+    self.trianglesNormals = self.trianglesNormals[trianglesOrder]
+
+    numberOfTriangles = len(self.triangles)
+    if numberOfBuckets is None:
+      numberOfBuckets = int(np.clip(numberOfTriangles//256,1,1024))
+    numberOfBuckets = max(1,min(numberOfBuckets,numberOfTriangles))
+    self.bucketsStarts = np.linspace(0,numberOfTriangles,numberOfBuckets+1).astype(np.int64)
+
+    self.bucketsCenters = np.zeros((numberOfBuckets,3))
+    self.bucketsRadiuses = np.zeros(numberOfBuckets)
+    for bucketIndex in range(numberOfBuckets):
+      bucketPoints = self.points[self.triangles[self.bucketsStarts[bucketIndex]:self.bucketsStarts[bucketIndex+1]]].reshape(-1,3)
+      if len(bucketPoints) == 0:
+        continue
+      self.bucketsCenters[bucketIndex] = bucketPoints.mean(axis=0)
+      self.bucketsRadiuses[bucketIndex] = np.max(np.linalg.norm(bucketPoints - self.bucketsCenters[bucketIndex],axis=1))
+
+  def hasIndex(self):
+    return self.bucketsStarts is not None
+
+  def getBucketsSidesOfPlane(self,origin,normal):
+    """Returns 1 for buckets completely in the positive side of the plane, -1 for the ones
+    completely in the negative side and 0 for the ones whose bounding sphere is crossed by the plane
+    """
+    if not self.hasIndex():
+      self.buildArcLengthIndex()
+    centersSignedDistances = (self.bucketsCenters - origin) @ normal
+    bucketsSides = np.sign(centersSignedDistances).astype(np.int64)
+    bucketsSides[np.abs(centersSignedDistances) <= self.bucketsRadiuses] = 0
+    return bucketsSides
+
+  def getTrianglesIndexesThatCanStraddlePlane(self,origin,normal):
+    bucketsSides = self.getBucketsSidesOfPlane(origin,normal)
+    crossedBuckets = np.nonzero(bucketsSides == 0)[0]
+    if len(crossedBuckets) == 0:
+      return np.zeros(0,dtype=np.int64)
+    return np.concatenate([
+      np.arange(self.bucketsStarts[bucketIndex],self.bucketsStarts[bucketIndex+1]) for bucketIndex in crossedBuckets
+    ])
+
+  def getSection(self,origin,normal):
+    """Returns a dictionary with the intersection segments of the mesh and the plane
+    ("contourSegments", an (n,2,3) array oriented counterclockwise around the normal),
+    the "area", the area "centroid" and the "polarExtent" (max distance of the contour
+    to the centroid). The centroid is None when the plane does not cut the mesh.
+    "contourPointsAverage" is the average of the contour points, each one of them is shared by
+    two segments on closed meshes so it equals the average of the vtkCutter output points.
+    """
+    origin = np.asarray(origin,dtype=float)
+    normal = np.asarray(normal,dtype=float)
+    normal = normal/np.linalg.norm(normal)
+
+    candidateTrianglesIndexes = self.getTrianglesIndexesThatCanStraddlePlane(origin,normal)
+    trianglesPoints = self.points[self.triangles[candidateTrianglesIndexes]]
+    trianglesNormals = self.trianglesNormals[candidateTrianglesIndexes]
+
+    signedDistances = (trianglesPoints - origin) @ normal
+    verticesArePositive = signedDistances >= 0
+    numberOfPositiveVertices = verticesArePositive.sum(axis=1)
+    straddling = (numberOfPositiveVertices == 1) | (numberOfPositiveVertices == 2)
+    trianglesPoints = trianglesPoints[straddling]
+    trianglesNormals = trianglesNormals[straddling]
+    signedDistances = signedDistances[straddling]
+    verticesArePositive = verticesArePositive[straddling]
+
+    section = {"contourSegments": np.zeros((0,2,3)), "area": 0.0, "centroid": None, "contourPointsAverage": None, "polarExtent": 0.0}
+    if len(trianglesPoints) == 0:
+      return section
+
+    #Each straddling triangle has exactly two edges that cross the plane
+    edgesCross = verticesArePositive != np.roll(verticesArePositive,-1,axis=1)
+    edgesStarts = np.nonzero(edgesCross)[1].reshape(-1,2)
+    edgesEnds = (edgesStarts+1)%3
+    rows = np.arange(len(trianglesPoints))[:,np.newaxis]
+    startDistances = signedDistances[rows,edgesStarts]
+    endDistances = signedDistances[rows,edgesEnds]
+    parameters = startDistances/(startDistances-endDistances)
+    edgesStartsPoints = trianglesPoints[rows,edgesStarts]
+    contourSegments = edgesStartsPoints + parameters[:,:,np.newaxis]*(trianglesPoints[rows,edgesEnds]-edgesStartsPoints)
+
+    #Orient segments counterclockwise around the normal using the outward triangle normals
+    segmentsDirections = contourSegments[:,1]-contourSegments[:,0]
+    wrongOrientation = np.sum(np.cross(segmentsDirections,normal)*trianglesNormals,axis=1) < 0
+    contourSegments[wrongOrientation] = contourSegments[wrongOrientation][:,::-1]
+
+    #Area and centroid of the section as a fan of triangles from a reference point
+    referencePoint = contourSegments[0,0]
+    fanTrianglesAreas = 0.5*(np.cross(contourSegments[:,0]-referencePoint,contourSegments[:,1]-referencePoint) @ normal)
+    area = fanTrianglesAreas.sum()
+    contourPoints = contourSegments.reshape(-1,3)
+    if abs(area) > 1e-12*max(1.0,np.ptp(contourPoints,axis=0).max()**2):
+      fanTrianglesCentroids = (referencePoint + contourSegments[:,0] + contourSegments[:,1])/3
+      centroid = (fanTrianglesAreas @ fanTrianglesCentroids)/area
+    else:
+      #Open or inconsistently oriented meshes
+      centroid = contourPoints.mean(axis=0)
+
+    section["contourSegments"] = contourSegments
+    section["area"] = abs(area)
+    section["centroid"] = centroid
+    section["contourPointsAverage"] = contourPoints.mean(axis=0)
+    section["polarExtent"] = np.max(np.linalg.norm(contourPoints-centroid,axis=1))
+    return section
+
+  def getSectionCentroid(self,origin,normal):
+    return self.getSection(origin,normal)["centroid"]
+
 #
 # DeformityCorrectionOsteotomyPlannerTest
 #
@@ -1422,60 +3772,838 @@ class DeformityCorrectionOsteotomyPlannerTest(ScriptedLoadableModuleTest):
   def setUp(self):
     """ Do whatever is needed to reset the state - typically a scene clear will be enough.
     """
+    self.cleanupLogics()
     slicer.mrmlScene.Clear()
 
+  def createLogic(self, setupLayout=False):
+    """ Logics created by the tests are cleaned up by the next setUp so their observers do not pile up.
+    """
+    logic = DeformityCorrectionOsteotomyPlannerLogic(setupLayout=setupLayout)
+    self.logicsList.append(logic)
+    return logic
+
+  def cleanupLogics(self):
+    for logic in getattr(self, "logicsList", []):
+      logic.cleanup()
+    self.logicsList = []
+
   def runTest(self):
     """Run as few or as many tests as needed here.
     """
     self.setUp()
     self.test_DeformityCorrectionOsteotomyPlanner1()
+    self.setUp()
+    self.test_IncrementalUpdateOfBonePiecesMatchesFullUpdate()
+    self.setUp()
+    self.test_CoalescedUpdateOfSeveralModifiedPlanes()
+    self.setUp()
+    self.test_SubjectHierarchyFolderRegistry()
+    self.setUp()
+    self.test_BoneCutPlanesArcLengthOrder()
+    self.setUp()
+    self.test_CurveFrameTable()
+    self.setUp()
+    self.test_SharedPointsBoneSegments()
+    self.setUp()
+    self.test_CutResultsCache()
+    self.setUp()
+    self.test_PlanningStateHistory()
+    self.setUp()
+    self.test_AreaWeightedSectionCentroidsBenchmark()
+    self.setUp()
+    self.test_BatchedBooleanOperationsBenchmark()
+    self.setUp()
+    self.test_PerformanceBenchmarkSuite()
+    self.setUp()
+    self.test_StageTimings()
+    self.cleanupLogics()
 
   def test_DeformityCorrectionOsteotomyPlanner1(self):
-    """ Ideally you should have several levels of tests.  At the lowest level
-    tests should exercise the functionality of the logic with different inputs
-    (both valid and invalid).  At higher levels your tests should emulate the
-    way the user would interact with your code and confirm that it still works
-    the way you intended.
-    One of the most important features of the tests is that it should alert other
-    developers when their changes will have an impact on the behavior of your
-    module.  For example, if a developer removes a feature that you depend on,
-    your test should break so they know that the feature is needed.
+    """ Smoke test of the planning workflow: cutting a bone model with two plane pairs
+    gives three non-empty bone pieces that can be moved to the corrected position.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic(setupLayout=True)
+    parameterNode = logic.getParameterNode()
+
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+    self.createBoneCutPlanesAlongCurve(logic, boneCurve, 2)
+    self.delayDisplay('Created bone model, bone curve and bone cut planes')
+
+    logic.createAndUpdateDynamicModelerNodes()
+    logic.transformBonePiecesToCorrectedPosition()
+
+    piecesPoints, piecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+    self.assertEqual(len(piecesPoints), 3)
+    self.assertEqual(len(piecesMatrices), 3)
+    for piecePoints in piecesPoints:
+      self.assertGreater(len(piecePoints), 0)
+    for pieceMatrix in piecesMatrices:
+      self.assertTrue(np.all(np.isfinite(pieceMatrix)))
+
+    self.delayDisplay('Test passed')
+
+  def test_IncrementalUpdateOfBonePiecesMatchesFullUpdate(self):
+    """ Moving one cut plane and updating only the bone segments adjacent to it should
+    give the same bone pieces and corrected position transforms as a full update.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic(setupLayout=True)
+    parameterNode = logic.getParameterNode()
+    #Cached cut results would make the full update return the incremental results
+    parameterNode.SetParameter("cutResultsCacheMemoryBudget", "0")
+
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    boneCutPlanesFolder = shNode.CreateFolderItem(logic.getParentFolderItemID(),"Bone Cut Planes")
+    boneCutPlanesOriginsX = [20,26,50,58]
+    normalsAngles = [0,15,0,-10]
+    for i in range(len(boneCutPlanesOriginsX)):
+      angleRadians = vtk.vtkMath.RadiansFromDegrees(normalsAngles[i])
+      boneCutPlane = self.createPlane(
+        "boneCutPlane%d" % i, [boneCutPlanesOriginsX[i],0,0], [np.cos(angleRadians),np.sin(angleRadians),0]
+      )
+      shNode.SetItemParent(shNode.GetItemByDataNode(boneCutPlane), boneCutPlanesFolder)
+    boneCutPlanesList = createListFromFolderID(boneCutPlanesFolder)
+
+    logic.createAndUpdateDynamicModelerNodes()
+    logic.transformBonePiecesToCorrectedPosition()
+
+    movedBoneCutPlane = boneCutPlanesList[2]
+    movedBoneCutPlane.SetOrigin([46,2,0])
+    movedBoneCutPlane.SetNormal([np.cos(0.2),0,np.sin(0.2)])
+
+    logic.updateBonePiecesAdjacentToCutPlane(movedBoneCutPlane)
+    incrementalPiecesPoints, incrementalPiecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+    cutBonePiecesIDsList = [node.GetID() for node in createListFromFolderID(shNode.GetItemByName("Cut Bone Pieces"))]
+
+    logic.createAndUpdateDynamicModelerNodes()
+    logic.transformBonePiecesToCorrectedPosition()
+    fullPiecesPoints, fullPiecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+
+    # Bone segment nodes are reused when the number of plane pairs does not change
+    self.assertEqual(cutBonePiecesIDsList, [node.GetID() for node in createListFromFolderID(shNode.GetItemByName("Cut Bone Pieces"))])
+
+    self.assertEqual(len(incrementalPiecesPoints), 3)
+    self.assertEqual(len(incrementalPiecesPoints), len(fullPiecesPoints))
+    for i in range(len(fullPiecesPoints)):
+      self.assertEqual(incrementalPiecesPoints[i].shape, fullPiecesPoints[i].shape)
+      np.testing.assert_allclose(incrementalPiecesPoints[i], fullPiecesPoints[i], atol=1e-6)
+      np.testing.assert_allclose(incrementalPiecesMatrices[i], fullPiecesMatrices[i], atol=1e-9)
+
+    self.delayDisplay('Test passed')
+
+  def test_CoalescedUpdateOfSeveralModifiedPlanes(self):
+    """ Planes modified before the plane modified timer fires should be updated together in one
+    update that gives the same bone pieces as a full update.
     """
 
     self.delayDisplay("Starting the test")
 
-    # Get/create input data
+    logic = self.createLogic()
+    parameterNode = logic.getParameterNode()
+    #Cached cut results would make the full update return the coalesced results
+    parameterNode.SetParameter("cutResultsCacheMemoryBudget", "0")
 
-    import SampleData
-    registerSampleData()
-    inputVolume = SampleData.downloadSample('DeformityCorrectionOsteotomyPlanner1')
-    self.delayDisplay('Loaded test data set')
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+    boneCutPlanesList = self.createBoneCutPlanesAlongCurve(logic, boneCurve, 2)
 
-    inputScalarRange = inputVolume.GetImageData().GetScalarRange()
-    self.assertEqual(inputScalarRange[0], 0)
-    self.assertEqual(inputScalarRange[1], 695)
+    logic.createAndUpdateDynamicModelerNodes()
+    logic.transformBonePiecesToCorrectedPosition()
 
-    outputVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
-    threshold = 100
+    firstOrigin, firstNormal = logic.getOriginAndNormalOfPlane(boneCutPlanesList[0])
+    boneCutPlanesList[0].SetOrigin(firstOrigin - 2*firstNormal)
+    logic.onPlaneModifiedTimer(boneCutPlanesList[0], None)
+    boneCutPlanesList[3].SetNormal([np.cos(0.2),np.sin(0.2),0])
+    logic.onPlaneModifiedTimer(boneCutPlanesList[3], None)
+    logic.onPlaneModifiedTimer(boneCutPlanesList[0], None)
 
-    # Test the module logic
+    self.assertTrue(logic.planeModifiedTimer.isActive())
+    self.assertEqual(list(logic.modifiedBoneCutPlanesIDs), [boneCutPlanesList[3].GetID(), boneCutPlanesList[0].GetID()])
 
-    logic = DeformityCorrectionOsteotomyPlannerLogic()
+    logic.planeModifiedTimer.stop()
+    logic.onPlaneModifiedTimerTimeout()
+    self.assertEqual(len(logic.modifiedBoneCutPlanesIDs), 0)
+    self.assertIsNotNone(logic.bonePiecesUpdateDurationAverage)
+    coalescedPiecesPoints, coalescedPiecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
 
-    # Test algorithm with non-inverted threshold
-    logic.process(inputVolume, outputVolume, threshold, True)
-    outputScalarRange = outputVolume.GetImageData().GetScalarRange()
-    self.assertEqual(outputScalarRange[0], inputScalarRange[0])
-    self.assertEqual(outputScalarRange[1], threshold)
+    logic.createAndUpdateDynamicModelerNodes()
+    logic.transformBonePiecesToCorrectedPosition()
+    fullPiecesPoints, fullPiecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
 
-    # Test algorithm with inverted threshold
-    logic.process(inputVolume, outputVolume, threshold, False)
-    outputScalarRange = outputVolume.GetImageData().GetScalarRange()
-    self.assertEqual(outputScalarRange[0], inputScalarRange[0])
-    self.assertEqual(outputScalarRange[1], inputScalarRange[1])
+    self.assertEqual(len(coalescedPiecesPoints), len(fullPiecesPoints))
+    for i in range(len(fullPiecesPoints)):
+      np.testing.assert_allclose(coalescedPiecesPoints[i], fullPiecesPoints[i], atol=1e-6)
+      np.testing.assert_allclose(coalescedPiecesMatrices[i], fullPiecesMatrices[i], atol=1e-9)
 
     self.delayDisplay('Test passed')
 
+  def test_SubjectHierarchyFolderRegistry(self):
+    """ Folder nodes lists should follow additions, removals and reordering of the subject hierarchy
+    and folders with the same name outside the module folder should be ignored.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic()
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+
+    otherPatientFolder = shNode.CreateFolderItem(shNode.GetSceneItemID(),"Bone Cut Planes")
+    shNode.SetItemParent(shNode.GetItemByDataNode(self.createPlane("otherPatientPlane",[0,0,0],[1,0,0])), otherPatientFolder)
+    self.assertEqual(logic.folderRegistry.getFolderItemID("Bone Cut Planes"), 0)
+    self.assertEqual(logic.folderRegistry.getNodesOfFolder("Bone Cut Planes"), [])
+
+    boneCutPlanesFolder = logic.folderRegistry.getFolderItemID("Bone Cut Planes",createIfMissing=True)
+    self.assertNotEqual(boneCutPlanesFolder, otherPatientFolder)
+    self.assertEqual(shNode.GetItemParent(boneCutPlanesFolder), logic.getParentFolderItemID())
+
+    planesList = []
+    for i in range(3):
+      planesList.append(self.createPlane("boneCutPlane%d" % i,[10*i,0,0],[1,0,0]))
+      shNode.SetItemParent(shNode.GetItemByDataNode(planesList[i]), boneCutPlanesFolder)
+      self.assertEqual(logic.folderRegistry.getNodesOfFolder("Bone Cut Planes"), planesList)
+
+    #Modifying the nodes of a folder keeps its list
+    nodesList = logic.folderRegistry.foldersNodesLists[boneCutPlanesFolder]
+    planesList[0].SetOrigin([5,5,5])
+    planesList[1].SetName("movedBoneCutPlane")
+    self.assertIs(logic.folderRegistry.foldersNodesLists[boneCutPlanesFolder], nodesList)
+
+    shNode.MoveItem(shNode.GetItemByDataNode(planesList[2]), shNode.GetItemByDataNode(planesList[0]))
+    self.assertEqual(logic.folderRegistry.getNodesOfFolder("Bone Cut Planes"), createListFromFolderID(boneCutPlanesFolder))
+
+    slicer.mrmlScene.RemoveNode(planesList[1])
+    self.assertEqual(logic.folderRegistry.getNodesOfFolder("Bone Cut Planes"), createListFromFolderID(boneCutPlanesFolder))
+    self.assertEqual(len(logic.folderRegistry.getNodesOfFolder("Bone Cut Planes")), 2)
+
+    otherFolderPlane = createListFromFolderID(otherPatientFolder)[0]
+    shNode.SetItemParent(shNode.GetItemByDataNode(otherFolderPlane), boneCutPlanesFolder)
+    self.assertIn(otherFolderPlane, logic.folderRegistry.getNodesOfFolder("Bone Cut Planes"))
+
+    boneCutPlanesFolder = logic.folderRegistry.recreateFolder("Bone Cut Planes")
+    self.assertEqual(logic.folderRegistry.getNodesOfFolder("Bone Cut Planes"), [])
+
+    shNode.RemoveItem(boneCutPlanesFolder)
+    self.assertEqual(logic.folderRegistry.getFolderItemID("Bone Cut Planes"), 0)
+
+    self.delayDisplay('Test passed')
+
+  def test_BoneCutPlanesArcLengthOrder(self):
+    """ Bone cut planes should be ordered along the bone curve, a new plane should be moved to its
+    place in the folder and a plane moved past its neighbor should swap places with it.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic()
+    parameterNode = logic.getParameterNode()
+
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+    boneCutPlanesList = self.createBoneCutPlanesAlongCurve(logic, boneCurve, 2)
+    self.assertEqual(logic.getBoneCutPlanesList(), boneCutPlanesList)
+
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    boneCutPlanesFolder = logic.folderRegistry.getFolderItemID("Bone Cut Planes")
+    firstOrigin, firstNormal = logic.getOriginAndNormalOfPlane(boneCutPlanesList[0])
+    newBoneCutPlane = self.createPlane("newBoneCutPlane", firstOrigin - 5*firstNormal, firstNormal)
+    shNode.SetItemParent(shNode.GetItemByDataNode(newBoneCutPlane), boneCutPlanesFolder)
+
+    expectedBoneCutPlanesList = [newBoneCutPlane] + boneCutPlanesList
+    self.assertEqual(logic.getBoneCutPlanesList(), expectedBoneCutPlanesList)
+    self.assertEqual(createListFromFolderID(boneCutPlanesFolder), expectedBoneCutPlanesList)
+
+    lastOrigin, lastNormal = logic.getOriginAndNormalOfPlane(boneCutPlanesList[-1])
+    newBoneCutPlane.SetOrigin(lastOrigin + 5*lastNormal)
+    logic.updateArcLengthsOfBoneCutPlanes([newBoneCutPlane])
+    expectedBoneCutPlanesList = boneCutPlanesList + [newBoneCutPlane]
+    self.assertEqual(logic.getBoneCutPlanesList(), expectedBoneCutPlanesList)
+    self.assertEqual(createListFromFolderID(boneCutPlanesFolder), expectedBoneCutPlanesList)
+
+    slicer.mrmlScene.RemoveNode(newBoneCutPlane)
+    self.assertEqual(logic.getBoneCutPlanesList(), boneCutPlanesList)
+
+    self.delayDisplay('Test passed')
+
+  def test_CurveFrameTable(self):
+    """ Closest curve points, arc lengths and frames of the curve frame table should match the
+    ones of the markups curve API and the table should be rebuilt when the curve is modified.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic()
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    curveFrameTable = logic.getCurveFrameTable(boneCurve)
+    self.assertIs(logic.getCurveFrameTable(boneCurve), curveFrameTable)
+
+    queryPositions = [[x,3,-2] for x in np.linspace(5,35,20)]
+    closestCurvePointsIndexes = curveFrameTable.getClosestCurvePointsIndexes(queryPositions)
+    arcLengths = curveFrameTable.getArcLengthsOfClosestCurvePoints(queryPositions)
+    curvePointsToWorldMatrices = curveFrameTable.getCurvePointsToWorldMatricesOfClosestCurvePoints(queryPositions)
+    matrix = vtk.vtkMatrix4x4()
+    for i in range(len(queryPositions)):
+      closestCurvePointIndex = boneCurve.GetClosestCurvePointIndexToPositionWorld(queryPositions[i])
+      self.assertEqual(closestCurvePointsIndexes[i], closestCurvePointIndex)
+      self.assertAlmostEqual(arcLengths[i], boneCurve.GetCurveLengthBetweenStartEndPointsWorld(0,closestCurvePointIndex), places=3)
+      boneCurve.GetCurvePointToWorldTransformAtPointIndex(closestCurvePointIndex,matrix)
+      self.assertTrue(np.allclose(curvePointsToWorldMatrices[i], slicer.util.arrayFromVTKMatrix(matrix)))
+
+    #Lock and selection changes do not move the curve points
+    boneCurve.SetLocked(True)
+    boneCurve.SetNthControlPointSelected(0, False)
+    self.assertIs(logic.getCurveFrameTable(boneCurve), curveFrameTable)
+    boneCurve.SetLocked(False)
+
+    boneCurve.SetNthControlPointPosition(0, [-5,0,0])
+    self.assertIsNot(logic.getCurveFrameTable(boneCurve), curveFrameTable)
+
+    self.delayDisplay('Test passed')
+
+  def test_SharedPointsBoneSegments(self):
+    """ Bone segments cut with shared points should share one vtkPoints and enclose the same volume
+    as the ones of vtkClipClosedSurface, the old contour points of recut segments should be reclaimed.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic()
+    parameterNode = logic.getParameterNode()
+    parameterNode.SetParameter("cutResultsCacheMemoryBudget", "0")
+
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve(numberOfSides=60, numberOfSubdivisions=400)
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+    boneCutPlanesList = self.createBoneCutPlanesAlongCurve(logic, boneCurve, 3)
+
+    logic.createAndUpdateDynamicModelerNodes()
+    cutBonePiecesList = createListFromFolderID(logic.folderRegistry.getFolderItemID("Cut Bone Pieces"))
+    separatePointsMemorySize = logic.getMemorySizeOfBonePieces(cutBonePiecesList)
+
+    parameterNode.SetParameter("useSharedPointsBoneSegments", "True")
+    logic.createAndUpdateDynamicModelerNodes()
+    sharedPointsMemorySize = logic.getMemorySizeOfBonePieces(cutBonePiecesList)
+    logging.info("Bone segments memory: %.1f KiB with separate points, %.1f KiB with shared points" % (separatePointsMemorySize, sharedPointsMemorySize))
+    #Shared points are counted once
+    self.assertLess(sharedPointsMemorySize, sum(bonePiece.GetPolyData().GetActualMemorySize() for bonePiece in cutBonePiecesList))
+
+    def getVolumeAndNumberOfOpenEdges(polyData):
+      massProperties = vtk.vtkMassProperties()
+      massProperties.SetInputData(polyData)
+      massProperties.Update()
+      featureEdges = vtk.vtkFeatureEdges()
+      featureEdges.SetInputData(polyData)
+      featureEdges.BoundaryEdgesOn()
+      featureEdges.NonManifoldEdgesOn()
+      featureEdges.FeatureEdgesOff()
+      featureEdges.ManifoldEdgesOff()
+      featureEdges.Update()
+      return massProperties.GetVolume(), featureEdges.GetOutput().GetNumberOfCells()
+
+    for segmentIndex in range(len(cutBonePiecesList)):
+      polyData = cutBonePiecesList[segmentIndex].GetPolyData()
+      self.assertIs(polyData.GetPoints(), logic.sharedPointsPlaneCutter.sharedPoints)
+      planesOrigins, planesNormals = logic.getClippingPlanesOfBoneSegment(segmentIndex,boneCutPlanesList)
+      clippedPolyData = clipClosedSurfaceWithPlanes(boneModel.GetPolyData(),planesOrigins,planesNormals)
+      volume, numberOfOpenEdges = getVolumeAndNumberOfOpenEdges(polyData)
+      self.assertEqual(numberOfOpenEdges, 0)
+      self.assertAlmostEqual(volume, getVolumeAndNumberOfOpenEdges(clippedPolyData)[0], delta=1e-3*volume)
+
+    #Recutting a segment many times reclaims the points of its old contours
+    firstOrigin, firstNormal = logic.getOriginAndNormalOfPlane(boneCutPlanesList[0])
+    for i in range(50):
+      boneCutPlanesList[0].SetOrigin(firstOrigin - 0.05*i*firstNormal)
+      logic.updateBonePiecesAdjacentToCutPlanes([boneCutPlanesList[0]])
+    sharedPointsPlaneCutter = logic.sharedPointsPlaneCutter
+    self.assertLessEqual(sharedPointsPlaneCutter.numberOfUnusedPoints, max(1024,sharedPointsPlaneCutter.numberOfParentPoints//10))
+    self.assertEqual(getVolumeAndNumberOfOpenEdges(cutBonePiecesList[0].GetPolyData())[1], 0)
+
+    self.delayDisplay('Test passed')
+
+  def test_CutResultsCache(self):
+    """ Moving a bone cut plane back to a previous position should take the bone segment and the
+    corrected positions from the cache. The cache should be cleared when the bone model is modified
+    and the least recently used entries should be evicted when the memory budget is exceeded.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic()
+    parameterNode = logic.getParameterNode()
+
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+    boneCutPlanesList = self.createBoneCutPlanesAlongCurve(logic, boneCurve, 2)
+
+    logic.createAndUpdateDynamicModelerNodes()
+    logic.transformBonePiecesToCorrectedPosition()
+    initialPiecesPoints, initialPiecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+
+    firstOrigin, firstNormal = logic.getOriginAndNormalOfPlane(boneCutPlanesList[0])
+    boneCutPlanesList[0].SetOrigin(firstOrigin - 3*firstNormal)
+    logic.updateBonePiecesAdjacentToCutPlanes([boneCutPlanesList[0]])
+    statistics = logic.getCutResultsCacheStatistics()
+    self.assertEqual(statistics["numberOfHits"], 0)
+
+    boneCutPlanesList[0].SetOrigin(firstOrigin)
+    logic.updateBonePiecesAdjacentToCutPlanes([boneCutPlanesList[0]])
+    statistics = logic.getCutResultsCacheStatistics()
+    self.assertEqual(statistics["numberOfHits"], 2)
+    self.assertLessEqual(statistics["memorySize"], statistics["memoryBudget"])
+    #Cache hits give the segments a copy of the cached polydata
+    cachedPolyDatasList = [cachedPolyData for cachedPolyData, memorySize in logic.cutResultsCache.entries.values()]
+    for cutBonePiece in createListFromFolderID(logic.folderRegistry.getFolderItemID("Cut Bone Pieces")):
+      self.assertFalse(any(cutBonePiece.GetPolyData() is cachedPolyData for cachedPolyData in cachedPolyDatasList))
+    piecesPoints, piecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+    for i in range(len(initialPiecesPoints)):
+      np.testing.assert_allclose(piecesPoints[i], initialPiecesPoints[i], atol=1e-6)
+      np.testing.assert_allclose(piecesMatrices[i], initialPiecesMatrices[i], atol=1e-9)
+
+    boneModel.GetPolyData().Modified()
+    logic.getCutResultsCache()
+    self.assertEqual(len(logic.cutResultsCache), 0)
+
+    cache = LeastRecentlyUsedCache(memoryBudget=10)
+    cache.add("a", "valueA", 4)
+    cache.add("b", "valueB", 4)
+    self.assertEqual(cache.get("a"), "valueA")
+    cache.add("c", "valueC", 4)
+    self.assertFalse("b" in cache)
+    self.assertFalse(cache.add("d", "valueD", 11))
+    statistics = cache.getStatistics()
+    self.assertEqual(statistics["numberOfEvictions"], 1)
+    self.assertEqual(statistics["evictedMemorySize"], 4)
+    self.assertEqual(statistics["memorySize"], 8)
+
+    self.delayDisplay('Test passed')
+
+  def test_PlanningStateHistory(self):
+    """ Undo should restore the bone cut planes and bone segments of the previous recorded state
+    from the cut results cache and redo should go back, each state should take a few kilobytes.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic()
+    parameterNode = logic.getParameterNode()
+
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+    boneCutPlanesList = self.createBoneCutPlanesAlongCurve(logic, boneCurve, 2)
+
+    logic.createAndUpdateDynamicModelerNodes()
+    logic.transformBonePiecesToCorrectedPosition()
+    self.assertEqual(len(logic.planningStateHistory), 0)
+    self.assertTrue(logic.recordPlanningState())
+    self.assertFalse(logic.recordPlanningState())
+    self.assertEqual(len(logic.planningStateHistory), 1)
+    self.assertFalse(logic.undoPlanningState())
+    initialPlanesMatrices = logic.getPlanesToWorldMatricesArray(boneCutPlanesList)
+    initialPiecesPoints, initialPiecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+
+    firstOrigin, firstNormal = logic.getOriginAndNormalOfPlane(boneCutPlanesList[0])
+    boneCutPlanesList[0].SetOrigin(firstOrigin - 3*firstNormal)
+    logic.onPlaneModifiedTimer(boneCutPlanesList[0], None)
+    logic.planeModifiedTimer.stop()
+    logic.onPlaneModifiedTimerTimeout()
+    self.assertEqual(len(logic.planningStateHistory), 2)
+    movedPlanesMatrices = logic.getPlanesToWorldMatricesArray(boneCutPlanesList)
+    movedPiecesPoints, movedPiecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+
+    numberOfHits = logic.getCutResultsCacheStatistics()["numberOfHits"]
+    self.assertTrue(logic.undoPlanningState())
+    self.assertGreater(logic.getCutResultsCacheStatistics()["numberOfHits"], numberOfHits)
+    np.testing.assert_allclose(logic.getPlanesToWorldMatricesArray(boneCutPlanesList), initialPlanesMatrices, atol=1e-6)
+    piecesPoints, piecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+    for i in range(len(initialPiecesPoints)):
+      np.testing.assert_allclose(piecesPoints[i], initialPiecesPoints[i], atol=1e-6)
+      np.testing.assert_allclose(piecesMatrices[i], initialPiecesMatrices[i], atol=1e-6)
+
+    self.assertTrue(logic.redoPlanningState())
+    self.assertFalse(logic.redoPlanningState())
+    np.testing.assert_allclose(logic.getPlanesToWorldMatricesArray(boneCutPlanesList), movedPlanesMatrices, atol=1e-6)
+    piecesPoints, piecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+    for i in range(len(movedPiecesPoints)):
+      np.testing.assert_allclose(piecesPoints[i], movedPiecesPoints[i], atol=1e-6)
+      np.testing.assert_allclose(piecesMatrices[i], movedPiecesMatrices[i], atol=1e-6)
+
+    #Recording after an undo drops the states that could be redone
+    logic.undoPlanningState()
+    parameterNode.SetParameter("securityMarginOfBonePieces", "2.0")
+    self.assertTrue(logic.recordPlanningState())
+    self.assertFalse(logic.planningStateHistory.canRedo())
+
+    #States recorded with other bone cut planes are not restored
+    planningState = logic.getPlanningState()
+    planningState["boneCutPlanesIDs"] = planningState["boneCutPlanesIDs"][:-1]
+    self.assertFalse(logic.canRestorePlanningState(planningState, showError=False))
+    self.assertTrue(logic.canRestorePlanningState(logic.getPlanningState(), showError=False))
+
+    #Performance settings are not planning states and are kept by undo
+    parameterNode.SetParameter("useParallelPlaneCuts", "True")
+    parameterNode.SetParameter("cutResultsCacheMemoryBudget", "256")
+    self.assertFalse(logic.recordPlanningState())
+    self.assertTrue(logic.undoPlanningState())
+    undoneState = logic.planningStateHistory.states[logic.planningStateHistory.currentIndex]
+    self.assertEqual(parameterNode.GetParameter("securityMarginOfBonePieces"), undoneState["parameters"]["securityMarginOfBonePieces"])
+    self.assertNotIn("useParallelPlaneCuts", undoneState["parameters"])
+    self.assertEqual(parameterNode.GetParameter("useParallelPlaneCuts"), "True")
+    self.assertEqual(parameterNode.GetParameter("cutResultsCacheMemoryBudget"), "256")
+
+    #Undoing a change of the bone curve alone updates all the bone pieces
+    logic.recordPlanningState()
+    piecesPoints, piecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+    boneCurveControlPoints = slicer.util.arrayFromMarkupsControlPoints(boneCurve)
+    boneCurveControlPoints[0] += [0,0,1]
+    slicer.util.updateMarkupsControlPointsFromArray(boneCurve, boneCurveControlPoints)
+    self.assertTrue(logic.recordPlanningState())
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    for cutBonePiece in createListFromFolderID(shNode.GetItemByName("Cut Bone Pieces")):
+      cutBonePiece.SetAndObservePolyData(vtk.vtkPolyData())
+    self.assertTrue(logic.undoPlanningState())
+    undonePiecesPoints, undonePiecesMatrices = self.getBonePiecesPointsAndTransformMatrices()
+    for i in range(len(piecesPoints)):
+      np.testing.assert_allclose(undonePiecesPoints[i], piecesPoints[i], atol=1e-6)
+      np.testing.assert_allclose(undonePiecesMatrices[i], piecesMatrices[i], atol=1e-6)
+
+    for state in logic.planningStateHistory.states:
+      self.assertLess(logic.planningStateHistory.getMemorySizeOfState(state), 16*1024)
+
+    self.delayDisplay('Test passed')
+
+  def test_AreaWeightedSectionCentroidsBenchmark(self):
+    """ Times the NumPy section engine against the vtkCutter path of the slicing service
+    and checks that both give similar centroids on the synthetic bone.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    import time
+
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    slicingService = ModelSlicingService()
+    origins = [[x,0,0] for x in np.linspace(10,30,50)]
+    normal = [1,0,0]
+
+    slicingService.useAreaWeightedCentroids = False
+    startTime = time.time()
+    cutterCentroids = np.array([slicingService.getCentroidOfIntersection(boneModel,origin,normal) for origin in origins])
+    cutterTime = time.time() - startTime
+
+    slicingService.useAreaWeightedCentroids = True
+    slicingService.getSectionEngine(boneModel)
+    startTime = time.time()
+    areaWeightedCentroids = np.array([slicingService.getCentroidOfIntersection(boneModel,origin,normal) for origin in origins])
+    areaWeightedTime = time.time() - startTime
+
+    logging.info(f"Section centroids of {len(origins)} planes: vtkCutter {cutterTime:.4f}s, NumPy area weighted {areaWeightedTime:.4f}s")
+
+    np.testing.assert_allclose(areaWeightedCentroids, cutterCentroids, atol=0.5)
+    tubeRadius = 8
+    section = slicingService.getSectionEngine(boneModel).getSection(origins[0],normal)
+    self.assertAlmostEqual(section["area"]/(np.pi*tubeRadius**2), 1, delta=0.05)
+    self.assertAlmostEqual(section["polarExtent"], tubeRadius, delta=0.5)
+
+    self.delayDisplay('Test passed')
+
+  def test_BatchedBooleanOperationsBenchmark(self):
+    """ Times the batched boolean operations against applying the tools one by one
+    on a synthetic surgical guide and checks that both give the same volume.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    if not hasattr(slicer.modules, "combinemodels"):
+      self.delayDisplay("Combine Models module of the Sandbox extension is not installed, test skipped")
+      return
+
+    import time
+
+    logic = self.createLogic(setupLayout=True)
+    guideBaseModel = self.createBoxModel([0,0,0],[120,20,6])
+    #Pairs of slots next to each other so the bigger miter boxes of a pair overlap
+    slotsCentersX = [-50,-44,-20,-14,10,16,40,46]
+    biggerMiterBoxesList = [self.createBoxModel([x,0,8],[4,26,14]) for x in slotsCentersX]
+    miterBoxesList = [self.createBoxModel([x,0,8],[1.5,22,40]) for x in slotsCentersX]
+    cylindersList = []
+    for x in [-56,-32,-26,-4,2,22,28,34,52,58]:
+      cylinderSource = vtk.vtkCylinderSource()
+      cylinderSource.SetCenter(x,0,0)
+      cylinderSource.SetRadius(1.5)
+      cylinderSource.SetHeight(30)
+      cylinderSource.SetResolution(24)
+      cylinderSource.CappingOn()
+      rotation = vtk.vtkTransform()
+      rotation.RotateX(90)
+      rotationFilter = vtk.vtkTransformPolyDataFilter()
+      rotationFilter.SetInputConnection(cylinderSource.GetOutputPort())
+      rotationFilter.SetTransform(rotation)
+      triangleFilter = vtk.vtkTriangleFilter()
+      triangleFilter.SetInputConnection(rotationFilter.GetOutputPort())
+      triangleFilter.Update()
+      cylindersList.append(slicer.modules.models.logic().AddModel(triangleFilter.GetOutput()))
+
+    volumes = {}
+    for batched in [False,True]:
+      surgicalGuideModel = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+      surgicalGuideModel.SetAndObservePolyData(vtk.vtkPolyData())
+      surgicalGuideModel.GetPolyData().DeepCopy(guideBaseModel.GetPolyData())
+      startTime = time.time()
+      logic.applyBooleanOperationsToSurgicalGuide(surgicalGuideModel,biggerMiterBoxesList,cylindersList + miterBoxesList,batched)
+      elapsedTime = time.time() - startTime
+      logging.info(f"Boolean operations with {len(biggerMiterBoxesList)} slots and {len(cylindersList)} screw holes, batched={batched}: {elapsedTime:.2f}s")
+
+      massProperties = vtk.vtkMassProperties()
+      massProperties.SetInputData(surgicalGuideModel.GetPolyData())
+      massProperties.Update()
+      volumes[batched] = massProperties.GetVolume()
+
+    self.assertGreater(volumes[True], 0)
+    self.assertAlmostEqual(volumes[True]/volumes[False], 1, delta=0.02)
+
+    self.delayDisplay('Test passed')
+
+  def createBoxModel(self, center, size):
+    cubeSource = vtk.vtkCubeSource()
+    cubeSource.SetCenter(center)
+    cubeSource.SetXLength(size[0])
+    cubeSource.SetYLength(size[1])
+    cubeSource.SetZLength(size[2])
+    triangleFilter = vtk.vtkTriangleFilter()
+    triangleFilter.SetInputConnection(cubeSource.GetOutputPort())
+    triangleFilter.Update()
+    return slicer.modules.models.logic().AddModel(triangleFilter.GetOutput())
+
+  def test_PerformanceBenchmarkSuite(self):
+    """ Runs a small grid of the benchmark suite, bigger grids can be run from the Python console with
+    DeformityCorrectionOsteotomyPlannerTest().runBenchmarkSuite(...)
+    """
+
+    self.delayDisplay("Starting the test")
+
+    outputFilePath = os.path.join(slicer.app.temporaryPath, "DeformityCorrectionOsteotomyPlannerBenchmark.json")
+    resultsList = self.runBenchmarkSuite([20000, 80000], [1, 3], bendAngle=20, outputFilePath=outputFilePath)
+
+    self.assertEqual(len(resultsList), 4)
+    for result in resultsList:
+      self.assertAlmostEqual(result["numberOfTriangles"]/result["requestedNumberOfTriangles"], 1, delta=0.1)
+      for stageName in ["centroidPositioning","planeCuts","correctionTransforms","marginCheck","miterBoxes"]:
+        self.assertIn(stageName, result)
+    self.assertTrue(os.path.exists(outputFilePath))
+
+    self.delayDisplay('Test passed')
+
+  def test_StageTimings(self):
+    """ Stages should only be recorded when stage timings are enabled, nested stages keep their parent.
+    """
+
+    self.delayDisplay("Starting the test")
+
+    logic = self.createLogic()
+    parameterNode = logic.getParameterNode()
+
+    boneModel, boneCurve = self.createSyntheticBoneModelAndCurve()
+    parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+    parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+    self.createBoneCutPlanesAlongCurve(logic, boneCurve, 2)
+
+    logic.createAndUpdateDynamicModelerNodes()
+    self.assertEqual(len(logic.stageTimingRecorder.records), 0)
+
+    parameterNode.SetParameter("recordStageTimings", "True")
+    logic.createAndUpdateDynamicModelerNodes()
+    logic.transformBonePiecesToCorrectedPosition()
+    summary = logic.stageTimingRecorder.getSummary()
+    self.assertEqual(summary["createAndUpdateDynamicModelerNodes"]["numberOfCalls"], 1)
+    self.assertEqual(summary["transformBonePiecesToCorrectedPosition"]["numberOfCalls"], 1)
+    self.assertEqual(summary["createAndUpdateDynamicModelerNodes"]["maximumNumberOfCells"], boneModel.GetPolyData().GetNumberOfCells())
+    runPlaneCutsRecords = [record for record in logic.stageTimingRecorder.records if record["stage"] == "runPlaneCutsOfBoneSegments"]
+    self.assertEqual(runPlaneCutsRecords[0]["parentStage"], "createAndUpdateDynamicModelerNodes")
+
+    outputFilePath = os.path.join(slicer.app.temporaryPath, "DeformityCorrectionOsteotomyPlannerStageTimings.csv")
+    logic.exportStageTimings(outputFilePath)
+    self.assertTrue(os.path.exists(outputFilePath))
+
+    self.delayDisplay('Test passed')
+
+  def getBonePiecesPointsAndTransformMatrices(self):
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    cutBonePiecesList = createListFromFolderID(shNode.GetItemByName("Cut Bone Pieces"))
+    piecesPoints = []
+    piecesMatrices = []
+    for cutBonePiece in cutBonePiecesList:
+      piecesPoints.append(np.array(slicer.util.arrayFromModelPoints(cutBonePiece)))
+      transformNode = cutBonePiece.GetParentTransformNode()
+      if transformNode:
+        piecesMatrices.append(slicer.util.arrayFromTransformMatrix(transformNode))
+      else:
+        piecesMatrices.append(np.eye(4))
+    return piecesPoints, piecesMatrices
+
+  def createSyntheticBoneModelAndCurve(self, centerlinePoints=None, numberOfSides=30, numberOfSubdivisions=100):
+    # Bent tube that resembles a deformed long bone, its centerline is used as bone curve
+    if centerlinePoints is None:
+      centerlinePoints = np.array([[0,0,0],[40,0,0],[60,10,0],[80,25,0]])
+
+    points = vtk.vtkPoints()
+    polyLine = vtk.vtkPolyLine()
+    polyLine.GetPointIds().SetNumberOfIds(len(centerlinePoints))
+    for i in range(len(centerlinePoints)):
+      points.InsertNextPoint(centerlinePoints[i])
+      polyLine.GetPointIds().SetId(i,i)
+    cells = vtk.vtkCellArray()
+    cells.InsertNextCell(polyLine)
+    centerlinePolyData = vtk.vtkPolyData()
+    centerlinePolyData.SetPoints(points)
+    centerlinePolyData.SetLines(cells)
+
+    splineFilter = vtk.vtkSplineFilter()
+    splineFilter.SetInputData(centerlinePolyData)
+    splineFilter.SetNumberOfSubdivisions(numberOfSubdivisions)
+    tubeFilter = vtk.vtkTubeFilter()
+    tubeFilter.SetInputConnection(splineFilter.GetOutputPort())
+    tubeFilter.SetRadius(8)
+    tubeFilter.SetNumberOfSides(numberOfSides)
+    tubeFilter.CappingOn()
+    triangleFilter = vtk.vtkTriangleFilter()
+    triangleFilter.SetInputConnection(tubeFilter.GetOutputPort())
+    triangleFilter.Update()
+
+    boneModel = slicer.modules.models.logic().AddModel(triangleFilter.GetOutput())
+    boneModel.SetName("syntheticBone")
+
+    boneCurve = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsCurveNode", "boneCurve")
+    for point in centerlinePoints:
+      boneCurve.AddControlPoint(vtk.vtkVector3d(point))
+
+    return boneModel, boneCurve
+
+  def createParametricSyntheticBoneModelAndCurve(self, numberOfTriangles, bendAngle):
+    # 200mm long tube bent by bendAngle degrees at its middle. The tube has about numberOfTriangles
+    # triangles with roughly square cells
+    bendAngleRadians = vtk.vtkMath.RadiansFromDegrees(bendAngle)
+    bendDirection = np.array([np.cos(bendAngleRadians),np.sin(bendAngleRadians),0])
+    centerlinePoints = np.array([[0,0,0],[50,0,0],[100,0,0],[100,0,0]+50*bendDirection,[100,0,0]+100*bendDirection])
+    numberOfSides = max(8,int(round(np.sqrt(numberOfTriangles/8))))
+    numberOfSubdivisions = max(1,int(round(numberOfTriangles/(2*numberOfSides))))
+    return self.createSyntheticBoneModelAndCurve(centerlinePoints, numberOfSides, numberOfSubdivisions)
+
+  def createBoneCutPlanesAlongCurve(self, logic, boneCurve, numberOfPlanePairs, wedgeAngle=8, planesDistance=6):
+    # Plane pairs evenly spaced along the curve, the second plane of each pair is tilted to make a wedge
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    boneCutPlanesFolder = shNode.CreateFolderItem(logic.getParentFolderItemID(),"Bone Cut Planes")
+    curveLength = boneCurve.GetCurveLengthWorld()
+    wedgeAngleRadians = vtk.vtkMath.RadiansFromDegrees(wedgeAngle)
+    for j in range(numberOfPlanePairs):
+      pairCenterDistance = curveLength*(j+1)/(numberOfPlanePairs+1)
+      for k, distance in enumerate([pairCenterDistance-planesDistance/2, pairCenterDistance+planesDistance/2]):
+        curvePointIndex = boneCurve.GetCurvePointIndexAlongCurveWorld(0,distance)
+        curvePointToWorldMatrix = vtk.vtkMatrix4x4()
+        boneCurve.GetCurvePointToWorldTransformAtPointIndex(curvePointIndex,curvePointToWorldMatrix)
+        curvePointToWorldMatrix = slicer.util.arrayFromVTKMatrix(curvePointToWorldMatrix)
+        normal = curvePointToWorldMatrix[:3,2]
+        if k == 1:
+          normal = np.cos(wedgeAngleRadians)*normal + np.sin(wedgeAngleRadians)*curvePointToWorldMatrix[:3,1]
+        boneCutPlane = self.createPlane("boneCutPlane%d" % (2*j+k), curvePointToWorldMatrix[:3,3], normal)
+        shNode.SetItemParent(shNode.GetItemByDataNode(boneCutPlane), boneCutPlanesFolder)
+    return createListFromFolderID(boneCutPlanesFolder)
+
+  def runBenchmarkSuite(self, numbersOfTriangles, numbersOfPlanePairs, bendAngle=20, outputFilePath=None):
+    """ Times each stage of the logic on synthetic bones for every combination of mesh size and
+    number of plane pairs. Results are written as JSON and CSV (same path with .csv extension)
+    so they can be compared between versions. Returns the list of results.
+    """
+    import json, csv, platform
+
+    resultsList = []
+    for numberOfTriangles in numbersOfTriangles:
+      for numberOfPlanePairs in numbersOfPlanePairs:
+        self.setUp()
+        logic = self.createLogic()
+        parameterNode = logic.getParameterNode()
+        parameterNode.SetParameter("checkSecurityMarginOnMiterBoxCreation", "False")
+
+        boneModel, boneCurve = self.createParametricSyntheticBoneModelAndCurve(numberOfTriangles, bendAngle)
+        parameterNode.SetNodeReferenceID("boneModel", boneModel.GetID())
+        parameterNode.SetNodeReferenceID("boneCurve", boneCurve.GetID())
+        boneCutPlanesList = self.createBoneCutPlanesAlongCurve(logic, boneCurve, numberOfPlanePairs)
+
+        stagesTimes = {}
+        def timeStage(stageName, function, *args):
+          startTime = time.perf_counter()
+          result = function(*args)
+          stagesTimes[stageName] = time.perf_counter() - startTime
+          return result
+
+        timeStage("centroidPositioning", logic.automaticNormalAndOriginDefinitionOfPlanes, boneCutPlanesList)
+        timeStage("planeCuts", logic.createAndUpdateDynamicModelerNodes)
+        timeStage("correctionTransforms", logic.transformBonePiecesToCorrectedPosition)
+        shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+        cutBonePiecesList = createListFromFolderID(shNode.GetItemByName("Cut Bone Pieces"))
+        securityMargin = float(parameterNode.GetParameter("securityMarginOfBonePieces"))
+        timeStage("marginCheck", logic.getClearancesBetweenAdjacentBonePieces, cutBonePiecesList, securityMargin)
+        timeStage("miterBoxes", logic.createMiterBoxesFromBoneCutPlanes)
+
+        if hasattr(slicer.modules, "combinemodels"):
+          bounds = boneModel.GetPolyData().GetBounds()
+          surgicalGuideModel = self.createBoxModel(
+            [(bounds[0]+bounds[1])/2,(bounds[2]+bounds[3])/2,bounds[5]],
+            [bounds[1]-bounds[0],bounds[3]-bounds[2],6]
+          )
+          miterBoxesModelsList = createListFromFolderID(shNode.GetItemByName("miterBoxes Models"))
+          biggerMiterBoxesModelsList = createListFromFolderID(shNode.GetItemByName("biggerMiterBoxes Models"))
+          timeStage("booleans", logic.applyBooleanOperationsToSurgicalGuide, surgicalGuideModel, biggerMiterBoxesModelsList,
+            miterBoxesModelsList, parameterNode.GetParameter("useBatchedBooleanOperations") == "True")
+
+        result = {
+          "requestedNumberOfTriangles": numberOfTriangles,
+          "numberOfTriangles": boneModel.GetPolyData().GetNumberOfCells(),
+          "numberOfPlanePairs": numberOfPlanePairs,
+          "bendAngle": bendAngle
+        }
+        result.update(stagesTimes)
+        resultsList.append(result)
+        logging.info("Benchmark %s" % json.dumps(result))
+
+    if outputFilePath:
+      metadata = {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "slicerVersion": slicer.app.applicationVersion,
+        "platform": platform.platform(),
+        "numberOfProcessors": os.cpu_count()
+      }
+      with open(outputFilePath, "w") as outputFile:
+        json.dump({"metadata": metadata, "results": resultsList}, outputFile, indent=2)
+      fieldNames = []
+      for result in resultsList:
+        fieldNames += [fieldName for fieldName in result if fieldName not in fieldNames]
+      with open(os.path.splitext(outputFilePath)[0] + ".csv", "w", newline="") as outputFile:
+        writer = csv.DictWriter(outputFile, fieldnames=fieldNames)
+        writer.writeheader()
+        writer.writerows(resultsList)
+
+    return resultsList
+
+  def createPlane(self, name, origin, normal):
+    planeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsPlaneNode", name)
+    planeNode.SetOrigin(origin)
+    planeNode.SetNormal(normal)
+    return planeNode
+
 def createListFromFolderID(folderID):
   createdList = []
   shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
@@ -1484,3 +4612,268 @@ def createListFromFolderID(folderID):
   for i in range(myList.GetNumberOfIds()):
     createdList.append(shNode.GetItemDataNode(myList.GetId(i)))
   return createdList
+
+def getPerpendicularsOfVectors(vectors):
+  """
+  Vectorized version of vtkMath.Perpendiculars(vector, perpendicular1, perpendicular2, 0)
+  for an (n,3) array of vectors. Returns two (n,3) arrays.
+  """
+  vectors = np.asarray(vectors,dtype=float).reshape(-1,3)
+  squares = vectors**2
+  norms = np.sqrt(squares.sum(axis=1))
+
+  #Same choice of components than vtkMath to avoid divisions by zero
+  dx = np.where((squares[:,0] > squares[:,1]) & (squares[:,0] > squares[:,2]), 0, np.where(squares[:,1] > squares[:,2], 1, 2))
+  dy = (dx+1)%3
+  dz = (dx+2)%3
+  rows = np.arange(len(vectors))
+  a = vectors[rows,dx]/norms
+  b = vectors[rows,dy]/norms
+  c = vectors[rows,dz]/norms
+  tmp = np.sqrt(a*a + c*c)
+
+  perpendiculars1 = np.zeros_like(vectors)
+  perpendiculars2 = np.zeros_like(vectors)
+  perpendiculars1[rows,dx] = c/tmp
+  perpendiculars1[rows,dz] = -a/tmp
+  perpendiculars2[rows,dx] = -a*b/tmp
+  perpendiculars2[rows,dy] = tmp
+  perpendiculars2[rows,dz] = -b*c/tmp
+
+  return perpendiculars1, perpendiculars2
+
+def clipClosedSurfaceWithPlanes(polyData,planesOrigins,planesNormals):
+  """
+  Returns the closed surface of the part of polyData in the positive side of all the planes.
+  It is run on worker threads so it only reads polyData and creates its own filters.
+  """
+  planeCollection = vtk.vtkPlaneCollection()
+  for origin, normal in zip(planesOrigins,planesNormals):
+    plane = vtk.vtkPlane()
+    plane.SetOrigin(origin)
+    plane.SetNormal(normal)
+    planeCollection.AddItem(plane)
+
+  clipper = vtk.vtkClipClosedSurface()
+  clipper.SetInputData(polyData)
+  clipper.SetClippingPlanes(planeCollection)
+  clipper.SetGenerateFaces(True)
+  clipper.Update()
+
+  clippedPolyData = vtk.vtkPolyData()
+  clippedPolyData.ShallowCopy(clipper.GetOutput())
+  return clippedPolyData
+
+def decimatePolyData(polyData,targetReduction):
+  """
+  Returns a decimated copy of the triangles of polyData. It is run on a background thread
+  so it only reads polyData and creates its own filters.
+  """
+  triangleFilter = vtk.vtkTriangleFilter()
+  triangleFilter.SetInputData(polyData)
+
+  decimation = vtk.vtkQuadricDecimation()
+  decimation.SetInputConnection(triangleFilter.GetOutputPort())
+  decimation.SetTargetReduction(targetReduction)
+  decimation.VolumePreservationOn()
+  decimation.Update()
+
+  decimatedPolyData = vtk.vtkPolyData()
+  decimatedPolyData.ShallowCopy(decimation.GetOutput())
+  return decimatedPolyData
+
+def getClearanceBetweenPolyDatas(polyDataA,distanceFunctionA,polyDataB,distanceFunctionB,maximumDistance):
+  """
+  Returns the minimum distance between the vertices of each polydata and the surface of the other,
+  it is negative if they overlap. Only vertices inside the bounds of the other polydata expanded by
+  maximumDistance are evaluated, inf is returned if there are none.
+  """
+  from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+  clearance = np.inf
+  for points, otherBounds, otherDistanceFunction in [
+    (getPointsOfCellsOfPolyData(polyDataA),polyDataB.GetBounds(),distanceFunctionB),
+    (getPointsOfCellsOfPolyData(polyDataB),polyDataA.GetBounds(),distanceFunctionA)
+  ]:
+    boundsMin = np.array(otherBounds[0::2]) - maximumDistance
+    boundsMax = np.array(otherBounds[1::2]) + maximumDistance
+    candidatePoints = points[np.all((points >= boundsMin) & (points <= boundsMax),axis=1)]
+    if len(candidatePoints) == 0:
+      continue
+    distances = vtk.vtkDoubleArray()
+    otherDistanceFunction.FunctionValue(numpy_to_vtk(np.ascontiguousarray(candidatePoints,dtype=float),deep=1),distances)
+    clearance = min(clearance,np.min(vtk_to_numpy(distances)))
+  return clearance
+
+def getPointsOfCellsOfPolyData(polyData):
+  """
+  Returns the positions of the points used by the polygons of polyData. Bone segments cut with
+  shared points also hold the points of the other segments.
+  """
+  from vtk.util.numpy_support import vtk_to_numpy
+  points = vtk_to_numpy(polyData.GetPoints().GetData())
+  if polyData.GetPolys().GetNumberOfCells() == 0:
+    return points
+  usedPointIDs = np.unique(vtk_to_numpy(polyData.GetPolys().GetConnectivityArray()))
+  if len(usedPointIDs) == len(points):
+    return points
+  return points[usedPointIDs]
+
+def getCompactCopyOfPolyData(polyData):
+  """
+  Returns a copy of polyData without the points that are not used by its cells.
+  """
+  from vtk.util.numpy_support import vtk_to_numpy
+  if polyData.GetNumberOfCells() == polyData.GetPolys().GetNumberOfCells():
+    usedPoints = np.zeros(polyData.GetNumberOfPoints(),dtype=bool)
+    usedPoints[vtk_to_numpy(polyData.GetPolys().GetConnectivityArray())] = True
+    if np.all(usedPoints):
+      compactPolyData = vtk.vtkPolyData()
+      compactPolyData.DeepCopy(polyData)
+      return compactPolyData
+
+  cleanFilter = vtk.vtkCleanPolyData()
+  cleanFilter.SetInputData(polyData)
+  cleanFilter.PointMergingOff()
+  cleanFilter.Update()
+  compactPolyData = vtk.vtkPolyData()
+  compactPolyData.ShallowCopy(cleanFilter.GetOutput())
+  return compactPolyData
+
+def getTransformedCopiesOfPolyData(polyData,rotationMatrices,translations):
+  """
+  Returns one copy of polyData per rotation matrix and translation, p' = R p + t. Points and
+  normals of all the copies are transformed in one batch.
+  """
+  from vtk.util.numpy_support import vtk_to_numpy, numpy_to_vtk
+  points = vtk_to_numpy(polyData.GetPoints().GetData()).astype(float)
+  transformedPoints = np.einsum('nij,pj->npi',rotationMatrices,points) + np.asarray(translations,dtype=float)[:,np.newaxis,:]
+  normalsArray = polyData.GetPointData().GetNormals()
+  if normalsArray is not None:
+    transformedNormals = np.einsum('nij,pj->npi',rotationMatrices,vtk_to_numpy(normalsArray).astype(float))
+
+  transformedPolyDatas = []
+  for i in range(len(transformedPoints)):
+    transformedPolyData = vtk.vtkPolyData()
+    transformedPolyData.DeepCopy(polyData)
+    vtkPoints = vtk.vtkPoints()
+    vtkPoints.SetData(numpy_to_vtk(transformedPoints[i],deep=1))
+    transformedPolyData.SetPoints(vtkPoints)
+    if normalsArray is not None:
+      vtkNormals = numpy_to_vtk(transformedNormals[i],deep=1)
+      vtkNormals.SetName(normalsArray.GetName())
+      transformedPolyData.GetPointData().SetNormals(vtkNormals)
+    transformedPolyDatas.append(transformedPolyData)
+  return transformedPolyDatas
+
+def getPointsNormalsOfPolyData(polyData):
+  """
+  Returns the point normals of polyData, they are computed without splitting if it has none.
+  """
+  from vtk.util.numpy_support import vtk_to_numpy
+  normalsArray = polyData.GetPointData().GetNormals()
+  if normalsArray is None:
+    normalsFilter = vtk.vtkPolyDataNormals()
+    normalsFilter.SetInputData(polyData)
+    normalsFilter.SplittingOff()
+    normalsFilter.ComputePointNormalsOn()
+    normalsFilter.Update()
+    normalsArray = normalsFilter.GetOutput().GetPointData().GetNormals()
+  return np.array(vtk_to_numpy(normalsArray),dtype=float)
+
+def getAreaWeightedPointsNormalsOfPolyData(polyData):
+  """
+  Returns the point normals of polyData as the average of the normals of its triangles weighted by their area.
+  """
+  from vtk.util.numpy_support import vtk_to_numpy
+  triangleFilter = vtk.vtkTriangleFilter()
+  triangleFilter.SetInputData(polyData)
+  triangleFilter.PassVertsOff()
+  triangleFilter.PassLinesOff()
+  triangleFilter.Update()
+  trianglesPolyData = triangleFilter.GetOutput()
+
+  points = vtk_to_numpy(trianglesPolyData.GetPoints().GetData()).astype(float)
+  triangles = vtk_to_numpy(trianglesPolyData.GetPolys().GetConnectivityArray()).astype(np.int64).reshape(-1,3)
+  #The length of the cross product is twice the area of the triangle
+  trianglesNormals = np.cross(points[triangles[:,1]]-points[triangles[:,0]],points[triangles[:,2]]-points[triangles[:,0]])
+
+  pointsNormals = np.zeros_like(points)
+  for j in range(3):
+    np.add.at(pointsNormals,triangles[:,j],trianglesNormals)
+  norms = np.linalg.norm(pointsNormals,axis=1)
+  norms[norms == 0] = 1
+  return pointsNormals/norms[:,np.newaxis]
+
+def runPlanningCaseFromFile(caseFilePath):
+  """
+  Runs the planning case described by a JSON file with the keys "boneModel", "boneCurve", "boneCutPlanes"
+  (list of plane markups files), "outputDirectory" and optionally "parameters" (dictionary or JSON file),
+  "boneSurgicalGuideBase", "boneFiducialList" and "automaticPositioning". Relative paths are relative to
+  the case file.
+  """
+  import json
+  caseDirectory = os.path.dirname(os.path.abspath(caseFilePath))
+  def getCasePath(path):
+    return os.path.join(caseDirectory, path) if path else None
+
+  with open(caseFilePath) as caseFile:
+    case = json.load(caseFile)
+  parameters = case.get("parameters", {})
+  if isinstance(parameters, str):
+    with open(getCasePath(parameters)) as parametersFile:
+      parameters = json.load(parametersFile)
+  boneCutPlanesPaths = case["boneCutPlanes"]
+  if isinstance(boneCutPlanesPaths, str):
+    boneCutPlanesPaths = [boneCutPlanesPaths]
+
+  logic = DeformityCorrectionOsteotomyPlannerLogic(setupLayout=False)
+  try:
+    return logic.runPlanningCase(
+      getCasePath(case["boneModel"]),
+      getCasePath(case["boneCurve"]),
+      [getCasePath(path) for path in boneCutPlanesPaths],
+      parameters,
+      getCasePath(case["outputDirectory"]),
+      boneSurgicalGuideBasePath=getCasePath(case.get("boneSurgicalGuideBase")),
+      boneFiducialListPath=getCasePath(case.get("boneFiducialList")),
+      automaticPositioning=case.get("automaticPositioning", False)
+    )
+  finally:
+    logic.cleanup()
+
+def runPlanningCasesInParallel(caseFilesPaths,numberOfProcesses=0,slicerExecutablePath=None):
+  """
+  Runs each case file in its own Slicer process without main window, numberOfProcesses at a time
+  (0 uses one per processor). The output of each process is written to the case file path plus ".log".
+  Returns a list of dictionaries with the case file, the return code of its process and its log file.
+  """
+  import subprocess
+  if not slicerExecutablePath:
+    slicerExecutablePath = slicer.app.launcherExecutableFilePath or slicer.app.applicationFilePath()
+  if numberOfProcesses <= 0:
+    numberOfProcesses = os.cpu_count() or 1
+
+  def runCase(caseFilePath):
+    caseFilePath = os.path.abspath(caseFilePath)
+    pythonCode = (
+      "import slicer, traceback\n"
+      "import DeformityCorrectionOsteotomyPlanner\n"
+      "exitCode = 0\n"
+      "try:\n"
+      f"  DeformityCorrectionOsteotomyPlanner.runPlanningCaseFromFile({caseFilePath!r})\n"
+      "except Exception:\n"
+      "  traceback.print_exc()\n"
+      "  exitCode = 1\n"
+      "slicer.util.exit(exitCode)\n"
+    )
+    logFilePath = caseFilePath + ".log"
+    with open(logFilePath, "w") as logFile:
+      completedProcess = subprocess.run(
+        [slicerExecutablePath, "--no-splash", "--no-main-window", "--python-code", pythonCode],
+        stdout=logFile, stderr=subprocess.STDOUT
+      )
+    return {"case": caseFilePath, "returnCode": completedProcess.returncode, "log": logFilePath}
+
+  #Each case runs in its own process, the threads only wait for them
+  with concurrent.futures.ThreadPoolExecutor(max_workers=numberOfProcesses) as executor:
+    return list(executor.map(runCase, caseFilesPaths))